@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db import connection
+from cache import cached
+
+# Series temporales del Panel. Se leen solo los rollups diarios (daily_requirements,
+# daily_contacts, mantenidos por triggers), nunca las tablas crudas: el costo depende
+# de la cantidad de días del rango, no de la cantidad de publicaciones.
+FREQS = {"D": "D", "W": "W-MON", "M": "MS"}
+REQ_GROUPS = ("chamber_id", "category", "req_type")
+TYPE_LABELS = {"offer": "Ofrezco", "need": "Necesito"}
+
+
+def _bounds(start, end):
+    end = end or date.today()
+    start = start or end - timedelta(days=89)
+    return pd.Timestamp(start), pd.Timestamp(end)
+
+
+def _fetch(sql, params, columns):
+    with connection() as c:
+        rows = c.execute(sql, params).fetchall()
+    return pd.DataFrame([tuple(r) for r in rows], columns=columns)
+
+
+def _where(start, end, chamber_id):
+    where = "day BETWEEN ? AND ?"
+    params = [start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")]
+    if chamber_id:
+        where += " AND chamber_id = ?"
+        params.append(chamber_id)
+    return where, params
+
+
+def _calendar(df, start, end, freq):
+    # Completa los días sin movimiento y reagrupa por semana/mes
+    df.index = pd.to_datetime(df.index)
+    df = df.reindex(pd.date_range(start, end, freq="D"), fill_value=0)
+    if freq != "D":
+        df = df.resample(FREQS[freq]).sum()
+    df.index.name = "fecha"
+    return df
+
+
+@cached("metrics", ttl=30)
+def requirement_series(start=None, end=None, freq="D", by=None, chamber_id=None):
+    # Publicaciones por período; by = chamber_id | category | req_type abre una columna por grupo
+    if freq not in FREQS:
+        raise ValueError(f"Frecuencia inválida: {freq}")
+    if by is not None and by not in REQ_GROUPS:
+        raise ValueError(f"Agrupación inválida: {by}")
+    start, end = _bounds(start, end)
+    where, params = _where(start, end, chamber_id)
+    cols = ["day", *REQ_GROUPS, "n"]
+    df = _fetch(f"SELECT {', '.join(cols)} FROM daily_requirements WHERE {where} AND n != 0", params, cols)
+    if by is None:
+        table = df.groupby("day")["n"].sum().to_frame("publicaciones")
+    else:
+        table = df.pivot_table(index="day", columns=by, values="n", aggfunc="sum", fill_value=0)
+        table.columns = [str(c) if c != "" else "(sin dato)" for c in table.columns]
+    return _calendar(table.astype(np.int64), start, end, freq)
+
+
+@cached("metrics", ttl=30)
+def contact_series(start=None, end=None, freq="D", chamber_id=None):
+    # Solicitudes creadas y respondidas por período, tasa de aceptación y horas promedio de respuesta
+    if freq not in FREQS:
+        raise ValueError(f"Frecuencia inválida: {freq}")
+    start, end = _bounds(start, end)
+    where, params = _where(start, end, chamber_id)
+    cols = ["day", "created", "accepted", "declined", "responded", "response_seconds"]
+    df = _fetch(f"SELECT {', '.join(cols)} FROM daily_contacts WHERE {where}", params, cols)
+    dtypes = {c: np.int64 for c in cols[1:5]} | {"response_seconds": np.float64}
+    table = _calendar(df.groupby("day")[cols[1:]].sum().astype(dtypes), start, end, freq)
+    responded = table["responded"].to_numpy(dtype=np.float64)
+    table["tasa_aceptacion"] = np.where(responded > 0, table["accepted"].to_numpy() / np.maximum(responded, 1), np.nan)
+    table["horas_respuesta"] = np.where(responded > 0, table["response_seconds"].to_numpy() / np.maximum(responded, 1) / 3600, np.nan)
+    return table.drop(columns="response_seconds")
+
+
+def period_summary(start=None, end=None, chamber_id=None):
+    # Totales del rango contra el período anterior de igual largo (para los deltas del Panel)
+    start, end = _bounds(start, end)
+    span = end - start + pd.Timedelta(days=1)
+    out = {}
+    for key, (s, e) in {"actual": (start, end), "anterior": (start - span, start - pd.Timedelta(days=1))}.items():
+        req = requirement_series(s.date(), e.date(), "D", None, chamber_id)
+        con = contact_series(s.date(), e.date(), "D", chamber_id)
+        responded = int(con["responded"].sum())
+        out[key] = {
+            "publicaciones": int(req["publicaciones"].sum()),
+            "contactos": int(con["created"].sum()),
+            "aceptacion": float(con["accepted"].sum() / responded) if responded else None,
+            "horas_respuesta": float(np.nansum(con["horas_respuesta"] * con["responded"]) / responded) if responded else None,
+        }
+    return out
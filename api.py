@@ -0,0 +1,269 @@
+import argparse
+import base64
+import hashlib
+import json
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+
+import auth
+import instrumentation
+import notifications
+import sessions
+import services as svc
+from db import init_db
+
+# API JSON para integraciones (sitios de cámaras, conectores ERP). Misma lógica que app.py:
+# los endpoints son funciones sync que FastAPI corre en su pool de hilos, cada una toma una
+# conexión del pool de db, y las lecturas pasan por la caché de services. Autenticación con
+# los mismos tokens de sessions.py en "Authorization: Bearer <token>".
+CONTACT_FIELDS = ("email", "phone")
+
+
+@asynccontextmanager
+async def lifespan(_):
+    init_db()
+    notifications.start()
+    yield
+
+
+app = FastAPI(title="CPF API", version="1", lifespan=lifespan)
+
+
+class TokenIn(BaseModel):
+    email: str
+    password: str
+
+
+class RequirementIn(BaseModel):
+    req_type: Literal["offer", "need"]
+    title: str = Field(min_length=1, max_length=200)
+    description: str = Field(min_length=1)
+    tags: str = ""
+    category: str = ""
+    location: str = ""
+    urgency: str = ""
+    chamber_id: Optional[int] = None
+
+
+class ContactIn(BaseModel):
+    requirement_id: int
+
+
+class DecisionIn(BaseModel):
+    decision: Literal["accepted", "declined"]
+
+
+def current_user(authorization: Optional[str] = Header(None)):
+    token = authorization[7:] if authorization and authorization.lower().startswith("bearer ") else None
+    u = sessions.resolve(token)
+    if u is None:
+        raise HTTPException(401, "Token inválido o vencido", headers={"WWW-Authenticate": "Bearer"})
+    return u
+
+
+def cached_json(request, payload, status_code=200):
+    # ETag sobre el cuerpo serializado: si el cliente ya lo tiene, 304 sin cuerpo
+    body = json.dumps(payload, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def requirement_out(row, viewer, contact=None):
+    # Email/teléfono del publicante solo para el dueño o con una solicitud aceptada (igual que app.py);
+    # "contact" lleva el estado de contacto del usuario (services.contact_status)
+    r = dict(row)
+    if contact is None:
+        contact = svc.contact_status(viewer["id"], ((r["id"], r["user_id"]),))[r["id"]]
+    if contact not in ("owner", "granted"):
+        for k in CONTACT_FIELDS:
+            r.pop(k, None)
+    r.pop("sort_key", None)
+    r["contact"] = contact
+    return r
+
+
+def requirements_out(rows, viewer):
+    # Estado de contacto de toda la página en una consulta
+    contact = svc.contact_status(viewer["id"], tuple((r["id"], r["user_id"]) for r in rows))
+    return [requirement_out(r, viewer, contact[r["id"]]) for r in rows]
+
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(value.encode("ascii")))
+    except ValueError:
+        raise HTTPException(400, "Cursor inválido")
+    if not isinstance(cursor, list) or len(cursor) != 2:
+        raise HTTPException(400, "Cursor inválido")
+    return tuple(cursor)
+
+
+def requirement_or_404(req_id):
+    row = svc.get_requirement(req_id)
+    if row is None:
+        raise HTTPException(404, "Requerimiento inexistente")
+    return row
+
+
+@app.get("/healthz")
+def healthz():
+    return {"ok": True}
+
+
+@app.get("/metrics")
+def metrics(request: Request, format: Literal["prometheus", "json"] = "prometheus",
+            authorization: Optional[str] = Header(None)):
+    # Latencias por operación de este proceso (instrumentation.py). Sin token solo desde la misma
+    # máquina (scraper local de Prometheus); desde afuera, con token de admin.
+    if request.client is None or request.client.host not in ("127.0.0.1", "::1"):
+        if current_user(authorization)["role"] != "admin":
+            raise HTTPException(403, "Solo administradores")
+    if format == "json":
+        return Response(instrumentation.to_json(), media_type="application/json")
+    return Response(instrumentation.to_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/auth/token")
+def create_token(body: TokenIn):
+    try:
+        u = auth.authenticate(body.email, body.password)
+    except auth.HashingBusy as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "2"})
+    if u is None:
+        raise HTTPException(401, "Credenciales inválidas o usuario inactivo")
+    return {"token": sessions.create_session(u["id"]), "expires_in": int(sessions.SESSION_TTL_HOURS * 3600)}
+
+
+@app.delete("/auth/token", status_code=204)
+def delete_token(authorization: Optional[str] = Header(None), user=Depends(current_user)):
+    sessions.revoke(authorization[7:])
+
+
+@app.get("/me")
+def me(request: Request, user=Depends(current_user)):
+    return cached_json(request, {k: user[k] for k in user.keys() if k != "password_hash"})
+
+
+@app.get("/chambers")
+def chambers(request: Request, user=Depends(current_user)):
+    return cached_json(request, [dict(c) for c in svc.list_chambers()])
+
+
+@app.get("/requirements")
+def list_requirements(request: Request, q: str = "", status: Literal["open", "closed"] = "open",
+                      req_type: Optional[Literal["offer", "need"]] = None, chamber_id: Optional[int] = None,
+                      category: Optional[str] = None, location: Optional[str] = None,
+                      after: Optional[str] = None, limit: int = 50, user=Depends(current_user)):
+    filters = {"q": q, "status": status}
+    for key, value in (("req_type", req_type), ("chamber_id", chamber_id), ("category", category), ("location", location)):
+        if value:
+            filters[key] = value
+    rows, next_cursor = svc.list_requirements_page(filters, after=decode_cursor(after), limit=max(1, min(limit, 200)))
+    return cached_json(request, {
+        "items": requirements_out(rows, user),
+        "next": encode_cursor(next_cursor),
+    })
+
+
+@app.post("/requirements", status_code=201)
+def create_requirement(body: RequirementIn, user=Depends(current_user)):
+    chamber_id = body.chamber_id if body.chamber_id is not None else user["chamber_id"]
+    req_id = svc.create_requirement(user["id"], user["id"], chamber_id, body.req_type, body.title, body.description,
+                                    body.tags, body.category, body.location, body.urgency)
+    return {"id": req_id}
+
+
+@app.get("/requirements/{req_id}")
+def get_requirement(req_id: int, request: Request, user=Depends(current_user)):
+    return cached_json(request, requirement_out(requirement_or_404(req_id), user))
+
+
+@app.post("/requirements/{req_id}/close", status_code=204)
+def close_requirement(req_id: int, user=Depends(current_user)):
+    row = requirement_or_404(req_id)
+    if row["user_id"] != user["id"] and user["role"] != "admin":
+        raise HTTPException(403, "Solo el autor puede cerrar el requerimiento")
+    svc.close_requirement(user["id"], req_id)
+
+
+@app.get("/requirements/{req_id}/matches")
+def matches(req_id: int, request: Request, top_k: int = 5, user=Depends(current_user)):
+    row = requirement_or_404(req_id)
+    hits = svc.explain_matches(row, top_k=max(1, min(top_k, 50)))
+    out = requirements_out([r for r, _, _ in hits], user)
+    return cached_json(request, [{"score": round(float(score), 4), "explanation": why, "requirement": item}
+                                 for item, (_, score, why) in zip(out, hits)])
+
+
+@app.get("/contacts/inbox")
+def inbox(request: Request, user=Depends(current_user)):
+    return cached_json(request, [dict(r) for r in svc.list_inbox(user["id"])])
+
+
+@app.get("/contacts/sent")
+def sent(request: Request, user=Depends(current_user)):
+    return cached_json(request, [dict(r) for r in svc.list_sent(user["id"])])
+
+
+@app.post("/contacts", status_code=201)
+def create_contact(body: ContactIn, user=Depends(current_user)):
+    row = requirement_or_404(body.requirement_id)
+    if row["user_id"] == user["id"]:
+        raise HTTPException(400, "No podés solicitar contacto sobre tu propio requerimiento")
+    ok, msg = svc.create_contact_request(user["id"], user["id"], row["user_id"], row["id"])
+    if not ok:
+        raise HTTPException(409, msg)
+    return {"detail": msg}
+
+
+@app.post("/contacts/{request_id}/respond", status_code=204)
+def respond_contact(request_id: int, body: DecisionIn, user=Depends(current_user)):
+    pending = {r["id"]: r for r in svc.list_inbox(user["id"]) if r["status"] == "pending"}
+    if request_id not in pending:
+        raise HTTPException(404, "Solicitud inexistente o ya respondida")
+    svc.respond_contact_request(user["id"], request_id, body.decision)
+
+
+@app.get("/notifications/unread")
+def unread(request: Request, user=Depends(current_user)):
+    # Pensado para sondeo frecuente: una fila por clave primaria y 304 si no cambió
+    return cached_json(request, {"unread": notifications.unread_count(user["id"])})
+
+
+@app.get("/notifications")
+def list_notifications(request: Request, limit: int = 50, user=Depends(current_user)):
+    return cached_json(request, [dict(r) for r in notifications.list_notifications(user["id"], max(1, min(limit, 200)))])
+
+
+@app.post("/notifications/read", status_code=204)
+def read_notifications(user=Depends(current_user)):
+    notifications.mark_read(user["id"])
+
+
+def main(argv=None):
+    import uvicorn
+    ap = argparse.ArgumentParser(description="Servicio JSON de CPF (FastAPI)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=1, help="Procesos (cada uno con su pool y su caché)")
+    args = ap.parse_args(argv)
+    uvicorn.run("api:app" if args.workers > 1 else app, host=args.host, port=args.port,
+                workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,112 @@
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+
 import streamlit as st
-import pandas as pd
+import streamlit.components.v1 as components
 
-from db import init_db
-from auth import any_admin_exists, create_user, authenticate, get_user_by_email
+from db import pool_metrics, audit_writer
+from auth import any_admin_exists, create_user, authenticate, get_user_by_email, HashingBusy, hasher
 import services as svc
-from matching import top_matches
+import sessions
+import cache
+import instrumentation
+import notifications
+import startup
 
 st.set_page_config(page_title="CPF – Requerimientos", layout="wide")
 
-init_db()
+instrumentation.begin_run()
+# Migraciones y servicios de fondo una vez por proceso; pandas, analytics, bulk y el índice de
+# matching se precargan en segundo plano y se importan acá recién pasado el ingreso
+startup.init_once()
 
-if "user" not in st.session_state:
-    st.session_state.user = None
+# Sesión: el token firmado vive en una cookie (sobrevive reconexiones y recargas) y en session_state,
+# nunca en la URL: ahí quedaría en el historial, en enlaces compartidos, en el Referer y en logs de
+# proxies. Se revalida en cada rerun contra el store del servidor; rol, cámara y estado salen siempre
+# del registro vigente.
+if "token" not in st.session_state:
+    st.session_state.token = st.context.cookies.get(sessions.COOKIE)
+# Enlaces de versiones anteriores con ?s=<token>: se quita de la URL sin usarlo
+if "s" in st.query_params:
+    st.query_params.pop("s")
+current = sessions.resolve(st.session_state.token)
+if current is None and st.session_state.token:
+    st.session_state.token = None
+    st.session_state.cookie = ""
+st.session_state.user = {k: current[k] for k in current.keys() if k != "password_hash"} if current else None
+
+def write_cookie(token):
+    # Streamlit no fija cookies desde el servidor: las escribe un iframe de la misma origin
+    # ("" la borra). SameSite=Strict, y Secure cuando la app se sirve por https.
+    max_age = int(sessions.SESSION_TTL_HOURS * 3600) if token else 0
+    components.html(f"""<script>
+const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+window.parent.document.cookie = {json.dumps(sessions.COOKIE + "=" + token)} + "; path=/; max-age={max_age}; SameSite=Strict" + secure;
+</script>""", height=0)
+
+# Cookie pendiente de un ingreso/egreso: se escribe en la ejecución siguiente, que no se interrumpe con st.rerun()
+if "cookie" in st.session_state:
+    write_cookie(st.session_state.pop("cookie"))
+
+def login(u):
+    token = sessions.create_session(u["id"])
+    st.session_state.token = token
+    st.session_state.cookie = token
 
 def logout():
+    sessions.revoke(st.session_state.token)
+    st.session_state.token = None
     st.session_state.user = None
+    st.session_state.cookie = ""
     st.rerun()
 
+def page_done():
+    # Cierra la medición de esta ejecución (también en las pantallas que terminan con st.stop())
+    elapsed, breakdown = instrumentation.end_run("app.rerun")
+    startup.mark_ready(elapsed)
+    return elapsed, breakdown
+
 def chamber_label(c):
     parts = [c["name"]]
     if c["province"] or c["city"]:
         parts.append(" - ".join([p for p in [c["city"], c["province"]] if p]))
     return " ".join(parts)
 
+def bulk_panel(key, kinds, chamber_id=None):
+    # Importación masiva con reporte por fila y exportación en streaming a un archivo temporal
+    labels = {"chambers":"Cámaras","users":"Usuarios","requirements":"Requerimientos","audit":"Auditoría"}
+    kind = st.selectbox("Importar", kinds, format_func=labels.get, key=f"{key}_kind")
+    up = st.file_uploader("Archivo CSV, JSONL o Excel", type=["csv","jsonl","ndjson","xlsx"], key=f"{key}_file")
+    if up is not None and st.button("Importar archivo", key=f"{key}_go"):
+        kwargs = {"fmt": bulk.detect_format(up.name)}
+        if kind != "chambers":
+            kwargs["chamber_id"] = chamber_id
+        try:
+            with st.spinner("Importando..."):
+                rep = bulk.IMPORTERS[kind](up, user["id"], **kwargs)
+        except RuntimeError as e:
+            st.error(str(e))
+        else:
+            st.success(f"{rep['inserted']} filas importadas, {rep['failed']} con error ({rep['seconds']:.1f}s).")
+            if rep["errors"]:
+                st.dataframe(pd.DataFrame(rep["errors"], columns=["línea","error"]), use_container_width=True, hide_index=True)
+    exports = ["requirements"] if chamber_id else ["requirements", "audit"]
+    what = st.selectbox("Exportar", exports, format_func=labels.get, key=f"{key}_export")
+    if st.button("Preparar exportación", key=f"{key}_prep"):
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8", newline="")
+        with tmp:
+            if what == "audit":
+                bulk.export_audit(tmp)
+            else:
+                bulk.export_requirements(tmp, chamber_id=chamber_id)
+        st.session_state[f"{key}_path"] = (what, tmp.name)
+    prepared = st.session_state.get(f"{key}_path")
+    if prepared and os.path.exists(prepared[1]):
+        with open(prepared[1], "rb") as fh:
+            st.download_button("Descargar CSV", fh, file_name=f"cpf_{prepared[0]}.csv", mime="text/csv", key=f"{key}_dl")
+
 st.title("CPF – Sistema de Requerimientos (sin precios)")
 st.caption("Prototipo: publicar OFERTAS/NECESIDADES, navegar, buscar y solicitar contacto. Negociación y precio: fuera del sistema.")
 
@@ -46,6 +130,7 @@ if not any_admin_exists():
                 st.rerun()
             except Exception as e:
                 st.error(f"No se pudo crear Admin: {e}")
+    page_done()
     st.stop()
 
 # Login / Register
@@ -58,11 +143,15 @@ if st.session_state.user is None:
             password = st.text_input("Contraseña", type="password", key="login_pass")
             ok = st.form_submit_button("Ingresar")
         if ok:
-            u = authenticate(email, password)
+            try:
+                u = authenticate(email, password)
+            except HashingBusy as e:
+                st.warning(str(e))
+                st.stop()
             if u is None:
                 st.error("Credenciales inválidas o usuario inactivo.")
             else:
-                st.session_state.user = dict(u)
+                login(u)
                 st.success("Ingreso correcto.")
                 st.rerun()
     with col2:
@@ -90,8 +179,13 @@ if st.session_state.user is None:
                     st.success("Cuenta creada. Ahora iniciá sesión.")
                 except Exception as e:
                     st.error(f"No se pudo registrar: {e}")
+    page_done()
     st.stop()
 
+import pandas as pd
+import analytics
+import bulk
+
 user = st.session_state.user
 role = user["role"]
 
@@ -102,9 +196,27 @@ st.sidebar.write(f"**Rol:** {role}")
 if st.sidebar.button("Cerrar sesión"):
     logout()
 
+
+# Novedades: el fragmento sondea solo el contador de no leídas (una fila por clave primaria); si subió,
+# descarta la caché de contactos y rerenderiza la app para que la Bandeja muestre lo nuevo
+@st.fragment(run_every=notifications.POLL_SECONDS)
+def unread_badge():
+    n = notifications.unread_count(user["id"])
+    seen = st.session_state.get("unread_seen")
+    st.session_state.unread_seen = n
+    if seen is not None and n > seen:
+        cache.invalidate("contacts")
+        st.rerun()
+    st.write(f"**Notificaciones sin leer:** {n}")
+
+
+with st.sidebar:
+    unread_badge()
+
 tabs = ["Navegar", "Publicar", "Bandeja", "Panel"]
 if role == "admin":
     tabs.append("Administración")
+    tabs.append("Rendimiento")
 if role == "chamber_admin":
     tabs.append("Gestión Cámara")
 
@@ -135,12 +247,25 @@ with t[0]:
     if chamber_map[chamber_pick] is not None:
         f["chamber_id"] = chamber_map[chamber_pick]
 
-    rows = svc.list_requirements(f)
+    # Paginación keyset: pila de cursores en la sesión, se reinicia al cambiar filtros
+    page_size = st.session_state.get("page_size", 50)
+    if st.session_state.get("nav_filters") != f:
+        st.session_state.nav_filters = dict(f)
+        st.session_state.nav_cursors = [None]
+    cursors = st.session_state.nav_cursors
+    rows, next_cursor = svc.list_requirements_page(f, after=cursors[-1], limit=page_size)
     if not rows:
         st.info("No hay requerimientos con esos filtros.")
     else:
         df = pd.DataFrame([dict(r) for r in rows])
-        show_cols = ["id","req_type","title","company","chamber_name","location","category","urgency","status","created_at"]
+        counts = svc.match_counts(df["id"].tolist())
+        df["matches"] = df["id"].map(lambda i: counts.get(i, 0))
+        contact = svc.contact_status(user["id"], tuple(zip(df["id"].tolist(), df["user_id"].tolist())))
+        labels = {"owner": "propio", "granted": "habilitado", "pending": "pendiente", "none": "-"}
+        df["contact"] = df["id"].map(lambda i: labels[contact[i]])
+        show_cols = ["id","req_type","title","company","chamber_name","location","category","urgency","matches","contact","status","created_at"]
+        if "snippet" in df.columns:
+            show_cols.insert(3, "snippet")
         df = df[show_cols].rename(columns={
             "req_type":"tipo",
             "title":"título",
@@ -149,17 +274,29 @@ with t[0]:
             "location":"ubicación",
             "category":"categoría",
             "urgency":"urgencia",
+            "snippet":"coincidencia",
+            "matches":"sugerencias",
+            "contact":"contacto",
             "created_at":"creado",
         })
         st.dataframe(df, use_container_width=True, hide_index=True)
 
+        colp1, colp2, colp3 = st.columns([1,1,2])
+        with colp1:
+            if st.button("← Anterior", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with colp2:
+            if st.button("Siguiente →", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        with colp3:
+            st.selectbox("Filas por página", [25, 50, 100, 200], index=1, key="page_size")
+        st.caption(f"Página {len(cursors)}")
+
         st.divider()
-        pick = st.number_input("Ver detalle por ID", min_value=int(df["id"].min()), max_value=int(df["id"].max()), step=1)
-        chosen = None
-        for r in rows:
-            if r["id"] == pick:
-                chosen = r
-                break
+        pick = st.number_input("Ver detalle por ID", min_value=1, value=int(df["id"].iloc[0]), step=1)
+        chosen = svc.get_requirement(int(pick))
         if chosen:
             st.markdown(f"### {chosen['title']}")
             st.write(f"**Tipo:** {'OFERTA' if chosen['req_type']=='offer' else 'NECESIDAD'}")
@@ -169,19 +306,19 @@ with t[0]:
             st.write(f"**Estado:** {chosen['status']} | **Creado:** {chosen['created_at']}")
             st.write("**Descripción:**")
             st.write(chosen["description"])
-            if chosen.get("tags"):
+            if chosen["tags"]:
                 st.write(f"**Tags:** {chosen['tags']}")
 
             # Matching inteligente: buscar del tipo opuesto
-            opposite = "need" if chosen["req_type"]=="offer" else "offer"
-            candidates = [r for r in svc.list_requirements({"status":"open","req_type":opposite}) if r["id"] != chosen["id"]]
-            matches = top_matches(chosen, candidates, top_k=5)
+            matches = svc.explain_matches(chosen, top_k=5)
             st.subheader("Sugerencias (matching inteligente)")
             if not matches:
                 st.info("Sin sugerencias por el momento.")
             else:
-                for mr, score in matches:
+                for mr, score, why in matches:
                     st.write(f"- **{mr['title']}** ({'NECESIDAD' if mr['req_type']=='need' else 'OFERTA'}) – {mr['company']} | score={score:.2f}")
+                    if why["reasons"]:
+                        st.caption(" · ".join(why["reasons"]))
 
             # Contact workflow
             st.subheader("Contacto (se habilita con aceptación)")
@@ -235,6 +372,17 @@ with t[1]:
 
 # Bandeja
 with t[2]:
+    st.subheader("Notificaciones")
+    notes = notifications.list_notifications(user["id"], limit=20)
+    if not notes:
+        st.info("Sin notificaciones.")
+    else:
+        for n in notes:
+            st.write(f"{'' if n['read_at'] else '**Nueva** – '}{n['message']} ({n['created_at']})")
+        if st.button("Marcar como leídas", disabled=all(n["read_at"] for n in notes)):
+            notifications.mark_read(user["id"])
+            st.rerun()
+
     st.subheader("Bandeja de solicitudes de contacto")
     colA, colB = st.columns(2)
     with colA:
@@ -269,7 +417,10 @@ with t[2]:
 # Panel
 with t[3]:
     st.subheader("Panel de control")
-    m = svc.admin_metrics()
+    scope_chamber = user.get("chamber_id") if role == "chamber_admin" else None
+    if scope_chamber:
+        st.caption("Métricas de tu cámara.")
+    m = svc.admin_metrics(chamber_id=scope_chamber)
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Usuarios", m["users_total"])
     col2.metric("Requerimientos", m["req_total"])
@@ -281,6 +432,55 @@ with t[3]:
     if not df.empty:
         st.dataframe(df.rename(columns={"chamber":"cámara","n":"cantidad"}), use_container_width=True, hide_index=True)
 
+    st.markdown("### Evolución")
+    today = date.today()
+    c1, c2, c3 = st.columns([2, 1, 1])
+    span = c1.date_input("Rango", value=(today - timedelta(days=89), today), max_value=today)
+    freq = c2.selectbox("Agrupar", ["D", "W", "M"], index=1, format_func={"D":"Día","W":"Semana","M":"Mes"}.get)
+    by = c3.selectbox("Abrir por", [None, "req_type", "category", "chamber_id"],
+                      format_func={None:"Total","req_type":"Tipo","category":"Categoría","chamber_id":"Cámara"}.get)
+    if isinstance(span, tuple) and len(span) == 2:
+        start, end = span
+        summary = analytics.period_summary(start, end, chamber_id=scope_chamber)
+        cur, prev = summary["actual"], summary["anterior"]
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Publicaciones", cur["publicaciones"], cur["publicaciones"] - prev["publicaciones"])
+        k2.metric("Solicitudes de contacto", cur["contactos"], cur["contactos"] - prev["contactos"])
+        k3.metric("Aceptación", f"{cur['aceptacion']:.0%}" if cur["aceptacion"] is not None else "—")
+        k4.metric("Horas de respuesta", f"{cur['horas_respuesta']:.1f}" if cur["horas_respuesta"] is not None else "—")
+
+        series = analytics.requirement_series(start, end, freq, by, scope_chamber)
+        if by == "req_type":
+            series = series.rename(columns=analytics.TYPE_LABELS)
+        elif by == "chamber_id":
+            names = {str(ch["id"]): ch["name"] for ch in svc.list_chambers()}
+            series = series.rename(columns=lambda cid: names.get(cid, "(sin cámara)"))
+        st.bar_chart(series)
+        contacts = analytics.contact_series(start, end, freq, scope_chamber)
+        st.line_chart(contacts[["created", "accepted", "declined"]].rename(
+            columns={"created":"creadas","accepted":"aceptadas","declined":"rechazadas"}))
+        st.line_chart(contacts[["horas_respuesta"]].rename(columns={"horas_respuesta":"horas promedio de respuesta"}))
+
+    if role == "admin":
+        with st.expander("Consistencia de métricas"):
+            if st.button("Verificar contadores"):
+                drift = svc.check_metrics()
+                if drift:
+                    st.warning(f"{len(drift)} contadores desalineados.")
+                    st.json({f"{k[0]}:{k[1]}": v for k, v in drift.items()})
+                else:
+                    st.success("Contadores consistentes.")
+            if st.button("Reconstruir contadores"):
+                svc.check_metrics(repair=True)
+                st.success("Contadores reconstruidos.")
+        with st.expander("Caché de consultas"):
+            cdf = pd.DataFrame.from_dict(cache.stats(), orient="index")
+            if not cdf.empty:
+                st.dataframe(cdf[["hits","misses","hit_ratio","entries","invalidations","evictions","ttl_seconds"]], use_container_width=True)
+        with st.expander("Pool de conexiones y auditoría"):
+            st.json({"pool": pool_metrics(), "audit": audit_writer.stats, "bcrypt": hasher.stats,
+                     "outbox": notifications.dispatcher.stats})
+
 # Administración
 if "Administración" in tabs:
     with t[tabs.index("Administración")]:
@@ -308,16 +508,7 @@ if "Administración" in tabs:
             st.divider()
             st.markdown("### Usuarios")
             # Simple user list
-            from db import conn
-            c = conn()
-            users = c.execute("""
-                SELECT u.*, COALESCE(ch.name,'(Sin cámara)') as chamber_name
-                FROM users u
-                LEFT JOIN chambers ch ON ch.id = u.chamber_id
-                ORDER BY u.created_at DESC
-            """).fetchall()
-            c.close()
-            udf = pd.DataFrame([dict(u) for u in users])
+            udf = svc.users_frame()
             st.dataframe(udf[["id","email","name","company","role","is_active","chamber_name","created_at"]], use_container_width=True, hide_index=True)
 
             st.markdown("#### Cambiar rol / cámara / estado")
@@ -342,6 +533,44 @@ if "Administración" in tabs:
                 st.success("Actualizado.")
                 st.rerun()
 
+            st.divider()
+            st.markdown("### Importación y exportación masiva")
+            bulk_panel("bulk_admin", ["chambers", "users", "requirements"])
+
+# Rendimiento
+if "Rendimiento" in tabs:
+    with t[tabs.index("Rendimiento")]:
+        st.subheader("Rendimiento (solo Admin)")
+        st.caption(f"Latencias por operación sobre las últimas {instrumentation.SAMPLES} llamadas de este proceso. "
+                   f"Consultas lentas: más de {instrumentation.SLOW_QUERY_MS:.0f} ms.")
+        ops = instrumentation.snapshot()
+        op_kinds = sorted({e["kind"] for e in ops})
+        op_kind = st.columns([1, 3])[0].selectbox("Tipo", ["(Todas)"] + op_kinds)
+        if op_kind != "(Todas)":
+            ops = [e for e in ops if e["kind"] == op_kind]
+        if ops:
+            pdf = pd.DataFrame(ops)[["op","count","errors","rows","p50_ms","p95_ms","p99_ms","max_ms","total_ms"]]
+            st.dataframe(pdf.rename(columns={"op":"operación","count":"llamadas","errors":"errores","rows":"filas"}),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.info("Todavía no hay mediciones.")
+        st.markdown("### Consultas lentas")
+        slow = instrumentation.slow_queries()
+        if not slow:
+            st.write("Sin consultas lentas.")
+        for q in reversed(slow):
+            with st.expander(f"{q['at']} – {q['ms']} ms – {q['sql'][:100]}"):
+                st.code(q["sql"], language="sql")
+                st.code("\n".join(q["plan"] or ["(sin plan)"]))
+        d1, d2, d3 = st.columns(3)
+        d1.download_button("Métricas (JSON)", instrumentation.to_json(), "cpf-metricas.json", "application/json")
+        d2.download_button("Métricas (Prometheus)", instrumentation.to_prometheus(), "cpf-metricas.prom", "text/plain")
+        if d3.button("Reiniciar métricas"):
+            instrumentation.reset()
+            st.rerun()
+        if instrumentation.METRICS_PORT:
+            st.caption(f"Exportador local: http://127.0.0.1:{instrumentation.METRICS_PORT}/metrics (y /metrics.json).")
+
 # Gestión Cámara
 if "Gestión Cámara" in tabs:
     with t[tabs.index("Gestión Cámara")]:
@@ -354,22 +583,21 @@ if "Gestión Cámara" in tabs:
             if not my_ch:
                 st.warning("No tenés cámara asignada. Pedí al Admin que te asigne una cámara.")
             else:
-                from db import conn
-                c = conn()
-                users = c.execute("""
-                    SELECT u.*, COALESCE(ch.name,'(Sin cámara)') as chamber_name
-                    FROM users u
-                    LEFT JOIN chambers ch ON ch.id = u.chamber_id
-                    WHERE u.chamber_id = ?
-                    ORDER BY u.created_at DESC
-                """, (my_ch,)).fetchall()
-                c.close()
-                udf = pd.DataFrame([dict(u) for u in users])
+                udf = svc.users_frame(chamber_id=my_ch)
                 st.dataframe(udf[["id","email","name","company","role","is_active","created_at"]], use_container_width=True, hide_index=True)
                 st.markdown("### Requerimientos de la cámara")
-                reqs = svc.list_requirements({"status":"open","chamber_id":my_ch})
-                if reqs:
-                    st.dataframe(pd.DataFrame([dict(r) for r in reqs])[["id","req_type","title","company","created_at","status"]],
+                reqs = svc.requirements_frame({"status":"open","chamber_id":my_ch})
+                if not reqs.empty:
+                    st.dataframe(reqs[["id","req_type","title","company","created_at","status"]],
                                  use_container_width=True, hide_index=True)
                 else:
                     st.info("No hay requerimientos abiertos en tu cámara.")
+                st.markdown("### Importación y exportación masiva")
+                bulk_panel("bulk_chamber", ["users", "requirements"], chamber_id=my_ch)
+
+# Desglose de esta ejecución (llamadas de services/auth/matching y SQL); los tiempos incluyen anidadas
+elapsed, breakdown = page_done()
+if role == "admin" and breakdown:
+    with st.sidebar.expander(f"Tiempos de esta página: {elapsed * 1000:.0f} ms"):
+        st.dataframe(pd.DataFrame(breakdown).rename(columns={"op":"operación","n":"llamadas","rows":"filas"}),
+                     use_container_width=True, hide_index=True)
@@ -1,35 +1,149 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
-from db import conn, now_iso, log
+from db import connection, transaction, now_iso, log
+import instrumentation
+from cache import cached, invalidate
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt(rounds=12)
-    hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
-    return hashed.decode("utf-8")
+# Costo de bcrypt (cada +1 duplica el tiempo). Si cambia, los hashes viejos se rehashean al ingresar.
+BCRYPT_ROUNDS = int(os.environ.get("CPF_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("CPF_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Trabajos admitidos a la vez (en ejecución + en espera); por encima se rechaza tras HASH_WAIT_SECONDS
+HASH_MAX_PENDING = int(os.environ.get("CPF_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+HASH_WAIT_SECONDS = float(os.environ.get("CPF_HASH_WAIT_SECONDS", "5"))
 
-def verify_password(password: str, password_hash: str) -> bool:
+class HashingBusy(Exception):
+    pass
+
+class Hasher:
+    # Pool acotado para bcrypt: bcrypt libera el GIL, así que los hilos usan todos los núcleos
+    # sin que los reruns de Streamlit compitan sin límite por la CPU. Un semáforo aplica
+    # contrapresión: cuando la cola está llena, el llamador espera hasta HASH_WAIT_SECONDS.
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max(max_pending, workers))
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "busy_seconds": 0.0}
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpf-bcrypt")
+        return self._executor
+
+    def submit(self, fn, *args, wait=HASH_WAIT_SECONDS):
+        # wait=None bloquea sin límite (procesos batch); 0 no espera
+        acquired = self._slots.acquire() if wait is None else self._slots.acquire(timeout=wait)
+        if not acquired:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise HashingBusy("Demasiados ingresos simultáneos; reintentá en unos segundos.")
+        try:
+            future = self._pool().submit(self._timed, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.stats["busy_seconds"] += time.perf_counter() - t0
+
+    def run(self, fn, *args, wait=HASH_WAIT_SECONDS):
+        return self.submit(fn, *args, wait=wait).result()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+hasher = Hasher()
+# "log" es la auditoría de db.py
+logger = logging.getLogger("cpf.auth")
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+def _check(password, password_hash):
     try:
         return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
     except Exception:
         return False
 
+def hash_password(password: str, rounds=None) -> str:
+    h = hasher.run(_hash, password, rounds or BCRYPT_ROUNDS)
+    hasher.count("hashed")
+    return h
+
+def hash_passwords(passwords, rounds=None):
+    # Para cargas masivas: encola todo respetando la contrapresión y devuelve en orden
+    futures = [hasher.submit(_hash, p, rounds or BCRYPT_ROUNDS, wait=None) for p in passwords]
+    out = [f.result() for f in futures]
+    hasher.count("hashed", len(out))
+    return out
+
+def verify_password(password: str, password_hash: str) -> bool:
+    ok = hasher.run(_check, password, password_hash)
+    hasher.count("verified")
+    return ok
+
+def hash_rounds(password_hash):
+    # "$2b$12$..." -> 12
+    try:
+        return int(password_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash):
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
+
+def _rehash(user_id, password, old_hash):
+    new_hash = _hash(password, BCRYPT_ROUNDS)
+    with transaction() as c:
+        # Solo si nadie cambió la contraseña mientras tanto
+        c.execute("UPDATE users SET password_hash=? WHERE id=? AND password_hash=?", (new_hash, user_id, old_hash))
+    hasher.count("rehashed")
+    invalidate("users")
+
+def _rehash_done(future):
+    # El ingreso ya respondió: un fallo (p. ej. base bloqueada) solo queda en el log y se reintenta en el próximo
+    if future.exception() is not None:
+        logger.error("Falló el rehash de la contraseña", exc_info=future.exception())
+
 def get_user_by_email(email: str):
-    c = conn()
-    row = c.execute("SELECT * FROM users WHERE email = ?", (email.strip().lower(),)).fetchone()
-    c.close()
+    with connection() as c:
+        row = c.execute("SELECT * FROM users WHERE email = ?", (email.strip().lower(),)).fetchone()
+    return row
+
+@cached("users", ttl=60)
+def get_user(user_id):
+    # Registro vigente por id; las escrituras sobre users invalidan el espacio "users"
+    with connection() as c:
+        row = c.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
     return row
 
 def create_user(email, password, name, company, phone, chamber_id, role="user"):
     email_n = email.strip().lower()
-    c = conn()
-    c.execute(
-        """INSERT INTO users(email, password_hash, name, company, phone, chamber_id, role, created_at)
-             VALUES(?,?,?,?,?,?,?,?)""",
-        (email_n, hash_password(password), name.strip(), company.strip(), (phone or "").strip(), chamber_id, role, now_iso())
-    )
-    c.commit()
-    user_id = c.execute("SELECT id FROM users WHERE email = ?", (email_n,)).fetchone()["id"]
-    c.close()
-    log(user_id, "user_created", f"role={role}")
+    password_hash = hash_password(password)
+    with transaction() as c:
+        user_id = c.execute(
+            """INSERT INTO users(email, password_hash, name, company, phone, chamber_id, role, created_at)
+                 VALUES(?,?,?,?,?,?,?,?) RETURNING id""",
+            (email_n, password_hash, name.strip(), company.strip(), (phone or "").strip(), chamber_id, role, now_iso())
+        ).fetchone()[0]
+        log(user_id, "user_created", f"role={role}")
+    invalidate("users", "metrics")
     return user_id
 
 def authenticate(email, password):
@@ -37,11 +151,18 @@ def authenticate(email, password):
     if not u or not u["is_active"]:
         return None
     if verify_password(password, u["password_hash"]):
+        if needs_rehash(u["password_hash"]):
+            # Costo cambiado: se rehashea en segundo plano, sin demorar el ingreso; si el pool está lleno queda para el próximo
+            try:
+                hasher.submit(_rehash, u["id"], password, u["password_hash"], wait=0).add_done_callback(_rehash_done)
+            except HashingBusy:
+                pass
         return u
     return None
 
 def any_admin_exists():
-    c = conn()
-    row = c.execute("SELECT 1 FROM users WHERE role='admin' LIMIT 1").fetchone()
-    c.close()
+    with connection() as c:
+        row = c.execute("SELECT 1 FROM users WHERE role='admin' LIMIT 1").fetchone()
     return row is not None
+
+instrumentation.instrument(globals(), "auth")
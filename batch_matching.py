@@ -0,0 +1,235 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from db import connection, transaction, now_iso, init_db, stream
+from cache import invalidate
+import matching
+import scoring
+from matching import build_corpus, new_vectorizer, opposite_type, top_k_indices
+
+JOB_NAME = "requirement_matches"
+TOP_K = 5
+# Presupuesto de memoria por bloque denso de similitudes (bytes)
+BLOCK_BYTES = 128 * 1024 * 1024
+INSERT_BATCH = 5000
+
+# Matrices destino por tipo, cargadas una vez por proceso trabajador
+_shared = {}
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def block_rows(shared, n_dst):
+    # Con reglas, scoring.rule_matrix arma varias matrices densas más por bloque
+    cell = 40 if "coords" in shared else 8
+    return max(1, BLOCK_BYTES // (cell * max(1, n_dst)))
+
+
+def _take(part, sel):
+    # Filas sel de una parte opcional: matriz de embeddings o columnas de reglas
+    if part is None:
+        return None
+    if isinstance(part, dict):
+        return {k: v[sel] for k, v in part.items()}
+    return part[sel]
+
+
+def similarity(shared, X_a, E_a, C_a, X_b, E_b, C_b, top_k):
+    # TF-IDF y, con modelo de embeddings, la misma mezcla que matching.blend; con reglas, los mismos
+    # filtros y pesos que matching.rank (scoring.rule_matrix)
+    weight = shared["weight"]
+    if weight >= 1:
+        sims = E_a @ E_b.T
+    else:
+        sims = (X_a @ X_b.T).toarray()
+        if weight > 0:
+            sims = (1 - weight) * sims + weight * (E_a @ E_b.T)
+    if C_a is not None:
+        sims = scoring.rule_matrix(shared["coords"], C_a, C_b, sims, top_k)
+    return sims
+
+
+def _topk_block(task):
+    src_type, X_src, E_src, C_src, src_ids, top_k = task
+    X_dst, dst_ids, E_dst, C_dst = _shared[opposite_type(src_type)]
+    out = []
+    if X_dst.shape[0] == 0:
+        return out
+    sims = similarity(_shared, X_src, E_src, C_src, X_dst, E_dst, C_dst, top_k)
+    for i, rid in enumerate(src_ids):
+        row = sims[i]
+        for rank, j in enumerate(top_k_indices(row, top_k)):
+            if row[j] <= 0:
+                break
+            out.append((int(rid), rank + 1, int(dst_ids[j]), float(row[j])))
+    return out
+
+
+def load_corpus():
+    # Requerimientos abiertos leídos en bloques (db.stream): de cada fila quedan id, tipo, texto y
+    # los campos de las reglas (scoring.RuleTable)
+    ids, types, texts = [], [], []
+    rules = scoring.RuleTable()
+    with connection() as c:
+        for rows in stream(c, """SELECT id, req_type, title, description, tags, category, location, urgency, chamber_id, created_at
+                                   FROM requirements WHERE status='open' ORDER BY id"""):
+            batch_ids, batch_texts = build_corpus(rows)
+            ids.extend(batch_ids)
+            texts.extend(batch_texts)
+            types.extend(r["req_type"] for r in rows)
+            rules.extend(rows)
+    return ids, types, texts, rules
+
+
+def build_matrices(ids, types, texts, rules=None):
+    if not any(texts):
+        return None
+    X = new_vectorizer().fit_transform(texts).tocsr()
+    weight = matching.semantic_weight()
+    E = None
+    if weight > 0:
+        import embeddings
+        # Completa en el almacén los vectores que falten y los trae alineados con ids
+        E = embeddings.get_index().ensure(ids, types, texts)
+    ids = np.asarray(ids, dtype=np.int64)
+    types = np.asarray(types, dtype=object)
+    shared = {"weight": weight}
+    C = None
+    if rules is not None and scoring.MATCH_RULES:
+        C = rules.columns(np.arange(len(ids)))
+        shared["coords"] = rules.coords()
+    for t in ("offer", "need"):
+        sel = np.flatnonzero(types == t)
+        shared[t] = (X[sel], ids[sel], _take(E, sel), _take(C, sel))
+    return shared
+
+
+def last_run_at(c):
+    row = c.execute("SELECT last_run_at FROM job_runs WHERE job=?", (JOB_NAME,)).fetchone()
+    return row["last_run_at"] if row else None
+
+
+def affected_ids(c, shared, since, top_k):
+    # Filas a recalcular: requerimientos nuevos, los que tenían como match a uno cerrado
+    # y los del tipo opuesto cuyo peor score actual es superado por algún nuevo
+    new_ids = {r["id"] for r in c.execute(
+        "SELECT id FROM requirements WHERE status='open' AND created_at >= ?", (since,))}
+    closed_ids = [r["id"] for r in c.execute(
+        "SELECT id FROM requirements WHERE status='closed' AND updated_at >= ?", (since,))]
+    stale = set()
+    for i in range(0, len(closed_ids), 500):
+        chunk = closed_ids[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        stale.update(r["requirement_id"] for r in c.execute(
+            f"SELECT DISTINCT requirement_id FROM requirement_matches WHERE match_id IN ({marks})", chunk))
+
+    floor = {}
+    for r in c.execute("SELECT requirement_id, MIN(score) as s, COUNT(*) as n FROM requirement_matches GROUP BY requirement_id"):
+        floor[r["requirement_id"]] = r["s"] if r["n"] >= top_k else 0.0
+
+    beaten = set()
+    for t in ("offer", "need"):
+        X_dst, dst_ids, E_dst, C_dst = shared[opposite_type(t)]
+        X_new, src_ids, E_new, C_new = shared[t]
+        sel = np.flatnonzero(np.isin(src_ids, list(new_ids)))
+        if sel.size == 0 or X_dst.shape[0] == 0:
+            continue
+        X_new, E_new, C_new = X_new[sel], _take(E_new, sel), _take(C_new, sel)
+        step = block_rows(shared, X_new.shape[0])
+        for start in range(0, X_dst.shape[0], step):
+            block = slice(start, start + step)
+            best = similarity(shared, X_dst[block], _take(E_dst, block), _take(C_dst, block),
+                              X_new, E_new, C_new, top_k).max(axis=1)
+            for rid, b in zip(dst_ids[start:start + step].tolist(), best.tolist()):
+                if b > floor.get(rid, 0.0):
+                    beaten.add(rid)
+    return new_ids | stale | beaten, closed_ids
+
+
+def compute(shared, targets=None, top_k=TOP_K, workers=None):
+    tasks = []
+    for t in ("offer", "need"):
+        X_src, src_ids, E_src, C_src = shared[t]
+        if targets is not None:
+            sel = np.flatnonzero(np.isin(src_ids, list(targets)))
+            X_src, src_ids, E_src, C_src = X_src[sel], src_ids[sel], _take(E_src, sel), _take(C_src, sel)
+        step = block_rows(shared, shared[opposite_type(t)][0].shape[0])
+        for start in range(0, X_src.shape[0], step):
+            block = slice(start, start + step)
+            tasks.append((t, X_src[block], _take(E_src, block), _take(C_src, block), src_ids[block], top_k))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        _init_worker(shared)
+        for task in tasks:
+            yield from _topk_block(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as ex:
+        for out in ex.map(_topk_block, tasks):
+            yield from out
+
+
+def run(full=False, top_k=TOP_K, workers=None):
+    started = now_iso()
+    t0 = time.perf_counter()
+    ids, types, texts, rules = load_corpus()
+    shared = build_matrices(ids, types, texts, rules) if ids else None
+    del texts  # el cálculo solo usa las matrices
+    with connection() as c:
+        since = None if full or shared is None else last_run_at(c)
+        targets, closed_ids = None, []
+        if shared is None:
+            targets = set()
+        elif since is not None:
+            targets, closed_ids = affected_ids(c, shared, since, top_k)
+
+    # El cálculo corre fuera de la transacción; el lock de escritura se toma solo para volcar
+    results = []
+    if shared is not None and (targets is None or targets):
+        results = [(rid, rank, mid, score, started) for rid, rank, mid, score in compute(shared, targets, top_k, workers)]
+
+    with transaction() as c:
+        if since is None:
+            c.execute("DELETE FROM requirement_matches")
+        else:
+            drop = list(targets) + list(closed_ids)
+            for i in range(0, len(drop), 500):
+                chunk = drop[i:i + 500]
+                c.execute(f"DELETE FROM requirement_matches WHERE requirement_id IN ({','.join('?' * len(chunk))})", chunk)
+        for i in range(0, len(results), INSERT_BATCH):
+            c.executemany(
+                "INSERT INTO requirement_matches(requirement_id, rank, match_id, score, computed_at) VALUES(?,?,?,?,?)",
+                results[i:i + INSERT_BATCH]
+            )
+        c.execute(
+            "INSERT INTO job_runs(job, last_run_at) VALUES(?,?) ON CONFLICT(job) DO UPDATE SET last_run_at=excluded.last_run_at",
+            (JOB_NAME, started)
+        )
+    invalidate("matches")
+    return {
+        "mode": "full" if since is None else "incremental",
+        "open": len(ids),
+        "recomputed": len(ids) if targets is None else len(targets),
+        "written": len(results),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Precalcula sugerencias OFERTA↔NECESIDAD en requirement_matches")
+    ap.add_argument("--full", action="store_true", help="recalcular todo (por defecto: incremental desde la última corrida)")
+    ap.add_argument("--top-k", type=int, default=TOP_K)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args(argv)
+    init_db()
+    print(run(full=args.full, top_k=args.top_k, workers=args.workers))
+
+
+if __name__ == "__main__":
+    main()
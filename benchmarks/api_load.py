@@ -0,0 +1,124 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import db
+
+
+def start_server(port):
+    import uvicorn
+    import api
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="cpf-api-bench", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def setup(n_requirements, url=None):
+    # url: base Postgres vacía; por defecto un archivo SQLite temporal
+    import auth
+    import query_plans
+    tmp = tempfile.mkdtemp(prefix="cpf-api-")
+    db.use_database(url or os.path.join(tmp, "api.db"))
+    db.init_db()
+    query_plans.seed(n_users=200, n_requirements=n_requirements, n_contacts=500)
+    auth.BCRYPT_ROUNDS = 4
+    a = auth.create_user("api-a@cpf", "clave", "Api A", "Empresa A", "", 1)
+    b = auth.create_user("api-b@cpf", "clave", "Api B", "Empresa B", "", 2)
+    return a, b
+
+
+def smoke(client):
+    # Recorre el flujo completo contra la base local y falla ante cualquier respuesta inesperada
+    def check(resp, code):
+        assert resp.status_code == code, (resp.request.method, resp.request.url, resp.status_code, resp.text)
+        return resp
+
+    assert client.get("/requirements").status_code == 401
+    ta = check(client.post("/auth/token", json={"email": "api-a@cpf", "password": "clave"}), 200).json()["token"]
+    tb = check(client.post("/auth/token", json={"email": "api-b@cpf", "password": "clave"}), 200).json()["token"]
+    check(client.post("/auth/token", json={"email": "api-a@cpf", "password": "mal"}), 401)
+    ha, hb = {"Authorization": f"Bearer {ta}"}, {"Authorization": f"Bearer {tb}"}
+    page = check(client.get("/requirements", params={"limit": 20}, headers=ha), 200)
+    assert len(page.json()["items"]) == 20 and page.json()["next"]
+    check(client.get("/requirements", params={"limit": 20, "after": page.json()["next"]}, headers=ha), 200)
+    check(client.get("/requirements", headers={**ha, "If-None-Match": page.headers["etag"]}, params={"limit": 20}), 304)
+    check(client.get("/requirements", params={"q": "flete", "req_type": "need"}, headers=ha), 200)
+    rid = check(client.post("/requirements", headers=ha, json={
+        "req_type": "offer", "title": "Flete refrigerado", "description": "Camión con cadena de frío", "tags": "flete"}), 201).json()["id"]
+    req = check(client.get(f"/requirements/{rid}", headers=hb), 200).json()
+    assert "email" not in req and req["contact"] == "none"
+    check(client.get(f"/requirements/{rid}/matches", headers=hb), 200)
+    check(client.post("/contacts", headers=hb, json={"requirement_id": rid}), 201)
+    check(client.post("/contacts", headers=hb, json={"requirement_id": rid}), 409)
+    cid = check(client.get("/contacts/inbox", headers=ha), 200).json()[0]["id"]
+    check(client.post(f"/contacts/{cid}/respond", headers=hb, json={"decision": "accepted"}), 404)
+    check(client.post(f"/contacts/{cid}/respond", headers=ha, json={"decision": "accepted"}), 204)
+    req = check(client.get(f"/requirements/{rid}", headers=hb), 200).json()
+    assert "email" in req and req["contact"] == "granted"
+    assert "unread" in check(client.get("/notifications/unread", headers=hb), 200).json()
+    check(client.get("/notifications", headers=hb), 200)
+    check(client.post("/notifications/read", headers=hb), 204)
+    check(client.post(f"/requirements/{rid}/close", headers=hb), 403)
+    check(client.post(f"/requirements/{rid}/close", headers=ha), 204)
+    check(client.delete("/auth/token", headers=hb), 204)
+    check(client.get("/me", headers=hb), 401)
+    return ta
+
+
+def load(base, token, threads, seconds):
+    import httpx
+    counts = [0] * threads
+    errors = [0] * threads
+    stop = time.perf_counter() + seconds
+    paths = ["/requirements?limit=20", "/requirements/1", "/requirements?q=acero&limit=20", "/chambers"]
+
+    def worker(k):
+        etags = {}
+        with httpx.Client(base_url=base, headers={"Authorization": f"Bearer {token}"}) as client:
+            i = k
+            while time.perf_counter() < stop:
+                path = paths[i % len(paths)]
+                r = client.get(path, headers={"If-None-Match": etags[path]} if path in etags else None)
+                if r.status_code == 200:
+                    etags[path] = r.headers["etag"]
+                elif r.status_code != 304:
+                    errors[k] += 1
+                counts[k] += 1
+                i += 1
+
+    ts = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {"threads": threads, "requests": sum(counts), "reads_per_s": round(sum(counts) / elapsed, 1), "errors": sum(errors)}
+
+
+def main(argv=None):
+    import httpx
+    ap = argparse.ArgumentParser(description="Smoke test y carga de lecturas del servicio api.py sobre una base local")
+    ap.add_argument("--requirements", type=int, default=5000)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--db-url", default=None, help="URL de una base Postgres vacía (por defecto SQLite temporal)")
+    args = ap.parse_args(argv)
+    setup(args.requirements, args.db_url)
+    server = start_server(args.port)
+    base = f"http://127.0.0.1:{args.port}"
+    with httpx.Client(base_url=base) as client:
+        token = smoke(client)
+    print("smoke OK")
+    for threads in args.threads:
+        print(load(base, token, threads, args.seconds))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
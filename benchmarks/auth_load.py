@@ -0,0 +1,85 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import auth
+import db
+
+
+def setup(n_users, rounds):
+    tmp = tempfile.mkdtemp(prefix="cpf-auth-")
+    db.use_database(os.path.join(tmp, "auth.db"))
+    db.init_db()
+    # Un único hash compartido: el costo de preparar la base no entra en la medición
+    h = auth._hash("clave", rounds)
+    with db.transaction() as c:
+        c.executemany(
+            "INSERT INTO users(email, password_hash, name, company, role, created_at) VALUES(?,?,?,?,'user',?)",
+            [(f"u{i}@cpf", h, f"Usuario {i}", f"Empresa {i}", db.now_iso()) for i in range(n_users)]
+        )
+
+
+def run(sessions, rounds, seconds, workers=None, max_pending=None):
+    auth.BCRYPT_ROUNDS = rounds
+    workers = workers or auth.HASH_WORKERS
+    auth.hasher = auth.Hasher(workers=workers, max_pending=max_pending or workers * 8)
+    setup(max(sessions, 1) * 4, rounds)
+    latencies = [[] for _ in range(sessions)]
+    rejected = [0] * sessions
+    stop = time.perf_counter() + seconds
+
+    def session(k):
+        i = 0
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                ok = auth.authenticate(f"u{(k * 4 + i % 4)}@cpf", "clave")
+            except auth.HashingBusy:
+                rejected[k] += 1
+                continue
+            if ok is not None:
+                latencies[k].append(time.perf_counter() - t0)
+            i += 1
+
+    threads = [threading.Thread(target=session, args=(k,)) for k in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    lat = np.concatenate([np.asarray(x) for x in latencies]) if any(latencies) else np.zeros(1)
+    cores = min(workers, os.cpu_count() or 1)
+    db.pool.close_all()
+    return {
+        "rounds": rounds,
+        "sessions": sessions,
+        "workers": workers,
+        "logins": int(sum(len(x) for x in latencies)),
+        "logins_per_s": round(sum(len(x) for x in latencies) / elapsed, 1),
+        "logins_per_s_per_core": round(sum(len(x) for x in latencies) / elapsed / cores, 1),
+        "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 1),
+        "p95_ms": round(float(np.percentile(lat, 95)) * 1000, 1),
+        "rejected": sum(rejected),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Ingresos por segundo (y por núcleo) con sesiones concurrentes contra el pool de bcrypt")
+    ap.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--rounds", type=int, nargs="+", default=[auth.BCRYPT_ROUNDS])
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--max-pending", type=int, default=None)
+    args = ap.parse_args(argv)
+    for rounds in args.rounds:
+        for sessions in args.sessions:
+            print(run(sessions, rounds, args.seconds, args.workers, args.max_pending))
+
+
+if __name__ == "__main__":
+    main()
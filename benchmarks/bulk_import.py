@@ -0,0 +1,94 @@
+import argparse
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import db
+from benchmarks.synth import requirement_row
+
+
+def write_csv(path, n, n_users, seed=0):
+    # Se genera en streaming: el archivo de 1M filas no pasa por memoria
+    rng = random.Random(seed)
+    cols = ["email", "req_type", "title", "description", "tags", "category", "location", "urgency", "created_at"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(cols)
+        for i in range(n):
+            r = requirement_row(rng, i + 1)
+            r["email"] = f"u{rng.randrange(n_users)}@cpf"
+            r["created_at"] = f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00"
+            w.writerow([r[c] for c in cols])
+    return os.path.getsize(path)
+
+
+def run(n, n_users=200, batch=None, hash_users=0, memory=False, seed=0):
+    import bulk
+    tmp = tempfile.mkdtemp(prefix="cpf-bulk-")
+    db.use_database(os.path.join(tmp, "bulk.db"))
+    db.init_db()
+    users = io.StringIO()
+    w = csv.writer(users)
+    w.writerow(["email", "password", "name", "company"])
+    for i in range(max(n_users, hash_users)):
+        w.writerow([f"u{i}@cpf", f"clave-{i}", f"Usuario {i}", f"Empresa {i}"])
+    users.seek(0)
+    t0 = time.perf_counter()
+    if hash_users:
+        rep_users = bulk.import_users(users, None, batch_size=batch)
+    else:
+        # Sin medir bcrypt: usuarios con hash ficticio para aislar el costo de los requerimientos
+        with db.transaction() as c:
+            c.executemany("INSERT INTO users(email, password_hash, name, company, role, created_at) VALUES(?,'x',?,?,'user',?)",
+                          [(f"u{i}@cpf", f"Usuario {i}", f"Empresa {i}", db.now_iso()) for i in range(n_users)])
+        rep_users = {"inserted": n_users, "seconds": time.perf_counter() - t0}
+    path = os.path.join(tmp, "requirements.csv")
+    size = write_csv(path, n, n_users, seed)
+    # tracemalloc encarece cada asignación: solo se activa con --memory
+    if memory:
+        tracemalloc.start()
+    rep = bulk.import_requirements(path, None, batch_size=batch)
+    import_peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    tracemalloc.reset_peak()
+    t1 = time.perf_counter()
+    with open(os.devnull, "w", encoding="utf-8", newline="") as out:
+        exported = bulk.export_requirements(out)
+    export_s = time.perf_counter() - t1
+    export_peak = tracemalloc.get_traced_memory()[1] if memory else 0
+    tracemalloc.stop()
+    db.flush_audit()
+    db.pool.close_all()
+    return {
+        "rows": n,
+        "csv_mb": round(size / 2**20, 1),
+        "users": rep_users["inserted"],
+        "users_s": round(rep_users["seconds"], 2),
+        "inserted": rep["inserted"],
+        "failed": rep["failed"],
+        "import_s": rep["seconds"],
+        "import_rows_per_s": round(rep["inserted"] / rep["seconds"], 1) if rep["seconds"] else 0.0,
+        "import_peak_mb": round(import_peak / 2**20, 1) if memory else None,
+        "exported": exported,
+        "export_s": round(export_s, 2),
+        "export_peak_mb": round(export_peak / 2**20, 1) if memory else None,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Throughput y memoria de la importación/exportación masiva (bulk.py)")
+    ap.add_argument("--n", type=int, nargs="+", default=[10000, 100000])
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=None)
+    ap.add_argument("--hash-users", type=int, default=0, help="Importa N usuarios reales (bcrypt en paralelo)")
+    ap.add_argument("--memory", action="store_true", help="Mide el pico de memoria con tracemalloc (más lento)")
+    args = ap.parse_args(argv)
+    for n in args.n:
+        print(run(n, args.users, args.batch, args.hash_users, args.memory))
+
+
+if __name__ == "__main__":
+    main()
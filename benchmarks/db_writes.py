@@ -0,0 +1,67 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import db
+from benchmarks.synth import requirement_rows
+
+
+def run(profile, writers, per_writer, seed=0):
+    tmp = tempfile.mkdtemp(prefix="cpf-bench-")
+    db.use_database(os.path.join(tmp, "bench.db"), profile=profile)
+    db.init_db()
+    import services as svc
+    with db.transaction() as c:
+        c.execute(
+            "INSERT INTO users(email, password_hash, name, company, role, created_at) VALUES('bench@cpf','x','Bench','Bench SA','user',?)",
+            (db.now_iso(),)
+        )
+        uid = c.execute("SELECT id FROM users WHERE email='bench@cpf'").fetchone()["id"]
+    rows = requirement_rows(writers * per_writer, seed=seed)
+    errors = []
+    done = [0] * writers
+
+    def writer(k):
+        for r in rows[k * per_writer:(k + 1) * per_writer]:
+            try:
+                svc.create_requirement(uid, uid, None, r["req_type"], r["title"], r["description"],
+                                       r["tags"], r["category"], r["location"], r["urgency"])
+                done[k] += 1
+            except Exception as e:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    db.flush_audit()
+    db.pool.close_all()
+    return {
+        "profile": profile,
+        "writers": writers,
+        "writes": writers * per_writer,
+        "seconds": round(elapsed, 3),
+        "writes_per_s": round(sum(done) / elapsed, 1) if elapsed else 0.0,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Throughput de create_requirement con escritores concurrentes por perfil de PRAGMAs")
+    ap.add_argument("--profiles", nargs="+", default=["safe", "performance"], choices=list(db.DB_PROFILES))
+    ap.add_argument("--writers", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--per-writer", type=int, default=200)
+    args = ap.parse_args(argv)
+    for writers in args.writers:
+        for profile in args.profiles:
+            print(run(profile, writers, args.per_writer))
+
+
+if __name__ == "__main__":
+    main()
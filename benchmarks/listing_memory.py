@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import db
+from benchmarks.synth import requirement_rows
+
+# Pico de memoria por variante de listado: lista de Rows -> dicts -> DataFrame (camino viejo de
+# app.py) contra iter_* (streaming) y *_frame (columnar). Cada medición corre en un proceso
+# aparte para que el pico de RSS no arrastre el de la anterior.
+VARIANTS = {
+    "requirements": ("list", "iter", "frame"),
+    "inbox": ("list", "iter"),
+    "users": ("list", "iter", "frame"),
+}
+
+
+def setup(n, target, seed=0):
+    rng = random.Random(seed)
+    db.use_database(target)
+    db.init_db()
+    now = db.now_iso()
+    with db.transaction() as c:
+        c.execute("INSERT INTO chambers(name, province, city, created_at) VALUES('Cámara', '', '', ?)", (now,))
+        c.executemany(
+            "INSERT INTO users(email, password_hash, name, company, phone, chamber_id, role, created_at) VALUES(?,?,?,?,?,?,?,?)",
+            [(f"u{i}@cpf", "x", f"Usuario {i}", f"Empresa {i}", "", 1, "user", now) for i in range(n)]
+        )
+    for start in range(0, n, 50000):
+        rows = requirement_rows(min(50000, n - start), seed=seed + start, start_id=start + 1)
+        with db.transaction() as c, db.deferred_fts(c):
+            c.executemany(
+                """INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency,
+                                            status, created_at, updated_at) VALUES(?,?,?,?,?,?,?,?,?,'open',?,?)""",
+                [(2 + rng.randrange(n - 1), 1, r["req_type"], r["title"], r["description"], r["tags"], r["category"],
+                  r["location"], r["urgency"], f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00", now)
+                 for i, r in enumerate(rows)]
+            )
+    # Bandeja del usuario 1 con n solicitudes recibidas
+    with db.transaction() as c:
+        c.executemany(
+            "INSERT INTO contact_requests(from_user_id, to_user_id, requirement_id, status, created_at) VALUES(?,1,?,'pending',?)",
+            [(2 + rng.randrange(n - 1), 1 + i, now) for i in range(n)]
+        )
+    db.flush_audit()
+    db.pool.close_all()
+
+
+def _status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise OSError(field)
+
+
+def _reset_peak():
+    # Linux: "5" en clear_refs reinicia VmHWM (pico de RSS). Devuelve el RSS actual como base.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _status_mb("VmRSS")
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows: solo memoria de Python (tracemalloc), sin contar los buffers nativos
+        import tracemalloc
+        tracemalloc.start()
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _peak_mb():
+    try:
+        return _status_mb("VmHWM")
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(listing, variant, target):
+    # Corre dentro del proceso hijo: pico de memoria por encima del estado previo a la consulta
+    import pandas as pd
+    import cache
+    import services as svc
+    cache.ENABLED = False
+    # Sin mmap ni caché de páginas grande: las páginas de la base no cuentan como memoria del listado
+    db.DB_PROFILES["listing"] = dict(db.DB_PROFILES["performance"], mmap_size=0, cache_size=-2000)
+    db.use_database(target, profile=None if db.is_postgres() else "listing")
+    before = _reset_peak()
+    t0 = time.perf_counter()
+    filters = {"status": "open"}
+    if variant == "list":
+        rows = {"requirements": lambda: svc.list_requirements(filters), "inbox": lambda: svc.list_inbox(1),
+                "users": lambda: svc.list_users()}[listing]()
+        df = pd.DataFrame([dict(r) for r in rows])
+        n = len(df)
+    elif variant == "iter":
+        it = {"requirements": lambda: svc.iter_requirements(filters), "inbox": lambda: svc.iter_inbox(1),
+              "users": lambda: svc.iter_users()}[listing]()
+        n = sum(1 for _ in it)
+    else:
+        df = {"requirements": lambda: svc.requirements_frame(filters), "users": lambda: svc.users_frame()}[listing]()
+        n = len(df)
+    seconds = time.perf_counter() - t0
+    peak = _peak_mb() - before
+    return {
+        "listing": listing,
+        "variant": variant,
+        "rows": n,
+        "seconds": round(seconds, 2),
+        "peak_mb": round(peak, 1),
+        "mb_per_100k_rows": round(peak * 100000 / n, 1) if n else 0.0,
+    }
+
+
+def run(n, target=None):
+    target = target or os.path.join(tempfile.mkdtemp(prefix="cpf-mem-"), "mem.db")
+    setup(n, target)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    out = []
+    for listing, variants in VARIANTS.items():
+        for variant in variants:
+            res = subprocess.run([sys.executable, "-m", "benchmarks.listing_memory", "--child", listing, variant, target],
+                                 capture_output=True, text=True, env=env, check=True)
+            out.append(json.loads(res.stdout.strip().splitlines()[-1]))
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pico de memoria (RSS) por cada 100k filas: listas vs streaming vs DataFrame columnar")
+    ap.add_argument("--n", type=int, default=100000, help="Filas por listado")
+    ap.add_argument("--db-url", default=None, help="URL de una base Postgres vacía (por defecto SQLite temporal)")
+    ap.add_argument("--child", nargs=3, metavar=("LISTING", "VARIANT", "TARGET"), help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.child:
+        print(json.dumps(measure(*args.child)))
+        return
+    for res in run(args.n, args.db_url):
+        print(res)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import time
+
+import numpy as np
+
+import matching
+from benchmarks.synth import requirement_rows
+
+
+def run(n, queries, top_k, backend, knobs, seed=0):
+    rows = requirement_rows(n, seed=seed)
+    for name, value in knobs.items():
+        setattr(matching, name, value)
+    t0 = time.perf_counter()
+    idx = matching.MatchIndex(backend=backend)
+    idx.fit(rows)
+    build_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(seed + 1)
+    targets = [rows[i] for i in rng.choice(n, size=min(queries, n), replace=False)]
+    exact_t, ann_t, recall = [], [], []
+    for row in targets:
+        t0 = time.perf_counter()
+        exact = idx.query(row, top_k=top_k, exact=True)
+        exact_t.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        approx = idx.query(row, top_k=top_k)
+        ann_t.append(time.perf_counter() - t0)
+        if exact:
+            # Recall tolerante a empates: cuenta aciertos con score >= k-ésimo score exacto
+            kth = exact[-1][1] - 1e-9
+            recall.append(sum(1 for _, score in approx if score >= kth) / len(exact))
+    return {
+        "n": n,
+        "backend": backend,
+        **{k.lower(): v for k, v in knobs.items()},
+        "build_s": round(build_s, 3),
+        "exact_ms_p50": round(1000 * float(np.median(exact_t)), 3),
+        "ann_ms_p50": round(1000 * float(np.median(ann_t)), 3),
+        f"recall@{top_k}": round(float(np.mean(recall)) if recall else 0.0, 4),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Recall vs. latencia de los backends aproximados frente al barrido exacto")
+    ap.add_argument("--n", type=int, nargs="+", default=[10000, 100000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--backend", choices=["postings", "lsh"], default="postings")
+    ap.add_argument("--terms", type=int, nargs="+", default=[4, 8, 16], help="postings: términos de la consulta")
+    ap.add_argument("--depth", type=int, default=matching.ANN_POSTINGS_DEPTH, help="postings: profundidad por lista")
+    ap.add_argument("--tables", type=int, nargs="+", default=[4, 8, 16], help="lsh: cantidad de tablas")
+    ap.add_argument("--bits", type=int, default=matching.ANN_BITS)
+    ap.add_argument("--probes", type=int, default=matching.ANN_PROBES)
+    args = ap.parse_args(argv)
+    if args.backend == "postings":
+        grid = [{"ANN_QUERY_TERMS": t, "ANN_POSTINGS_DEPTH": args.depth} for t in args.terms]
+    else:
+        grid = [{"ANN_TABLES": t, "ANN_BITS": args.bits, "ANN_PROBES": args.probes} for t in args.tables]
+    for n in args.n:
+        for knobs in grid:
+            print(run(n, args.queries, args.top_k, args.backend, knobs))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import embeddings
+import matching
+from benchmarks.synth import TOPICS, requirement_rows
+
+
+def precision(hits, category, by_id):
+    return sum(1 for rid, _ in hits if by_id[rid]["category"] == category) / len(hits) if hits else 0.0
+
+
+def run(n, queries, top_k, dim, weights, seed=0):
+    rows = requirement_rows(n, seed=seed)
+    by_id = {r["id"]: r for r in rows}
+    ids, texts = matching.build_corpus(rows)
+    out = {"n": n, "dim": dim}
+
+    t0 = time.perf_counter()
+    model = embeddings.build_model(texts, dim=dim, seed=seed)
+    out["model_s"] = round(time.perf_counter() - t0, 2)
+    store = embeddings.VectorStore(tempfile.mkdtemp(prefix="cpf-vec-"), model.dim, model.fingerprint)
+    semantic = embeddings.SemanticIndex(model, store)
+    t0 = time.perf_counter()
+    semantic.ensure(ids, [r["req_type"] for r in rows], texts)
+    seconds = time.perf_counter() - t0
+    out["embed_docs_s"] = round(n / seconds)
+    out["store_mb"] = round(store.count * model.dim * 2 / 2**20, 1)
+    lexical = matching.MatchIndex()
+    lexical.fit(rows)
+
+    engines = {"tfidf": lambda row: lexical.query(row, top_k=top_k),
+               "embeddings": lambda row: semantic.query(row, top_k=top_k)}
+    for w in weights:
+        engines[f"hybrid{w}"] = lambda row, w=w: matching.blend(lexical, semantic, row, top_k, w)
+
+    rng = random.Random(seed + 1)
+    targets = rng.sample(rows, min(queries, n))
+    # Consultas cortas de una palabra del rubro, puntuadas solo contra textos que NO la contienen:
+    # mide si el motor encuentra el rubro sin coincidencia literal (sinónimos)
+    short = []
+    for _ in range(min(queries, 50)):
+        category = rng.choice(list(TOPICS))
+        word = rng.choice(TOPICS[category])
+        cand = np.asarray([r["id"] for r in rows if word.lower() not in embeddings.fold(matching.build_corpus([r])[1][0])],
+                          dtype=np.int64)
+        short.append(({"id": 0, "req_type": "need", "title": word, "description": "", "tags": "", "category": "",
+                       "location": ""}, category, cand))
+
+    for name, engine in engines.items():
+        lat, prec = [], []
+        for row in targets:
+            t0 = time.perf_counter()
+            hits = engine(row)
+            lat.append(time.perf_counter() - t0)
+            prec.append(precision(hits, row["category"], by_id))
+        out[f"{name}_ms_p50"] = round(1000 * float(np.median(lat)), 2)
+        out[f"{name}_p@{top_k}"] = round(float(np.mean(prec)), 3)
+        w = 0.0 if name == "tfidf" else 1.0 if name == "embeddings" else float(name[6:])
+        syn = []
+        for q, category, cand in short:
+            scores = w * semantic.scores(q, cand) if w > 0 else np.zeros(len(cand))
+            if w < 1:
+                scores = scores + (1 - w) * lexical.scores(q, cand)
+            top = matching.top_k_indices(scores, top_k)
+            syn.append(precision([(int(cand[i]), 0) for i in top], category, by_id))
+        out[f"{name}_synonym_p@{top_k}"] = round(float(np.mean(syn)), 3)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Calidad y latencia: TF-IDF vs embeddings vs hybrid sobre corpus sintéticos")
+    ap.add_argument("--n", type=int, nargs="+", default=[10000, 100000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--weights", type=float, nargs="+", default=[0.3, 0.5, 0.7], help="Pesos semánticos a probar en hybrid")
+    args = ap.parse_args(argv)
+    for n in args.n:
+        print(run(n, args.queries, args.top_k, args.dim, args.weights))
+
+
+if __name__ == "__main__":
+    main()
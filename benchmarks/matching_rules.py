@@ -0,0 +1,77 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+import matching
+import scoring
+from benchmarks.synth import requirement_rows
+
+
+def rows_with_fields(n, seed=0, chambers=30):
+    # Filas sintéticas con cámara y fecha de alta (últimos 180 días), que synth no genera
+    rng = random.Random(seed + 7)
+    rows = requirement_rows(n, seed=seed)
+    for r in rows:
+        r["chamber_id"] = rng.randint(1, chambers)
+        r["created_at"] = f"2026-{rng.randint(4, 9):02d}-{rng.randint(1, 28):02d}T12:00:00"
+    return rows
+
+
+def run(n, queries, top_k, seed=0):
+    rows = rows_with_fields(n, seed=seed)
+    t0 = time.perf_counter()
+    idx = matching.MatchIndex()
+    idx.fit(rows)
+    out = {"n": n, "build_s": round(time.perf_counter() - t0, 2)}
+
+    rng = np.random.default_rng(seed + 1)
+    targets = [rows[i] for i in rng.choice(n, size=min(queries, n), replace=False)]
+    pool, kept, chamber_kept = [], [], []
+    lat = {"text_exact": [], "text_ann": [], "rules": [], "rules_chamber": []}
+    same_cat = {"text_exact": [], "rules": []}
+    near = {"text_exact": [], "rules": []}
+    by_id = {r["id"]: r for r in rows}
+    for row in targets:
+        allowed = idx.active & (idx.types == matching.opposite_type(row["req_type"])) & (idx.ids != row["id"])
+        pool.append(int(allowed.sum()))
+        kept.append(scoring.prefilter(idx.rules, row, allowed, top_k)[0].size)
+        chamber_kept.append(scoring.prefilter(idx.rules, row, allowed, top_k, same_chamber=True)[0].size)
+        prox, _ = idx.rules.proximity(row["location"])
+        for name, fn in (("text_exact", lambda: idx.query(row, top_k=top_k, exact=True)),
+                         ("text_ann", lambda: idx.query(row, top_k=top_k)),
+                         ("rules", lambda: idx.rank(row, top_k=top_k)),
+                         ("rules_chamber", lambda: idx.rank(row, top_k=top_k, same_chamber=True))):
+            t0 = time.perf_counter()
+            hits = fn()
+            lat[name].append(time.perf_counter() - t0)
+            if name in same_cat and hits:
+                found = [by_id[h[0]] for h in hits]
+                same_cat[name].append(np.mean([r["category"] == row["category"] for r in found]))
+                codes = [idx.rules.location.code_of[scoring.norm(r["location"])] for r in found]
+                near[name].append(float(np.mean(prox[codes])))
+    out["candidates_before"] = int(np.median(pool))
+    out["candidates_after"] = int(np.median(kept))
+    out["reduction_x"] = round(float(np.median(pool)) / max(1.0, float(np.median(kept))), 1)
+    out["candidates_same_chamber"] = int(np.median(chamber_kept))
+    for name, values in lat.items():
+        out[f"{name}_ms_p50"] = round(1000 * float(np.median(values)), 2)
+    for name in same_cat:
+        out[f"{name}_same_category@{top_k}"] = round(float(np.mean(same_cat[name])), 3)
+        out[f"{name}_location_proximity@{top_k}"] = round(float(np.mean(near[name])), 3)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Prefiltro por rubro/ubicación/cámara: candidatos, latencia y calidad vs solo texto")
+    ap.add_argument("--n", type=int, nargs="+", default=[10000, 100000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    args = ap.parse_args(argv)
+    for n in args.n:
+        print(run(n, args.queries, args.top_k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+import db
+
+# Resultados legibles por máquina de la suite (benchmarks.suite): un JSON con el entorno y, por
+# benchmark, latencias en ms. compare() los contrasta con un baseline guardado.
+TOLERANCE = 0.25
+# Diferencias por debajo de este piso (ms) son ruido aunque superen la tolerancia relativa
+NOISE_MS = 0.5
+# Métricas comparadas: mayor es peor salvo las de throughput (p95 queda informativo: es ruidoso con hilos)
+LOWER_IS_BETTER = ("p50_ms",)
+HIGHER_IS_BETTER = ("ops_per_s",)
+
+
+def measure(fn, min_runs=20, min_seconds=0.5, max_runs=2000):
+    # Corre fn hasta juntar min_runs muestras y min_seconds de tiempo (tras una corrida de calentamiento)
+    fn()
+    samples = []
+    deadline = time.perf_counter() + min_seconds
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() < deadline):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def summarize(samples):
+    s = np.asarray(samples, dtype=float) * 1000
+    if s.size == 0:
+        return {"n": 0}
+    return {
+        "n": int(s.size),
+        "p50_ms": round(float(np.percentile(s, 50)), 3),
+        "p95_ms": round(float(np.percentile(s, 95)), 3),
+        "mean_ms": round(float(s.mean()), 3),
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": "postgres" if db.is_postgres() else "sqlite",
+    }
+
+
+def save(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=TOLERANCE, noise_ms=NOISE_MS):
+    # Regresiones de results frente a baseline: [(benchmark, métrica, baseline, actual, cambio relativo)].
+    # Solo se comparan los benchmarks presentes en ambos y con la misma escala; los marcados
+    # "informational" (desglose por acción del simulador) no cuentan.
+    if results.get("scale") != baseline.get("scale"):
+        raise ValueError(f"escalas distintas: {results.get('scale')} vs baseline {baseline.get('scale')}")
+    out = []
+    for name, cur in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None or cur.get("informational"):
+            continue
+        for metric in LOWER_IS_BETTER:
+            if metric in cur and metric in base and base[metric] > 0:
+                change = cur[metric] / base[metric] - 1
+                if change > tolerance and cur[metric] - base[metric] > noise_ms:
+                    out.append((name, metric, base[metric], cur[metric], round(change, 3)))
+        for metric in HIGHER_IS_BETTER:
+            if metric in cur and metric in base and base[metric] > 0:
+                change = cur[metric] / base[metric] - 1
+                if change < -tolerance:
+                    out.append((name, metric, base[metric], cur[metric], round(change, 3)))
+    return out
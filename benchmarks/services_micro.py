@@ -0,0 +1,121 @@
+import itertools
+import random
+
+import cache
+import db
+from benchmarks import report
+from benchmarks.synth import TOPICS, LOCATIONS
+
+# Microbenchmarks de la capa de servicios: cada caso llama una función de services/auth/sessions/
+# notifications/analytics/matching con argumentos variados sobre una base ya poblada (benchmarks.synth.populate).
+# Por defecto sin caché, para medir el camino a la base; --cache mide el camino caliente.
+
+
+class Context:
+    # Ids y parámetros de muestra tomados de la base, para que cada corrida consulte filas distintas
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        with db.connection() as c:
+            self.n_users = c.execute("SELECT MAX(id) FROM users").fetchone()[0]
+            self.n_chambers = c.execute("SELECT MAX(id) FROM chambers").fetchone()[0]
+            self.open_ids = [r[0] for r in c.execute(
+                "SELECT id FROM requirements WHERE status='open' ORDER BY id DESC LIMIT 2000")]
+            # Usuarios con bandeja: los más activos del grafo de contactos
+            self.busy_users = [r[0] for r in c.execute(
+                "SELECT to_user_id FROM contact_requests GROUP BY to_user_id ORDER BY COUNT(*) DESC LIMIT 50")]
+        self.counter = itertools.count()
+
+    def user(self):
+        return self.rng.randint(2, self.n_users)
+
+    def chamber(self):
+        return self.rng.randint(1, self.n_chambers)
+
+    def requirement(self):
+        return self.rng.choice(self.open_ids)
+
+    def page(self):
+        return self.rng.sample(self.open_ids, min(50, len(self.open_ids)))
+
+    def term(self):
+        return self.rng.choice(TOPICS[self.rng.choice(list(TOPICS))])
+
+
+def cases(ctx, password="clave"):
+    import analytics
+    import auth
+    import matching
+    import notifications
+    import services as svc
+    import sessions
+
+    def page_rows():
+        return svc.get_requirements_by_ids(ctx.page())
+
+    def publish():
+        i = next(ctx.counter)
+        topic = ctx.rng.choice(list(TOPICS))
+        svc.create_requirement(1, ctx.user(), ctx.chamber(), ctx.rng.choice(["offer", "need"]),
+                               f"Benchmark {i} {ctx.rng.choice(TOPICS[topic])}", "Alta generada por benchmarks.services_micro",
+                               topic, topic, ctx.rng.choice(LOCATIONS), "Media")
+
+    def contact():
+        r = svc.get_requirement(ctx.requirement())
+        svc.create_contact_request(1, ctx.user(), r["user_id"], r["id"])
+
+    def top_matches():
+        target = svc.get_requirement(ctx.requirement())
+        matching.top_matches(target, [r for r in pool if r["req_type"] != target["req_type"]], top_k=5)
+
+    def respond():
+        pending = [r for r in svc.list_inbox(ctx.rng.choice(ctx.busy_users)) if r["status"] == "pending"]
+        if pending:
+            svc.respond_contact_request(1, pending[0]["id"], ctx.rng.choice(["accepted", "declined"]))
+
+    token = sessions.create_session(2)
+    rows = page_rows()
+    # top_matches ajusta TF-IDF sobre los candidatos en cada llamada: un lote fijo de 500 abiertos
+    pool = svc.get_requirements_by_ids(ctx.rng.sample(ctx.open_ids, min(500, len(ctx.open_ids))))
+    return {
+        "services.list_chambers": lambda: svc.list_chambers(),
+        "services.list_users.chamber": lambda: svc.list_users(chamber_id=ctx.chamber()),
+        "services.list_requirements.chamber": lambda: svc.list_requirements({"status": "open", "chamber_id": ctx.chamber()}),
+        "services.list_requirements_page": lambda: svc.list_requirements_page({"status": "open"}, limit=50),
+        "services.list_requirements_page.filters": lambda: svc.list_requirements_page(
+            {"status": "open", "category": ctx.rng.choice(list(TOPICS)), "location": ctx.rng.choice(LOCATIONS)}, limit=50),
+        "services.list_requirements_page.search": lambda: svc.list_requirements_page({"status": "open", "q": ctx.term()}, limit=50),
+        "services.get_requirement": lambda: svc.get_requirement(ctx.requirement()),
+        "services.get_requirements_by_ids": page_rows,
+        "services.match_counts": lambda: svc.match_counts(ctx.page()),
+        "services.suggest_matches": lambda: svc.suggest_matches(svc.get_requirement(ctx.requirement()), top_k=5),
+        "matching.top_matches": top_matches,
+        "services.explain_matches": lambda: svc.explain_matches(svc.get_requirement(ctx.requirement()), top_k=5),
+        "services.contact_status": lambda: svc.contact_status(ctx.user(), tuple((r["id"], r["user_id"]) for r in rows)),
+        "services.can_view_contact": lambda: svc.can_view_contact(ctx.user(), ctx.user(), ctx.requirement()),
+        "services.list_inbox": lambda: svc.list_inbox(ctx.rng.choice(ctx.busy_users)),
+        "services.list_sent": lambda: svc.list_sent(ctx.rng.choice(ctx.busy_users)),
+        "services.admin_metrics": lambda: svc.admin_metrics(),
+        "services.admin_metrics.chamber": lambda: svc.admin_metrics(chamber_id=ctx.chamber()),
+        "services.create_requirement": publish,
+        "services.create_contact_request": contact,
+        "services.respond_contact_request": respond,
+        "analytics.period_summary": lambda: analytics.period_summary(),
+        "analytics.requirement_series": lambda: analytics.requirement_series(freq="W", by="category"),
+        "auth.authenticate": lambda: auth.authenticate(f"u{ctx.rng.randint(1, ctx.n_users - 1)}@cpf", password),
+        "sessions.resolve": lambda: sessions.resolve(token),
+        "notifications.unread_count": lambda: notifications.unread_count(ctx.user()),
+    }
+
+
+def run(only=None, use_cache=False, min_runs=20, min_seconds=0.5, seed=0):
+    cache.ENABLED = use_cache
+    ctx = Context(seed)
+    out = {}
+    for name, fn in cases(ctx).items():
+        if only and not any(s in name for s in only):
+            continue
+        out[name] = report.summarize(report.measure(fn, min_runs=min_runs, min_seconds=min_seconds))
+    db.flush_audit()
+    return out
+
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+
+import db
+from benchmarks import report
+from benchmarks.services_micro import Context
+from benchmarks.synth import TOPICS, LOCATIONS
+
+# Simulador de sesiones concurrentes: cada hilo es un usuario de la app recorriendo la capa de
+# servicios con la mezcla de acciones de una sesión real (navegar, buscar, ver detalle con
+# sugerencias, sondear notificaciones, bandeja, contactar, responder, publicar, ingresar).
+# Con la caché de services activa, como corre la app. Latencia por acción y throughput total.
+MIX = {
+    "browse": 30,
+    "search": 15,
+    "detail": 20,
+    "poll": 15,
+    "inbox": 6,
+    "contact": 5,
+    "respond": 3,
+    "publish": 4,
+    "login": 2,
+}
+
+
+def actions(ctx, rng, user_id, password):
+    import auth
+    import notifications
+    import services as svc
+    import sessions
+
+    def browse():
+        rows, _ = svc.list_requirements_page({"status": "open"} if rng.random() < 0.7 else
+                                             {"status": "open", "category": rng.choice(list(TOPICS))}, limit=50)
+        svc.match_counts([r["id"] for r in rows])
+        svc.contact_status(user_id, tuple((r["id"], r["user_id"]) for r in rows))
+
+    def search():
+        svc.list_requirements_page({"status": "open", "q": ctx.term(), "location": rng.choice(LOCATIONS)}, limit=50)
+
+    def detail():
+        r = svc.get_requirement(ctx.requirement())
+        svc.explain_matches(r, top_k=5)
+        svc.can_view_contact(user_id, r["user_id"], r["id"])
+
+    def inbox():
+        svc.list_inbox(user_id)
+        svc.list_sent(user_id)
+
+    def contact():
+        r = svc.get_requirement(ctx.requirement())
+        if r["user_id"] != user_id:
+            svc.create_contact_request(user_id, user_id, r["user_id"], r["id"])
+
+    def respond():
+        pending = [r for r in svc.list_inbox(user_id) if r["status"] == "pending"]
+        if pending:
+            svc.respond_contact_request(user_id, pending[0]["id"], rng.choice(["accepted", "declined"]))
+
+    def publish():
+        topic = rng.choice(list(TOPICS))
+        item = rng.choice(TOPICS[topic])
+        svc.create_requirement(user_id, user_id, ctx.chamber(), rng.choice(["offer", "need"]), f"Sesión simulada: {item}",
+                               f"Requerimiento de {item} publicado por el simulador de sesiones", item, topic,
+                               rng.choice(LOCATIONS), "Media")
+
+    def login():
+        u = auth.authenticate(f"u{user_id - 1}@cpf", password)
+        sessions.resolve(sessions.create_session(u["id"]))
+
+    return {
+        "browse": browse, "search": search, "detail": detail, "poll": lambda: notifications.unread_count(user_id),
+        "inbox": inbox, "contact": contact, "respond": respond, "publish": publish, "login": login,
+    }
+
+
+def run(sessions=16, seconds=10.0, think_ms=0.0, seed=0, password="clave"):
+    import auth
+    ctx = Context(seed)
+    names, weights = list(MIX), list(MIX.values())
+    latencies = [{name: [] for name in names} for _ in range(sessions)]
+    errors = [0] * sessions
+    stop = time.perf_counter() + seconds
+
+    def session(k):
+        rng = random.Random(seed * 1000 + k)
+        # Mitad de las sesiones con usuarios de bandeja cargada, el resto al azar
+        user_id = ctx.busy_users[k % len(ctx.busy_users)] if k % 2 == 0 and ctx.busy_users else rng.randint(2, ctx.n_users)
+        todo = actions(ctx, rng, user_id, password)
+        while time.perf_counter() < stop:
+            name = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                todo[name]()
+            except (auth.HashingBusy, *db.DB_ERRORS):
+                errors[k] += 1
+                continue
+            latencies[k][name].append(time.perf_counter() - t0)
+            if think_ms:
+                time.sleep(rng.expovariate(1000 / think_ms))
+
+    threads = [threading.Thread(target=session, args=(k,), name=f"cpf-sim-{k}") for k in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    db.flush_audit()
+    out = {}
+    for name in names:
+        samples = [x for per in latencies for x in per[name]]
+        # Desglose por acción: depende de la mezcla sorteada, se compara solo el total
+        out[f"sim.{name}"] = {**report.summarize(samples), "ops_per_s": round(len(samples) / elapsed, 1), "informational": True}
+    total = sum(v["n"] for v in out.values())
+    out["sim.total"] = {"n": total, "ops_per_s": round(total / elapsed, 1), "errors": sum(errors), "sessions": sessions}
+    return out
+
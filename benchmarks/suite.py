@@ -0,0 +1,105 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import auth
+import cache
+import db
+import notifications
+from benchmarks import report, services_micro, sessions_sim, synth
+
+# Suite de rendimiento: genera (o reutiliza) una base sintética a la escala pedida, corre los
+# microbenchmarks de servicios y el simulador de sesiones concurrentes, guarda los resultados en
+# JSON y los compara con un baseline guardado (sale con 1 si hay regresiones).
+#   python -m benchmarks.suite --scale 10k --out resultados.json
+#   python -m benchmarks.suite --scale 10k --save-baseline     # fija benchmarks/baselines/10k.json
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines")
+PASSWORD = "clave"
+
+
+def prepare(scale, path=None, url=None, seed=0, rounds=4):
+    # Base de la escala pedida. Con --db se genera una vez y cada corrida trabaja sobre una copia,
+    # así las escrituras de una corrida no cambian el punto de partida de la siguiente.
+    auth.BCRYPT_ROUNDS = rounds
+    password_hash = auth._hash(PASSWORD, rounds)
+    t0 = time.perf_counter()
+    if url:
+        db.use_database(url)
+        db.init_db()
+        return synth.populate(synth.SCALES[scale], seed=seed, password_hash=password_hash), round(time.perf_counter() - t0, 1)
+    work = os.path.join(tempfile.mkdtemp(prefix="cpf-suite-"), f"suite-{scale}.db")
+    source = path or work
+    sizes = None
+    db.use_database(source)
+    db.init_db()
+    with db.connection() as c:
+        ready = c.execute("SELECT COUNT(*) FROM requirements").fetchone()[0] >= synth.SCALES[scale]
+    if not ready:
+        sizes = synth.populate(synth.SCALES[scale], seed=seed, password_hash=password_hash)
+    db.flush_audit()
+    db.pool.close_all()
+    if source != work:
+        shutil.copyfile(source, work)
+    db.use_database(work)
+    db.init_db()
+    return sizes, round(time.perf_counter() - t0, 1)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Microbenchmarks de servicios + sesiones concurrentes, con comparación contra un baseline")
+    ap.add_argument("--scale", choices=list(synth.SCALES), default="10k")
+    ap.add_argument("--db", default=None, help="archivo SQLite a generar/reutilizar (por defecto, uno temporal)")
+    ap.add_argument("--db-url", default=None, help="URL de una base Postgres vacía")
+    ap.add_argument("--only", choices=["micro", "sim"], default=None)
+    ap.add_argument("--cases", nargs="*", help="subcadenas de los microbenchmarks a correr")
+    ap.add_argument("--cache", action="store_true", help="microbenchmarks con la caché de services activa")
+    ap.add_argument("--sessions", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--rounds", type=int, default=4, help="costo bcrypt de los usuarios sintéticos")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="archivo JSON de resultados")
+    ap.add_argument("--baseline", default=None, help="baseline a comparar (por defecto benchmarks/baselines/<escala>.json)")
+    ap.add_argument("--save-baseline", action="store_true", help="guardar estos resultados como baseline de la escala")
+    ap.add_argument("--tolerance", type=float, default=report.TOLERANCE)
+    args = ap.parse_args(argv)
+
+    # Las notificaciones quedan en el outbox: su despacho no forma parte de lo medido
+    notifications.OUTBOX_DISPATCH = False
+    sizes, seeded_s = prepare(args.scale, args.db, args.db_url, args.seed, args.rounds)
+    results = {"scale": args.scale, "sizes": sizes, "seed_s": seeded_s, "env": report.environment(),
+               "created_at": db.now_iso(), "benchmarks": {}}
+    if args.only in (None, "micro"):
+        results["benchmarks"].update(services_micro.run(args.cases, args.cache, seed=args.seed))
+    if args.only in (None, "sim"):
+        cache.ENABLED = True
+        cache.invalidate()
+        results["benchmarks"].update(sessions_sim.run(args.sessions, args.seconds, seed=args.seed, password=PASSWORD))
+    db.pool.close_all()
+
+    width = max(len(name) for name in results["benchmarks"])
+    for name, stats in sorted(results["benchmarks"].items()):
+        print(f"{name:<{width}}  " + "  ".join(f"{k}={v}" for k, v in stats.items() if k != "informational"))
+    if args.out:
+        report.save(results, args.out)
+    baseline = args.baseline or os.path.join(BASELINES, f"{args.scale}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline), exist_ok=True)
+        report.save(results, baseline)
+        print(f"baseline guardado en {baseline}")
+        return
+    if not os.path.exists(baseline):
+        print(f"sin baseline en {baseline} (crearlo con --save-baseline)")
+        return
+    regressions = report.compare(results, report.load(baseline), args.tolerance)
+    for name, metric, before, after, change in regressions:
+        print(f"REGRESIÓN {name} {metric}: {before} -> {after} ({change:+.0%})")
+    if regressions:
+        sys.exit(1)
+    print(f"sin regresiones frente a {baseline} (tolerancia {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
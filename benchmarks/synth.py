@@ -0,0 +1,153 @@
+import random
+from datetime import datetime, timedelta
+
+import db
+
+# Vocabulario por rubro para que los textos sintéticos tengan vecinos "reales"
+TOPICS = {
+    "metalurgia": ["caño", "tubo", "acero", "inoxidable", "chapa", "perfil", "soldadura", "mecanizado", "torneado", "galvanizado", "bulón", "fundición"],
+    "logistica": ["flete", "transporte", "camión", "depósito", "distribución", "carga", "semirremolque", "cadena de frío", "pallet", "envío", "última milla"],
+    "alimentos": ["harina", "aceite", "envasado", "conserva", "lácteos", "frigorífico", "molienda", "granos", "soja", "maíz", "trigo", "packaging"],
+    "construccion": ["hormigón", "cemento", "ladrillo", "obra", "arena", "encofrado", "grúa", "excavadora", "pintura", "aberturas", "techado"],
+    "electricidad": ["tablero", "cable", "transformador", "motor", "variador", "iluminación", "led", "instalación", "generador", "automatización", "PLC"],
+    "plasticos": ["inyección", "extrusión", "polietileno", "PVC", "bolsa", "film", "matriz", "soplado", "reciclado", "pellet", "envase"],
+    "textil": ["tela", "algodón", "confección", "bordado", "uniforme", "estampado", "hilado", "tejido", "indumentaria", "calzado"],
+    "servicios": ["consultoría", "software", "mantenimiento", "capacitación", "auditoría", "contable", "seguridad", "limpieza", "certificación", "ISO"],
+}
+COMMON = ["necesitamos", "ofrecemos", "proveedor", "cantidad", "mensual", "urgente", "calidad", "entrega", "plazo",
+          "especificación", "medida", "norma", "lote", "industrial", "servicio", "local", "regional", "zona"]
+LOCATIONS = ["Rosario", "Córdoba", "Mendoza", "Buenos Aires", "Santa Fe", "Rafaela", "Tucumán", "Neuquén", "Bahía Blanca", "Mar del Plata"]
+URGENCIES = ["Baja", "Media", "Alta", "Crítica"]
+
+
+def requirement_row(rng, rid, req_type=None):
+    topic = rng.choice(list(TOPICS))
+    words = TOPICS[topic]
+    title = " ".join(rng.sample(words, 3))
+    desc = " ".join(rng.choice(words) if rng.random() < 0.6 else rng.choice(COMMON) for _ in range(rng.randint(12, 40)))
+    return {
+        "id": rid,
+        "req_type": req_type or rng.choice(["offer", "need"]),
+        "title": title,
+        "description": desc,
+        "tags": ", ".join(rng.sample(words, 2)),
+        "category": topic,
+        "location": rng.choice(LOCATIONS),
+        "urgency": rng.choice(URGENCIES),
+    }
+
+
+def requirement_rows(n, seed=0, start_id=1):
+    rng = random.Random(seed)
+    return [requirement_row(rng, start_id + i) for i in range(n)]
+
+
+# Texto con forma de aviso real (para la suite de benchmarks): frases por tipo en lugar de palabras sueltas
+NEED_TITLES = ["Necesitamos {item}", "Busco proveedor de {item}", "Se requiere {item} {qualifier}", "Compra de {item}"]
+OFFER_TITLES = ["Ofrecemos {item}", "Servicio de {item} {qualifier}", "Venta de {item}", "Proveemos {item} {qualifier}"]
+NEED_TEXT = [
+    "Necesitamos {item} {qualifier} para {uso} en {location}.",
+    "Buscamos proveedor {freq} de {item}; entrega {plazo}.",
+    "Cantidad estimada: {qty} unidades de {item}, {norma}.",
+    "Se valoran antecedentes en {item2} y {item3}.",
+]
+OFFER_TEXT = [
+    "Ofrecemos {item} {qualifier} con entrega en {location} y zona.",
+    "Capacidad {freq} de {qty} unidades; {norma}.",
+    "También trabajamos {item2} y {item3}, plazos {plazo}.",
+    "Atención a empresas de {uso}.",
+]
+FILL = {
+    "qualifier": ["de primera calidad", "a medida", "industrial", "certificado", "nacional", "importado", "en stock"],
+    "uso": ["planta industrial", "obra en curso", "exportación", "línea de producción", "depósito propio", "mantenimiento"],
+    "freq": ["mensual", "semanal", "anual", "por proyecto"],
+    "plazo": ["inmediata", "en 15 días", "a 30 días", "a convenir"],
+    "norma": ["con factura A", "según norma IRAM", "con certificación ISO 9001", "con seguro de carga", "sin requisitos especiales"],
+}
+COMPANY_SUFFIX = ["S.A.", "S.R.L.", "e Hijos", "Industrial", "del Litoral", "Argentina", "Hnos."]
+# Escalas de la suite: requerimientos; usuarios, cámaras y solicitudes de contacto se derivan
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def realistic_row(rng, rid, req_type=None):
+    req_type = req_type or rng.choice(["offer", "need"])
+    topic = rng.choice(list(TOPICS))
+    item, item2, item3 = rng.sample(TOPICS[topic], 3)
+    location = rng.choice(LOCATIONS)
+    fill = {k: rng.choice(v) for k, v in FILL.items()}
+    fill.update(item=item, item2=item2, item3=item3, location=location, qty=rng.choice([50, 100, 500, 1000, 5000]))
+    titles, text = (NEED_TITLES, NEED_TEXT) if req_type == "need" else (OFFER_TITLES, OFFER_TEXT)
+    return {
+        "id": rid,
+        "req_type": req_type,
+        "title": rng.choice(titles).format(**fill),
+        "description": " ".join(s.format(**fill) for s in text[:rng.randint(2, len(text))]),
+        "tags": ", ".join((item, item2)),
+        "category": topic,
+        "location": location,
+        "urgency": rng.choice(URGENCIES),
+    }
+
+
+def populate(n_requirements, seed=0, password_hash="x", batch=50000):
+    # Base completa sobre db (ya apuntada con use_database e init_db): cámaras, usuarios con empresa,
+    # requerimientos repartidos en el último año y un grafo de contactos concentrado en usuarios
+    # activos (pocos publican mucho). Devuelve los tamaños generados.
+    rng = random.Random(seed)
+    n_chambers = max(10, n_requirements // 2000)
+    n_users = max(50, n_requirements // 5)
+    n_contacts = n_requirements // 2
+    now = datetime.utcnow()
+
+    def stamp(days_ago):
+        return (now - timedelta(days=days_ago)).isoformat(timespec="seconds")
+
+    with db.transaction() as c:
+        c.executemany(
+            "INSERT INTO chambers(name, province, city, created_at) VALUES(?,?,?,?)",
+            [(f"Cámara de {rng.choice(list(TOPICS)).capitalize()} de {rng.choice(LOCATIONS)} {i}", "", "", stamp(400))
+             for i in range(n_chambers)]
+        )
+        for start in range(0, n_users, batch):
+            c.executemany(
+                "INSERT INTO users(email, password_hash, name, company, phone, chamber_id, role, created_at) VALUES(?,?,?,?,?,?,?,?)",
+                [(f"u{i}@cpf", password_hash, f"Usuario {i}",
+                  f"{rng.choice(TOPICS[rng.choice(list(TOPICS))]).capitalize()} {rng.choice(COMPANY_SUFFIX)} {i}",
+                  f"+54 9 341 {rng.randrange(10 ** 7):07d}", 1 + i % n_chambers,
+                  "admin" if i == 0 else "chamber_admin" if i <= n_chambers else "user", stamp(400 - i * 30 // n_users))
+                 for i in range(start, min(n_users, start + batch))]
+            )
+    # Autor de cada requerimiento con distribución sesgada a los primeros usuarios (pocos publican mucho)
+    owners = [1 + int(n_users * rng.random() ** 3) for _ in range(n_requirements)]
+    for start in range(0, n_requirements, batch):
+        rows = []
+        for i in range(start, min(n_requirements, start + batch)):
+            r = realistic_row(rng, i + 1)
+            rows.append((owners[i], 1 + (owners[i] - 1) % n_chambers, r["req_type"], r["title"], r["description"], r["tags"],
+                         r["category"], r["location"], r["urgency"], "open" if rng.random() < 0.85 else "closed",
+                         stamp(365 * (n_requirements - i) / n_requirements), stamp(0)))
+        with db.transaction() as c, db.deferred_fts(c):
+            c.executemany(
+                """INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency,
+                                            status, created_at, updated_at) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""",
+                rows
+            )
+    with db.transaction() as c:
+        for start in range(0, n_contacts, batch):
+            rows = []
+            for _ in range(min(batch, n_contacts - start)):
+                req = rng.randrange(n_requirements)
+                sender = 1 + int(n_users * rng.random() ** 2)
+                if sender == owners[req]:
+                    continue
+                status = rng.choices(["pending", "accepted", "declined"], [0.4, 0.45, 0.15])[0]
+                days = rng.uniform(0, 365)
+                rows.append((sender, owners[req], req + 1, status, stamp(days),
+                             None if status == "pending" else stamp(days - rng.uniform(0, min(days, 5)))))
+            c.executemany(
+                """INSERT INTO contact_requests(from_user_id, to_user_id, requirement_id, status, created_at, responded_at)
+                   VALUES(?,?,?,?,?,?) ON CONFLICT DO NOTHING""",
+                rows
+            )
+        db.rebuild_contact_grants(c)
+    return {"chambers": n_chambers, "users": n_users, "requirements": n_requirements, "contacts": n_contacts}
@@ -0,0 +1,409 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from db import connection, transaction, now_iso, log, deferred_fts, stream
+from cache import invalidate
+from auth import hash_passwords
+import matching
+
+# Importación/exportación masiva. Las filas se leen en streaming, se validan contra
+# referencias cargadas una sola vez y se insertan por lotes con executemany dentro de
+# una transacción por lote (un único registro de auditoría por lote, no por fila).
+BATCH_SIZE = int(os.environ.get("CPF_BULK_BATCH", "5000"))
+MAX_ERRORS = 1000
+FORMATS = ("csv", "jsonl", "xlsx")
+
+REQ_TYPES = {"offer": "offer", "oferta": "offer", "ofrezco": "offer",
+             "need": "need", "necesidad": "need", "necesito": "need"}
+ROLES = ("user", "chamber_admin", "admin")
+
+REQUIREMENT_EXPORT = ["id", "req_type", "title", "description", "tags", "category", "location", "urgency", "status",
+                      "created_at", "updated_at", "email", "company", "chamber"]
+AUDIT_EXPORT = ["id", "actor_user_id", "action", "details", "created_at"]
+
+
+def detect_format(name):
+    ext = os.path.splitext(name or "")[1].lower().lstrip(".")
+    if ext in ("xls", "xlsx"):
+        return "xlsx"
+    if ext in ("jsonl", "ndjson", "json"):
+        return "jsonl"
+    return "csv"
+
+
+def _text(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, encoding="utf-8-sig", newline="")
+    if isinstance(source, io.TextIOBase):
+        return source
+    # Archivos binarios (p. ej. el file_uploader de Streamlit)
+    return io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+
+
+def read_rows(source, fmt="csv"):
+    # Genera (nro_de_línea, dict) sin cargar el archivo completo
+    if fmt == "xlsx":
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("Para importar Excel instalá openpyxl (pip install openpyxl).")
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h or "").strip().lower() for h in next(rows, [])]
+            for line, values in enumerate(rows, start=2):
+                if any(v is not None for v in values):
+                    yield line, {h: ("" if v is None else str(v)) for h, v in zip(header, values) if h}
+        finally:
+            wb.close()
+        return
+    f = _text(source)
+    try:
+        if fmt == "jsonl":
+            for line, raw in enumerate(f, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    item = json.loads(raw)
+                except ValueError as e:
+                    yield line, {"__error__": f"JSON inválido: {e}"}
+                    continue
+                if not isinstance(item, dict):
+                    yield line, {"__error__": "Se esperaba un objeto JSON por línea"}
+                    continue
+                yield line, {str(k).strip().lower(): ("" if v is None else str(v)) for k, v in item.items()}
+        else:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [h.strip().lower() for h in reader.fieldnames or []]
+            for line, item in enumerate(reader, start=2):
+                yield line, {k: (v or "").strip() for k, v in item.items() if k}
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _chamber_lookup(c):
+    by_name, ids = {}, set()
+    for r in c.execute("SELECT id, name FROM chambers"):
+        by_name[r["name"].strip().lower()] = r["id"]
+        ids.add(r["id"])
+    return by_name, ids
+
+
+def _resolve_chamber(value, by_name, ids):
+    value = (value or "").strip()
+    if not value:
+        return None, None
+    if value.isdigit() and int(value) in ids:
+        return int(value), None
+    cid = by_name.get(value.lower())
+    if cid is None:
+        return None, f"Cámara inexistente: {value}"
+    return cid, None
+
+
+def _report(kind):
+    return {"kind": kind, "read": 0, "inserted": 0, "failed": 0, "errors": [], "seconds": 0.0}
+
+
+def _fail(report, line, msg):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_ERRORS:
+        report["errors"].append((line, msg))
+
+
+def _parse_created(value, now):
+    # Mismo formato que now_iso() (UTC, segundos): de created_at dependen los rollups diarios, el orden
+    # de los listados y la recencia del matching
+    value = (value or "").strip()
+    if not value:
+        return now, None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None, f"Fecha inválida: {value} (usar AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)"
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat(timespec="seconds"), None
+
+
+def _validate_requirement(item, users, by_name, ids, chamber_id, now):
+    email = (item.get("email") or "").strip().lower()
+    owner = users.get(email)
+    if owner is None:
+        return None, f"Usuario inexistente: {email or '(vacío)'}"
+    req_type = REQ_TYPES.get((item.get("req_type") or item.get("tipo") or "").strip().lower())
+    if req_type is None:
+        return None, "Tipo inválido (offer/need)"
+    title = (item.get("title") or "").strip()
+    description = (item.get("description") or "").strip()
+    if not title or not description:
+        return None, "Título y descripción son obligatorios"
+    status = (item.get("status") or "open").strip().lower()
+    if status not in ("open", "closed"):
+        return None, f"Estado inválido: {status}"
+    if chamber_id:
+        if owner[1] != chamber_id:
+            return None, "El usuario no pertenece a la cámara"
+        cid = chamber_id
+    else:
+        cid, err = _resolve_chamber(item.get("chamber"), by_name, ids)
+        if err:
+            return None, err
+        cid = cid or owner[1]
+    created, err = _parse_created(item.get("created_at"), now)
+    if err:
+        return None, err
+    return (owner[0], cid, req_type, title, description, (item.get("tags") or "").strip(),
+            (item.get("category") or "").strip(), (item.get("location") or "").strip(),
+            (item.get("urgency") or "").strip(), status, created, now), None
+
+
+def import_requirements(source, actor_user_id, fmt="csv", chamber_id=None, batch_size=None):
+    # chamber_id acota la importación a una cámara (admin de cámara)
+    report = _report("requirements")
+    t0 = time.perf_counter()
+    with connection() as c:
+        users = {r["email"]: (r["id"], r["chamber_id"])
+                 for r in c.execute("SELECT id, email, chamber_id FROM users WHERE is_active = 1")}
+        by_name, ids = _chamber_lookup(c)
+    now = now_iso()
+    for batch in _batches(read_rows(source, fmt), batch_size or BATCH_SIZE):
+        values = []
+        for line, item in batch:
+            report["read"] += 1
+            if "__error__" in item:
+                _fail(report, line, item["__error__"])
+                continue
+            row, err = _validate_requirement(item, users, by_name, ids, chamber_id, now)
+            if err:
+                _fail(report, line, err)
+            else:
+                values.append(row)
+        if not values:
+            continue
+        with transaction() as c, deferred_fts(c):
+            c.executemany(
+                """INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency,
+                                            status, created_at, updated_at) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""",
+                values
+            )
+            log(actor_user_id, "bulk_import", f"kind=requirements, rows={len(values)}")
+        report["inserted"] += len(values)
+    if report["inserted"]:
+        invalidate("requirements", "metrics", "matches")
+        matching.index_stale()
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+def import_users(source, actor_user_id, fmt="csv", chamber_id=None, batch_size=None):
+    # El hash bcrypt domina el costo: cada lote se hashea en paralelo en el pool de auth
+    report = _report("users")
+    t0 = time.perf_counter()
+    with connection() as c:
+        seen = {r["email"] for r in c.execute("SELECT email FROM users")}
+        by_name, ids = _chamber_lookup(c)
+        actor = c.execute("SELECT role FROM users WHERE id=?", (actor_user_id,)).fetchone() if actor_user_id else None
+    # Solo un admin global (o la CLI sin --actor, que ya tiene acceso a la base) asigna roles de
+    # gestión; para el resto, cualquier rol distinto de "user" rechaza la fila
+    allowed = ROLES if actor_user_id is None or (actor and actor["role"] == "admin") else ("user",)
+    now = now_iso()
+    for batch in _batches(read_rows(source, fmt), batch_size or BATCH_SIZE):
+        pending = []
+        for line, item in batch:
+            report["read"] += 1
+            if "__error__" in item:
+                _fail(report, line, item["__error__"])
+                continue
+            email = (item.get("email") or "").strip().lower()
+            password = item.get("password") or ""
+            name, company = (item.get("name") or "").strip(), (item.get("company") or "").strip()
+            role = (item.get("role") or "user").strip().lower()
+            if "@" not in email:
+                _fail(report, line, f"Email inválido: {email or '(vacío)'}")
+            elif email in seen:
+                _fail(report, line, f"Email duplicado: {email}")
+            elif not password or not name or not company:
+                _fail(report, line, "Contraseña, nombre y empresa son obligatorios")
+            elif role not in ROLES or (chamber_id and role == "admin"):
+                _fail(report, line, f"Rol inválido: {role}")
+            elif role not in allowed:
+                _fail(report, line, f"Sin permiso para asignar el rol {role}")
+            else:
+                cid, err = (chamber_id, None) if chamber_id else _resolve_chamber(item.get("chamber"), by_name, ids)
+                if err:
+                    _fail(report, line, err)
+                    continue
+                seen.add(email)
+                pending.append(((email, name, company, (item.get("phone") or "").strip(), cid, role), password))
+        if not pending:
+            continue
+        hashes = hash_passwords([p[1] for p in pending])
+        values = [(u[0], h, u[1], u[2], u[3], u[4], u[5], now) for (u, _), h in zip(pending, hashes)]
+        with transaction() as c:
+            c.executemany(
+                "INSERT INTO users(email, password_hash, name, company, phone, chamber_id, role, created_at) VALUES(?,?,?,?,?,?,?,?)",
+                values
+            )
+            log(actor_user_id, "bulk_import", f"kind=users, rows={len(values)}")
+        report["inserted"] += len(values)
+    if report["inserted"]:
+        invalidate("users", "metrics")
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+def import_chambers(source, actor_user_id, fmt="csv", batch_size=None):
+    report = _report("chambers")
+    t0 = time.perf_counter()
+    with connection() as c:
+        by_name, _ = _chamber_lookup(c)
+    now = now_iso()
+    for batch in _batches(read_rows(source, fmt), batch_size or BATCH_SIZE):
+        values = []
+        for line, item in batch:
+            report["read"] += 1
+            name = (item.get("name") or "").strip()
+            if "__error__" in item:
+                _fail(report, line, item["__error__"])
+            elif not name:
+                _fail(report, line, "Nombre requerido")
+            elif name.lower() in by_name:
+                _fail(report, line, f"Cámara duplicada: {name}")
+            else:
+                by_name[name.lower()] = None
+                values.append((name, (item.get("province") or "").strip(), (item.get("city") or "").strip(), now))
+        if values:
+            with transaction() as c:
+                c.executemany("INSERT INTO chambers(name, province, city, created_at) VALUES(?,?,?,?)", values)
+                log(actor_user_id, "bulk_import", f"kind=chambers, rows={len(values)}")
+            report["inserted"] += len(values)
+    if report["inserted"]:
+        invalidate("chambers", "metrics")
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+
+IMPORTERS = {
+    "requirements": import_requirements,
+    "users": import_users,
+    "chambers": import_chambers,
+}
+
+
+def _write_rows(out, fmt, columns, batches):
+    # Escribe a medida que llega cada bloque (db.stream); nunca materializa el resultado completo
+    n = 0
+    writer = csv.writer(out) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+    for rows in batches:
+        if writer:
+            writer.writerows(tuple(r) for r in rows)
+        else:
+            out.write("".join(json.dumps(dict(zip(columns, tuple(r))), ensure_ascii=False) + "\n" for r in rows))
+        n += len(rows)
+    return n
+
+
+def export_requirements(out, fmt="csv", chamber_id=None, status=None, chunk=None):
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Formato de exportación inválido: {fmt}")
+    where, params = ["1=1"], []
+    if chamber_id:
+        where.append("r.chamber_id = ?")
+        params.append(chamber_id)
+    if status:
+        where.append("r.status = ?")
+        params.append(status)
+    with connection() as c:
+        batches = stream(c, f"""
+            SELECT r.id, r.req_type, r.title, r.description, r.tags, r.category, r.location, r.urgency, r.status,
+                   r.created_at, r.updated_at, u.email, u.company, ch.name
+            FROM requirements r
+            JOIN users u ON u.id = r.user_id
+            LEFT JOIN chambers ch ON ch.id = r.chamber_id
+            WHERE {' AND '.join(where)}
+            ORDER BY r.id
+        """, params, chunk or BATCH_SIZE)
+        return _write_rows(out, fmt, REQUIREMENT_EXPORT, batches)
+
+
+def export_audit(out, fmt="csv", since=None, chunk=None):
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Formato de exportación inválido: {fmt}")
+    where, params = "", []
+    if since:
+        where, params = "WHERE created_at >= ?", [since]
+    with connection() as c:
+        batches = stream(c, f"SELECT {', '.join(AUDIT_EXPORT)} FROM audit_log {where} ORDER BY id", params, chunk or BATCH_SIZE)
+        return _write_rows(out, fmt, AUDIT_EXPORT, batches)
+
+
+EXPORTERS = {
+    "requirements": export_requirements,
+    "audit": export_audit,
+}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Importación/exportación masiva de CPF")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import", help="Importa cámaras, usuarios o requerimientos")
+    imp.add_argument("kind", choices=sorted(IMPORTERS))
+    imp.add_argument("path")
+    imp.add_argument("--actor", type=int, default=None, help="ID del usuario al que se atribuye en auditoría")
+    imp.add_argument("--format", choices=FORMATS, default=None)
+    imp.add_argument("--chamber", type=int, default=None, help="Acota la importación a una cámara")
+    imp.add_argument("--batch", type=int, default=None)
+    exp = sub.add_parser("export", help="Exporta requerimientos o auditoría")
+    exp.add_argument("kind", choices=sorted(EXPORTERS))
+    exp.add_argument("path", help="Archivo de salida ('-' para stdout)")
+    exp.add_argument("--format", choices=("csv", "jsonl"), default=None)
+    args = ap.parse_args(argv)
+
+    from db import init_db, flush_audit
+    init_db()
+    if args.cmd == "import":
+        fmt = args.format or detect_format(args.path)
+        kwargs = {"fmt": fmt, "batch_size": args.batch}
+        if args.kind != "chambers":
+            kwargs["chamber_id"] = args.chamber
+        report = IMPORTERS[args.kind](args.path, args.actor, **kwargs)
+        flush_audit()
+        for line, msg in report["errors"]:
+            print(f"línea {line}: {msg}", file=sys.stderr)
+        print(f"{report['kind']}: {report['inserted']} insertadas, {report['failed']} con error, "
+              f"{report['read']} leídas en {report['seconds']:.1f}s")
+        return 1 if report["failed"] else 0
+    fmt = args.format or ("jsonl" if detect_format(args.path) == "jsonl" else "csv")
+    t0 = time.perf_counter()
+    if args.path == "-":
+        n = EXPORTERS[args.kind](sys.stdout, fmt)
+    else:
+        with open(args.path, "w", encoding="utf-8", newline="") as out:
+            n = EXPORTERS[args.kind](out, fmt)
+    print(f"{args.kind}: {n} filas exportadas en {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Caché a nivel de proceso, compartida por todas las sesiones de Streamlit.
+# Cada espacio de nombres tiene TTL propio y se invalida explícitamente desde las escrituras.
+ENABLED = os.environ.get("CPF_CACHE", "1") != "0"
+MAX_ENTRIES = 2048
+
+
+class Namespace:
+
+    def __init__(self, name, ttl, maxsize=MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, item[1]
+            if item is not None:
+                del self._data[key]
+            self.stats["misses"] += 1
+            return False, None
+
+    def put(self, key, value, generation):
+        with self._lock:
+            # Si hubo una invalidación mientras se calculaba, el valor ya nació viejo
+            if generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+            self.stats["invalidations"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["entries"] = len(self._data)
+            out["ttl_seconds"] = self.ttl
+        total = out["hits"] + out["misses"]
+        out["hit_ratio"] = round(out["hits"] / total, 4) if total else 0.0
+        return out
+
+
+_namespaces = {}
+_registry_lock = threading.Lock()
+
+
+def namespace(name, ttl):
+    with _registry_lock:
+        ns = _namespaces.get(name)
+        if ns is None:
+            ns = _namespaces[name] = Namespace(name, ttl)
+        return ns
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def cached(name, ttl):
+    ns = namespace(name, ttl)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            key = (fn.__name__, _freeze(args), _freeze(kwargs))
+            hit, value = ns.get(key)
+            if hit:
+                return value
+            generation = ns.generation
+            value = fn(*args, **kwargs)
+            ns.put(key, value, generation)
+            return value
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+def invalidate(*names):
+    for name in names:
+        ns = _namespaces.get(name)
+        if ns is not None:
+            ns.clear()
+
+
+def invalidate_all():
+    invalidate(*list(_namespaces))
+
+
+def stats():
+    return {name: ns.snapshot() for name, ns in sorted(_namespaces.items())}
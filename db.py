@@ -1,8 +1,18 @@
+import atexit
+import logging
 import os
+import queue
+import re
+import secrets
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 
+import instrumentation
+
 APP_NAME = "CPF"
 
 
@@ -15,17 +25,287 @@ def _data_dir() -> Path:
 
 
 DB_PATH = _data_dir() / "cpf.db"
+# Con una URL postgres:// o postgresql:// la app corre sobre Postgres (db_postgres.py) en lugar del archivo SQLite
+DB_URL = os.environ.get("CPF_DB_URL", "")
+
+
+# Perfiles de PRAGMAs aplicados al abrir cada conexión. "safe" replica los valores por defecto de SQLite.
+DB_PROFILES = {
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 10000,
+        "cache_size": -65536,  # KiB (64 MB)
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+DB_PROFILE = os.environ.get("CPF_DB_PROFILE", "performance")
+
+POOL_SIZE = int(os.environ.get("CPF_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT_SECONDS = 30
+# Se recicla la conexión al devolverla si superó esta antigüedad
+MAX_CONN_LIFETIME_SECONDS = 3600
+CACHED_STATEMENTS = 256
+# Errores de base reintentables (auditoría); con Postgres se suma psycopg.Error
+DB_ERRORS = (sqlite3.Error,)
+
+
+def is_postgres():
+    return DB_URL.startswith(("postgres://", "postgresql://"))
+
+
+def configure(c, profile=None):
+    for name, value in DB_PROFILES[profile or DB_PROFILE].items():
+        c.execute(f"PRAGMA {name}={value}")
+    return c
 
 
 def conn():
-    c = sqlite3.connect(DB_PATH)
+    # Conexión suelta (fuera del pool): scripts y jobs que la administran a mano
+    if is_postgres():
+        import db_postgres
+        return db_postgres.connect(DB_URL)
+    c = sqlite3.connect(DB_PATH, cached_statements=CACHED_STATEMENTS, factory=instrumentation.connection_factory())
     c.row_factory = sqlite3.Row
-    return c
+    return configure(c)
+
+
+class ConnectionPool:
+    # Pool acotado de conexiones SQLite reutilizables entre hilos (una por hilo a la vez).
+    # Dentro de un mismo hilo, los usos anidados comparten la conexión ya tomada.
+    # Toma el lock de escritura al inicio: evita el SQLITE_BUSY por upgrade de lectura a escritura
+    BEGIN = "BEGIN IMMEDIATE"
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS, max_lifetime=MAX_CONN_LIFETIME_SECONDS):
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._created = 0
+        self._born = {}
+        self.stats = {
+            "acquired": 0,
+            "hits": 0,
+            "created": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "recycled": 0,
+            "lifetime_seconds_total": 0.0,
+        }
+
+    def _connect(self):
+        c = sqlite3.connect(DB_PATH, cached_statements=CACHED_STATEMENTS, check_same_thread=False,
+                            factory=instrumentation.connection_factory())
+        c.row_factory = sqlite3.Row
+        configure(c)
+        self._born[id(c)] = time.monotonic()
+        return c
+
+    def _retire(self, c):
+        lifetime = time.monotonic() - self._born.pop(id(c), time.monotonic())
+        c.close()
+        with self._lock:
+            self._created -= 1
+            self.stats["recycled"] += 1
+            self.stats["lifetime_seconds_total"] += lifetime
+
+    def _take(self):
+        try:
+            c = self._idle.get_nowait()
+            with self._lock:
+                self.stats["hits"] += 1
+            return c
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                self.stats["created"] += 1
+                create = True
+            else:
+                self.stats["waits"] += 1
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        t0 = time.monotonic()
+        try:
+            c = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Pool de conexiones agotado") from None
+        with self._lock:
+            self.stats["wait_seconds"] += time.monotonic() - t0
+        return c
+
+    def _give_back(self, c):
+        if c.in_transaction:
+            c.rollback()
+        if time.monotonic() - self._born.get(id(c), 0) > self.max_lifetime:
+            self._retire(c)
+        else:
+            self._idle.put(c)
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+        c = self._take()
+        with self._lock:
+            self.stats["acquired"] += 1
+        self._local.conn, self._local.depth = c, 1
+        try:
+            yield c
+        finally:
+            self._local.conn, self._local.depth = None, 0
+            self._give_back(c)
+
+    @contextmanager
+    def transaction(self):
+        # La profundidad se cuenta por transacción, no por conexión: la primera transaction() del
+        # hilo abre y confirma aunque esté dentro de un connection() que ya tomó la conexión
+        with self.connection() as c:
+            outer = getattr(self._local, "tx_depth", 0) == 0
+            if outer and not c.in_transaction:
+                c.execute(self.BEGIN)
+            self._local.tx_depth = getattr(self._local, "tx_depth", 0) + 1
+            try:
+                yield c
+            except Exception:
+                if outer:
+                    c.rollback()
+                raise
+            finally:
+                self._local.tx_depth -= 1
+            if outer:
+                c.commit()
+
+    def metrics(self):
+        with self._lock:
+            out = dict(self.stats)
+            out["open"] = self._created
+        out["idle"] = self._idle.qsize()
+        out["hit_ratio"] = round(out["hits"] / out["acquired"], 4) if out["acquired"] else 0.0
+        out["avg_lifetime_seconds"] = round(out["lifetime_seconds_total"] / out["recycled"], 3) if out["recycled"] else 0.0
+        return out
+
+    def close_all(self):
+        while True:
+            try:
+                self._retire(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def _make_pool():
+    global DB_ERRORS
+    if is_postgres():
+        try:
+            import db_postgres
+        except ImportError:
+            raise RuntimeError("CPF_DB_URL apunta a Postgres: instalá psycopg (pip install -r requirements-postgres.txt).")
+        DB_ERRORS = (sqlite3.Error, db_postgres.Error)
+        return db_postgres.PostgresPool(DB_URL)
+    return ConnectionPool()
+
+
+pool = _make_pool()
+
+
+def connection():
+    return pool.connection()
+
+
+def transaction():
+    # Commit al salir sin error, rollback ante excepción; anidado se une a la transacción externa
+    return pool.transaction()
+
+
+def pool_metrics():
+    return pool.metrics()
+
+
+def use_database(target, profile=None):
+    # Apunta el módulo a otra base/perfil (benchmarks, herramientas); descarta el pool actual.
+    # target es la ruta de un archivo SQLite o una URL de Postgres.
+    global DB_PATH, DB_URL, DB_PROFILE, pool, _fts_enabled
+    flush_audit()
+    pool.close_all()
+    if str(target).startswith(("postgres://", "postgresql://")):
+        DB_URL = str(target)
+    else:
+        DB_PATH, DB_URL = Path(target), ""
+    if profile:
+        DB_PROFILE = profile
+    _fts_enabled = None
+    pool = _make_pool()
 
 
 def init_db():
-    c = conn()
-    cur = c.cursor()
+    with transaction() as c:
+        migrate(c)
+
+
+def schema_version(c):
+    if is_postgres():
+        import db_postgres
+        return db_postgres.schema_version(c)
+    return c.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(c):
+    # Migraciones versionadas con PRAGMA user_version: se aplican en orden las que falten
+    if is_postgres():
+        import db_postgres
+        return db_postgres.migrate(c)
+    current = schema_version(c)
+    for version, step in enumerate(MIGRATIONS[current:], start=current + 1):
+        step(c.cursor())
+        c.execute(f"PRAGMA user_version={version}")
+    return schema_version(c)
+
+
+def _migration_indexes(cur):
+    # Índices alineados a los filtros/orden de services (ver query_plans.py)
+    for sql in [
+        "CREATE INDEX IF NOT EXISTS idx_requirements_status_created ON requirements(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_status_type_created ON requirements(status, req_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_chamber_status_created ON requirements(chamber_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_category_status_created ON requirements(category, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_location_status_created ON requirements(location, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_created ON requirements(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_status_updated ON requirements(status, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_requirements_user ON requirements(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_contact_requests_to_created ON contact_requests(to_user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_contact_requests_from_created ON contact_requests(from_user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_contact_requests_req_status ON contact_requests(requirement_id, status, from_user_id, to_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)",
+        "CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_chamber_created ON users(chamber_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_chambers_name ON chambers(name)",
+    ]:
+        cur.execute(sql)
+    cur.execute("ANALYZE")
+
+
+def _create_schema(cur):
     cur.execute("""
         CREATE TABLE IF NOT EXISTS chambers (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -92,19 +372,634 @@ def init_db():
             created_at TEXT NOT NULL
         );
     """)
-    c.commit()
-    c.close()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS requirement_matches (
+            requirement_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            match_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY(requirement_id, rank),
+            FOREIGN KEY(requirement_id) REFERENCES requirements(id),
+            FOREIGN KEY(match_id) REFERENCES requirements(id)
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_requirement_matches_match ON requirement_matches(match_id);")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job TEXT PRIMARY KEY,
+            last_run_at TEXT NOT NULL
+        );
+    """)
+    init_fts(cur)
+
+
+FTS_TABLE = "requirements_fts"
+
+
+def init_fts(cur):
+    # Índice full-text de requerimientos (+ empresa/nombre del usuario), sincronizado por triggers.
+    # unicode61 con remove_diacritics: "cámara" coincide con "camara".
+    exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name=?", (FTS_TABLE,)).fetchone()
+    try:
+        cur.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                title, description, tags, company, name,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            );
+        """)
+    except sqlite3.OperationalError:
+        # SQLite sin FTS5: list_requirements sigue usando LIKE
+        return False
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS requirements_fts_ai AFTER INSERT ON requirements BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, description, tags, company, name)
+            SELECT new.id, new.title, new.description, new.tags, u.company, u.name FROM users u WHERE u.id = new.user_id;
+        END;
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS requirements_fts_au AFTER UPDATE OF title, description, tags, user_id ON requirements BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, title, description, tags, company, name)
+            SELECT new.id, new.title, new.description, new.tags, u.company, u.name FROM users u WHERE u.id = new.user_id;
+        END;
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS requirements_fts_ad AFTER DELETE ON requirements BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END;
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name, company ON users BEGIN
+            UPDATE {FTS_TABLE} SET company = new.company, name = new.name
+            WHERE rowid IN (SELECT id FROM requirements WHERE user_id = new.id);
+        END;
+    """)
+    if not exists:
+        # Migración: bases creadas antes del índice se rellenan una única vez
+        cur.execute(f"""
+            INSERT INTO {FTS_TABLE}(rowid, title, description, tags, company, name)
+            SELECT r.id, r.title, r.description, r.tags, u.company, u.name
+            FROM requirements r JOIN users u ON u.id = r.user_id
+        """)
+    return True
+
+
+# Contadores materializados del Panel. chamber_id: -1 = global, 0 = sin cámara, >0 = cámara.
+METRICS_GLOBAL = -1
+METRICS_NO_CHAMBER = 0
+
+
+def _bump(chamber_expr, metric_expr, delta):
+    return (
+        f"INSERT INTO metric_counters(chamber_id, metric, n) VALUES({chamber_expr}, {metric_expr}, {delta}) "
+        "ON CONFLICT(chamber_id, metric) DO UPDATE SET n = n + excluded.n;"
+    )
+
+
+def _bump_scoped(chamber_expr, metric_expr, delta):
+    return _bump(METRICS_GLOBAL, metric_expr, delta) + "\n" + _bump(chamber_expr, metric_expr, delta)
+
+
+def _contact_chamber(ref):
+    return f"COALESCE((SELECT chamber_id FROM requirements WHERE id = {ref}.requirement_id), 0)"
+
+
+_METRIC_AGGREGATES = f"""
+    SELECT {METRICS_GLOBAL} as chamber_id, 'users_total' as metric, COUNT(*) as n FROM users
+    UNION ALL SELECT COALESCE(chamber_id, 0), 'users_total', COUNT(*) FROM users GROUP BY 1
+    UNION ALL SELECT {METRICS_GLOBAL}, 'req_total', COUNT(*) FROM requirements
+    UNION ALL SELECT COALESCE(chamber_id, 0), 'req_total', COUNT(*) FROM requirements GROUP BY 1
+    UNION ALL SELECT {METRICS_GLOBAL}, 'req_' || status, COUNT(*) FROM requirements GROUP BY 2
+    UNION ALL SELECT COALESCE(chamber_id, 0), 'req_' || status, COUNT(*) FROM requirements GROUP BY 1, 2
+    UNION ALL SELECT {METRICS_GLOBAL}, 'contact_' || status, COUNT(*) FROM contact_requests GROUP BY 2
+    UNION ALL SELECT COALESCE(r.chamber_id, 0), 'contact_' || cr.status, COUNT(*)
+              FROM contact_requests cr LEFT JOIN requirements r ON r.id = cr.requirement_id GROUP BY 1, 2
+"""
+
+
+def _migration_metric_counters(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS metric_counters (
+            chamber_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(chamber_id, metric)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_metric_counters_metric ON metric_counters(metric, chamber_id)")
+    triggers = {
+        "metrics_requirements_ai": ("AFTER INSERT ON requirements", [
+            _bump_scoped("COALESCE(new.chamber_id, 0)", "'req_total'", 1),
+            _bump_scoped("COALESCE(new.chamber_id, 0)", "'req_' || new.status", 1),
+        ]),
+        "metrics_requirements_ad": ("AFTER DELETE ON requirements", [
+            _bump_scoped("COALESCE(old.chamber_id, 0)", "'req_total'", -1),
+            _bump_scoped("COALESCE(old.chamber_id, 0)", "'req_' || old.status", -1),
+        ]),
+        "metrics_requirements_au": ("AFTER UPDATE OF status, chamber_id ON requirements", [
+            _bump_scoped("COALESCE(old.chamber_id, 0)", "'req_total'", -1),
+            _bump_scoped("COALESCE(old.chamber_id, 0)", "'req_' || old.status", -1),
+            _bump_scoped("COALESCE(new.chamber_id, 0)", "'req_total'", 1),
+            _bump_scoped("COALESCE(new.chamber_id, 0)", "'req_' || new.status", 1),
+        ]),
+        "metrics_users_ai": ("AFTER INSERT ON users", [
+            _bump_scoped("COALESCE(new.chamber_id, 0)", "'users_total'", 1),
+        ]),
+        "metrics_users_ad": ("AFTER DELETE ON users", [
+            _bump_scoped("COALESCE(old.chamber_id, 0)", "'users_total'", -1),
+        ]),
+        "metrics_users_au": ("AFTER UPDATE OF chamber_id ON users", [
+            _bump("COALESCE(old.chamber_id, 0)", "'users_total'", -1),
+            _bump("COALESCE(new.chamber_id, 0)", "'users_total'", 1),
+        ]),
+        "metrics_contacts_ai": ("AFTER INSERT ON contact_requests", [
+            _bump_scoped(_contact_chamber("new"), "'contact_' || new.status", 1),
+        ]),
+        "metrics_contacts_ad": ("AFTER DELETE ON contact_requests", [
+            _bump_scoped(_contact_chamber("old"), "'contact_' || old.status", -1),
+        ]),
+        "metrics_contacts_au": ("AFTER UPDATE OF status, requirement_id ON contact_requests", [
+            _bump_scoped(_contact_chamber("old"), "'contact_' || old.status", -1),
+            _bump_scoped(_contact_chamber("new"), "'contact_' || new.status", 1),
+        ]),
+    }
+    for name, (event, body) in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN\n" + "\n".join(body) + "\nEND;")
+    rebuild_metric_counters(cur)
+
+
+def rebuild_metric_counters(cur):
+    cur.execute("DELETE FROM metric_counters")
+    cur.execute(f"INSERT INTO metric_counters(chamber_id, metric, n) SELECT chamber_id, metric, n FROM ({_METRIC_AGGREGATES}) m")
+
+
+def metric_counter_drift(cur):
+    # Diferencias entre los contadores materializados y un recuento real: {(chamber_id, metric): (guardado, real)}
+    stored = {(r[0], r[1]): r[2] for r in cur.execute("SELECT chamber_id, metric, n FROM metric_counters")}
+    actual = {(r[0], r[1]): r[2] for r in cur.execute(_METRIC_AGGREGATES)}
+    drift = {}
+    for key in set(stored) | set(actual):
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift[key] = (stored.get(key, 0), actual.get(key, 0))
+    return drift
+
+
+def seconds_between(start, end):
+    # Segundos entre dos fechas ISO guardadas como texto, en el dialecto de la base activa
+    if is_postgres():
+        return f"EXTRACT(EPOCH FROM ({end}::timestamp - {start}::timestamp))"
+    return f"(julianday({end}) - julianday({start})) * 86400"
+
+
+def _day(expr):
+    return f"substr({expr}, 1, 10)"
+
+
+def _daily_contact(ref, day_expr, created, accepted=0, declined=0, responded=0, seconds=0):
+    return (
+        "INSERT INTO daily_contacts(day, chamber_id, created, accepted, declined, responded, response_seconds) "
+        f"VALUES({_day(day_expr)}, {_contact_chamber(ref)}, {created}, {accepted}, {declined}, {responded}, {seconds}) "
+        "ON CONFLICT(day, chamber_id) DO UPDATE SET created = created + excluded.created, "
+        "accepted = accepted + excluded.accepted, declined = declined + excluded.declined, "
+        "responded = responded + excluded.responded, response_seconds = response_seconds + excluded.response_seconds;"
+    )
+
+
+def _daily_requirement(ref, delta):
+    return (
+        "INSERT INTO daily_requirements(day, chamber_id, category, req_type, n) "
+        f"VALUES({_day(ref + '.created_at')}, COALESCE({ref}.chamber_id, 0), COALESCE({ref}.category, ''), {ref}.req_type, {delta}) "
+        "ON CONFLICT(day, chamber_id, category, req_type) DO UPDATE SET n = n + excluded.n;"
+    )
+
+
+def _migration_daily_rollups(cur):
+    # Rollups diarios para analytics.py: publicaciones por día/cámara/categoría/tipo y
+    # solicitudes de contacto (creadas por día de alta, respuestas por día de respuesta)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_requirements (
+            day TEXT NOT NULL,
+            chamber_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            req_type TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(day, chamber_id, category, req_type)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_contacts (
+            day TEXT NOT NULL,
+            chamber_id INTEGER NOT NULL,
+            created INTEGER NOT NULL DEFAULT 0,
+            accepted INTEGER NOT NULL DEFAULT 0,
+            declined INTEGER NOT NULL DEFAULT 0,
+            responded INTEGER NOT NULL DEFAULT 0,
+            response_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY(day, chamber_id)
+        ) WITHOUT ROWID;
+    """)
+
+    def responded(ref, sign):
+        day = f"COALESCE({ref}.responded_at, {ref}.created_at)"
+        seconds = f"COALESCE({seconds_between(ref + '.created_at', ref + '.responded_at')}, 0)"
+        return _daily_contact(ref, day, 0, f"{sign}({ref}.status = 'accepted')", f"{sign}({ref}.status = 'declined')",
+                              f"{sign}1", f"{sign}{seconds}")
+
+    answered = "IN ('accepted', 'declined')"
+    triggers = {
+        "rollup_requirements_ai": ("AFTER INSERT ON requirements", [_daily_requirement("new", 1)]),
+        "rollup_requirements_ad": ("AFTER DELETE ON requirements", [_daily_requirement("old", -1)]),
+        "rollup_requirements_au": ("AFTER UPDATE OF chamber_id, category, req_type, created_at ON requirements", [
+            _daily_requirement("old", -1),
+            _daily_requirement("new", 1),
+        ]),
+        "rollup_contacts_ai": ("AFTER INSERT ON contact_requests", [
+            _daily_contact("new", "new.created_at", 1),
+        ]),
+        "rollup_contacts_ai_answered": (f"AFTER INSERT ON contact_requests WHEN new.status {answered}", [
+            responded("new", ""),
+        ]),
+        "rollup_contacts_ad": ("AFTER DELETE ON contact_requests", [
+            _daily_contact("old", "old.created_at", -1),
+        ]),
+        "rollup_contacts_ad_answered": (f"AFTER DELETE ON contact_requests WHEN old.status {answered}", [
+            responded("old", "-"),
+        ]),
+        # Una respuesta se descuenta del día viejo y se suma al nuevo, como en metric_counters
+        "rollup_contacts_au_old": (
+            f"AFTER UPDATE OF status, responded_at ON contact_requests WHEN old.status {answered}", [
+                responded("old", "-"),
+            ]),
+        "rollup_contacts_au_new": (
+            f"AFTER UPDATE OF status, responded_at ON contact_requests WHEN new.status {answered}", [
+                responded("new", ""),
+            ]),
+    }
+    for name, (event, body) in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN\n" + "\n".join(body) + "\nEND;")
+    rebuild_daily_rollups(cur)
+
+
+def rebuild_daily_rollups(cur):
+    cur.execute("DELETE FROM daily_requirements")
+    cur.execute("""
+        INSERT INTO daily_requirements(day, chamber_id, category, req_type, n)
+        SELECT substr(created_at, 1, 10), COALESCE(chamber_id, 0), COALESCE(category, ''), req_type, COUNT(*)
+        FROM requirements GROUP BY 1, 2, 3, 4
+    """)
+    cur.execute("DELETE FROM daily_contacts")
+    cur.execute(f"""
+        INSERT INTO daily_contacts(day, chamber_id, created, accepted, declined, responded, response_seconds)
+        SELECT day, chamber_id, SUM(created), SUM(accepted), SUM(declined), SUM(responded), SUM(response_seconds)
+        FROM (
+            SELECT substr(cr.created_at, 1, 10) as day, COALESCE(r.chamber_id, 0) as chamber_id,
+                   1 as created, 0 as accepted, 0 as declined, 0 as responded, 0.0 as response_seconds
+            FROM contact_requests cr LEFT JOIN requirements r ON r.id = cr.requirement_id
+            UNION ALL
+            SELECT substr(COALESCE(cr.responded_at, cr.created_at), 1, 10), COALESCE(r.chamber_id, 0),
+                   0, CASE WHEN cr.status = 'accepted' THEN 1 ELSE 0 END, CASE WHEN cr.status = 'declined' THEN 1 ELSE 0 END, 1,
+                   COALESCE({seconds_between("cr.created_at", "cr.responded_at")}, 0)
+            FROM contact_requests cr LEFT JOIN requirements r ON r.id = cr.requirement_id
+            WHERE cr.status IN ('accepted', 'declined')
+        ) x
+        GROUP BY day, chamber_id
+    """)
+
+
+def _migration_sessions(cur):
+    # Sesiones de login del lado del servidor (ver sessions.py). Se guarda el hash del token, nunca el token.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)")
+    cur.execute("INSERT OR IGNORE INTO settings(key, value) VALUES('session_secret', ?)", (secrets.token_hex(32),))
+
+
+def _migration_contact_grants(cur):
+    # Permisos de contacto normalizados: una fila por requerimiento y par de usuarios (sin orden,
+    # user_lo < user_hi) al aceptar una solicitud. can_view_contact/contact_status leen por clave primaria.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS contact_grants (
+            requirement_id INTEGER NOT NULL,
+            user_lo INTEGER NOT NULL,
+            user_hi INTEGER NOT NULL,
+            granted_at TEXT NOT NULL,
+            PRIMARY KEY(requirement_id, user_lo, user_hi),
+            FOREIGN KEY(requirement_id) REFERENCES requirements(id)
+        ) WITHOUT ROWID;
+    """)
+    _unique_pending_contacts(cur)
+    rebuild_contact_grants(cur)
+
+
+def _unique_pending_contacts(cur):
+    # Una sola solicitud pendiente por (solicitante, requerimiento): la garantiza el índice único
+    # parcial, que create_contact_request usa con ON CONFLICT. Antes se descartan duplicados viejos.
+    cur.execute("""
+        DELETE FROM contact_requests
+        WHERE status='pending'
+          AND id NOT IN (SELECT MIN(id) FROM contact_requests WHERE status='pending'
+                         GROUP BY from_user_id, requirement_id)
+    """)
+    cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS uq_contact_requests_pending
+                   ON contact_requests(from_user_id, requirement_id) WHERE status='pending'""")
+
+
+def rebuild_contact_grants(cur):
+    cur.execute("DELETE FROM contact_grants")
+    cur.execute("""
+        INSERT INTO contact_grants(requirement_id, user_lo, user_hi, granted_at)
+        SELECT requirement_id,
+               CASE WHEN from_user_id < to_user_id THEN from_user_id ELSE to_user_id END,
+               CASE WHEN from_user_id < to_user_id THEN to_user_id ELSE from_user_id END,
+               MIN(COALESCE(responded_at, created_at))
+        FROM contact_requests
+        WHERE status='accepted'
+        GROUP BY 1, 2, 3
+    """)
+
+
+def _migration_outbox(cur):
+    # Outbox transaccional (ver notifications.py): los servicios escriben el evento en la misma
+    # transacción que el cambio; el despachador lo reparte en notificaciones in-app y emails.
+    # next_attempt_at es a la vez el turno de reintento y el lease de quien lo tomó.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            next_attempt_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            dispatched_at TEXT,
+            last_error TEXT
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at, id) WHERE dispatched_at IS NULL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_dispatched ON outbox(dispatched_at) WHERE dispatched_at IS NOT NULL")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            requirement_id INTEGER,
+            message TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            read_at TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at)")
+    # Contador de no leídas por usuario: lo que consulta la UI en cada refresco (una fila por clave primaria)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS notification_counters (
+            user_id INTEGER PRIMARY KEY,
+            unread INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+
+def _migration_outbox_delivered(cur):
+    # Entregas ya hechas de cada evento ("app:<user_id>", "mail:<user_id>"): un reintento solo repite
+    # las que fallaron
+    cur.execute("ALTER TABLE outbox ADD COLUMN delivered TEXT NOT NULL DEFAULT '[]'")
+
+
+# Cada entrada lleva la base a la versión = su posición + 1. Nunca editar una ya publicada: agregar otra.
+MIGRATIONS = [
+    _create_schema,
+    _migration_indexes,
+    _migration_metric_counters,
+    _migration_daily_rollups,
+    _migration_sessions,
+    _migration_contact_grants,
+    _migration_outbox,
+    _migration_outbox_delivered,
+]
+
+
+_fts_enabled = None
+
+
+def fts_enabled():
+    global _fts_enabled
+    if is_postgres():
+        return True
+    if _fts_enabled is None:
+        with connection() as c:
+            _fts_enabled = c.execute("SELECT 1 FROM sqlite_master WHERE name=?", (FTS_TABLE,)).fetchone() is not None
+    return _fts_enabled
+
+
+@contextmanager
+def deferred_fts(c):
+    # Cargas masivas dentro de una transacción: suspende el trigger de alta del índice FTS y al
+    # salir indexa el rango insertado con un único INSERT ... SELECT (varias veces más rápido que
+    # fila por fila). El DROP/CREATE es parte de la transacción: si falla, el rollback lo deshace.
+    if is_postgres():
+        import db_postgres
+        with db_postgres.deferred_triggers(c):
+            yield
+        return
+    row = c.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='requirements_fts_ai'").fetchone()
+    if row is None:
+        yield
+        return
+    last_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM requirements").fetchone()[0]
+    c.execute("DROP TRIGGER requirements_fts_ai")
+    yield
+    c.execute(f"""
+        INSERT INTO {FTS_TABLE}(rowid, title, description, tags, company, name)
+        SELECT r.id, r.title, r.description, r.tags, u.company, u.name
+        FROM requirements r JOIN users u ON u.id = r.user_id
+        WHERE r.id > ?
+    """, (last_id,))
+    c.execute(row["sql"])
+
+
+def fts_query(text):
+    # Cada palabra como prefijo entre comillas (AND implícito); evita la sintaxis FTS5 del usuario
+    tokens = re.findall(r"\w+", text or "")
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def search_clause(text):
+    # Piezas de la búsqueda full-text para services._requirements_query: None si no hay índice
+    # (se cae a LIKE), {} si el texto no tiene términos. sort_key ordena por relevancia.
+    if is_postgres():
+        import db_postgres
+        return db_postgres.search_clause(text)
+    if not fts_enabled():
+        return None
+    match = fts_query(text)
+    if not match:
+        return {}
+    return {
+        "join": f"JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = r.id",
+        "join_params": [],
+        # BM25 (título y tags pesan más que la descripción) + fragmento resaltado
+        "cols": f", snippet({FTS_TABLE}, -1, '«', '»', '…', 12) as snippet",
+        "where": f"{FTS_TABLE} MATCH ?",
+        "params": [match],
+        "sort_key": f"bm25({FTS_TABLE}, 10.0, 1.0, 5.0, 3.0, 3.0)",
+        "sort_desc": False,
+    }
+
+
+STREAM_CHUNK = 5000
+
+
+def stream(c, sql, params=(), chunk=STREAM_CHUNK):
+    # Genera el resultado en bloques de hasta chunk filas sin materializarlo entero. En SQLite el
+    # cursor ya es perezoso; en Postgres se usa un cursor del lado del servidor.
+    if is_postgres():
+        yield from c.stream(sql, params, chunk)
+        return
+    cursor = c.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk)
+        if not rows:
+            return
+        yield rows
+
+
+def read_frame(c, sql, params=(), chunk=STREAM_CHUNK):
+    # DataFrame armado por columnas directo desde el cursor: cada bloque se traspone a las listas
+    # de columnas y se descarta, sin dicts por fila ni la lista completa de filas en memoria.
+    import pandas as pd
+    names, columns = [], []
+    for rows in stream(c, sql, params, chunk):
+        if not names:
+            names = list(rows[0].keys())
+            columns = [[] for _ in names]
+        for col, values in zip(columns, zip(*rows)):
+            col.extend(values)
+    if not names:
+        # Sin filas: solo las columnas, para que el llamador pueda seleccionarlas igual
+        names = [d[0] for d in c.execute(f"SELECT * FROM ({sql}) q LIMIT 0", params).description]
+        columns = [[] for _ in names]
+    return pd.DataFrame(dict(zip(names, columns)), columns=names)
 
 
 def now_iso():
     return datetime.utcnow().isoformat(timespec="seconds")
 
 
+AUDIT_INSERT = "INSERT INTO audit_log(actor_user_id, action, details, created_at) VALUES(?,?,?,?)"
+# async: cola en memoria + hilo que vuelca en lotes | sync: inserta en la transacción en curso (tests)
+AUDIT_MODE = os.environ.get("CPF_AUDIT_MODE", "async")
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_SECONDS = 1.0
+AUDIT_RETRIES = 3
+
+
+class AuditWriter:
+    # Saca la auditoría del camino crítico: log() encola y un hilo de fondo inserta con executemany,
+    # cortando lotes por tamaño o por tiempo. flush() bloquea hasta que lo encolado quedó escrito.
+
+    def __init__(self, batch_size=AUDIT_BATCH_SIZE, flush_seconds=AUDIT_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "dropped": 0}
+
+    def submit(self, event):
+        self._ensure_started()
+        self._queue.put(event)
+        with self._lock:
+            self.stats["enqueued"] += 1
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="cpf-audit-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_seconds
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for w in waiters:
+                w.set()
+
+    def _write(self, batch):
+        for attempt in range(AUDIT_RETRIES):
+            try:
+                with transaction() as c:
+                    c.executemany(AUDIT_INSERT, batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except DB_ERRORS:
+                time.sleep(0.2 * (attempt + 1))
+        self.stats["dropped"] += len(batch)
+        logging.getLogger("cpf.audit").error("Se descartaron %d eventos de auditoría", len(batch))
+
+    def flush(self, timeout=None):
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.flush, 10)
+
+
+def set_audit_mode(mode):
+    global AUDIT_MODE
+    assert mode in ("async", "sync")
+    if mode == "sync":
+        audit_writer.flush()
+    AUDIT_MODE = mode
+
+
+def flush_audit(timeout=None):
+    return audit_writer.flush(timeout)
+
+
 def log(actor_user_id, action, details=""):
-    c = conn()
-    c.execute(
-        "INSERT INTO audit_log(actor_user_id, action, details, created_at) VALUES(?,?,?,?)",
-        (actor_user_id, action, details, now_iso())
-    )
-    c.commit()
-    c.close()
+    event = (actor_user_id, action, details, now_iso())
+    if AUDIT_MODE == "async":
+        audit_writer.submit(event)
+        return
+    # Modo sync: llamado dentro de transaction() se une a la transacción del cambio que registra
+    with transaction() as c:
+        c.execute(AUDIT_INSERT, event)
@@ -0,0 +1,566 @@
+import functools
+import itertools
+import re
+import secrets
+import time
+from contextlib import contextmanager
+
+import psycopg
+from psycopg.pq import TransactionStatus
+
+import db
+import instrumentation
+
+# Backend Postgres de db.py (CPF_DB_URL=postgresql://...). Las consultas de services/auth se
+# escriben una sola vez con "?": PgConnection las traduce a "%s" y devuelve filas con la misma
+# interfaz que sqlite3.Row, así el resto del código no distingue la base.
+Error = psycopg.Error
+
+# Se aplican sin acentos y en minúsculas tanto al índice como a la consulta ("cámara" = "camara")
+FOLD_FROM = "áàäâãéèëêíìïîóòöôõúùüûñç"
+FOLD_TO = "aaaaaeeeeiiiiooooouuuunc"
+_FOLD = str.maketrans(FOLD_FROM, FOLD_TO)
+MIGRATION_LOCK = 4242
+_PLACEHOLDERS = re.compile(r"'[^']*'|\"[^\"]*\"|\?|%")
+_cursor_ids = itertools.count(1)
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql, with_params):
+    # "?" -> "%s" fuera de literales; con parámetros, un "%" literal (LIKE '%x') se escapa
+    if not with_params:
+        return sql
+    return _PLACEHOLDERS.sub(lambda m: {"?": "%s", "%": "%%"}.get(m.group(), m.group()), sql)
+
+
+class Row:
+    # Igual que sqlite3.Row: r["col"], r[0], keys(), dict(r) y tuple(r)
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def keys(self):
+        return list(self._index)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return isinstance(other, Row) and self._index == other._index and self._values == other._values
+
+    def __hash__(self):
+        return hash(self._values)
+
+    def __repr__(self):
+        return f"Row({dict(zip(self._index, self._values))!r})"
+
+
+def _row_factory(cursor):
+    index = {}
+    # Con nombres repetidos gana la primera columna, como en sqlite3.Row
+    for i, d in reversed(list(enumerate(cursor.description or ()))):
+        index[d.name] = i
+    return functools.partial(Row, index)
+
+
+class PgConnection:
+    # Adaptador con la interfaz de sqlite3.Connection que usa el resto del código. Corre en
+    # autocommit: las lecturas no dejan transacciones abiertas y transaction() emite BEGIN.
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != TransactionStatus.IDLE
+
+    @property
+    def closed(self):
+        return self.raw.closed or self.raw.broken
+
+    def execute(self, sql, params=()):
+        if not instrumentation.ENABLED:
+            return self.raw.execute(translate(sql, bool(params)), params or None)
+        # psycopg trae el resultado completo en execute: el span cubre servidor y transferencia
+        t0 = time.perf_counter()
+        try:
+            cur = self.raw.execute(translate(sql, bool(params)), params or None)
+        except Exception:
+            instrumentation.sql_done(sql, time.perf_counter() - t0, error=True)
+            raise
+        instrumentation.sql_done(sql, time.perf_counter() - t0, cur.rowcount if cur.rowcount >= 0 else None,
+                                 explain=lambda: self._explain(sql, params))
+        return cur
+
+    def _explain(self, sql, params):
+        return [r[0] for r in self.raw.execute("EXPLAIN " + translate(sql, bool(params)), params or None)]
+
+    def executemany(self, sql, seq):
+        cur = self.raw.cursor()
+        t0 = time.perf_counter()
+        cur.executemany(translate(sql, True), seq)
+        if instrumentation.ENABLED:
+            instrumentation.record(instrumentation.sql_name(sql), time.perf_counter() - t0,
+                                   cur.rowcount if cur.rowcount >= 0 else None)
+        return cur
+
+    def cursor(self):
+        return self
+
+    def stream(self, sql, params, chunk):
+        # Cursor del lado del servidor: Postgres entrega de a chunk filas. Fuera de una
+        # transacción se abre una propia, que dura lo que dura la lectura.
+        own = not self.in_transaction
+        if own:
+            self.raw.execute("BEGIN")
+        cur = self.raw.cursor(name=f"cpf_stream_{next(_cursor_ids)}")
+        try:
+            cur.execute(translate(sql, bool(params)), params or None)
+            while True:
+                rows = cur.fetchmany(chunk)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cur.close()
+            if own and not self.closed:
+                self.raw.execute("COMMIT")
+
+    def commit(self):
+        if self.in_transaction:
+            self.raw.execute("COMMIT")
+
+    def rollback(self):
+        if self.in_transaction:
+            self.raw.execute("ROLLBACK")
+
+    def close(self):
+        self.raw.close()
+
+
+def connect(url):
+    return PgConnection(psycopg.connect(url, autocommit=True, row_factory=_row_factory))
+
+
+class PostgresPool(db.ConnectionPool):
+    # Mismo pool acotado (y mismas métricas) que SQLite; acá varios hilos escriben en paralelo
+    BEGIN = "BEGIN"
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        super().__init__(**kwargs)
+
+    def _connect(self):
+        c = connect(self.url)
+        self._born[id(c)] = time.monotonic()
+        return c
+
+    def _give_back(self, c):
+        # Una conexión cortada (reinicio del servidor) no vuelve al pool
+        if c.closed:
+            self._retire(c)
+        else:
+            super()._give_back(c)
+
+
+def fold(text):
+    return (text or "").lower().translate(_FOLD)
+
+
+def search_clause(text):
+    # Cada palabra como prefijo (AND) sobre el tsvector ponderado: título > tags > empresa/nombre > descripción
+    tokens = re.findall(r"\w+", fold(text))
+    if not tokens:
+        return {}
+    return {
+        # rank en float8: el real de ts_rank no vuelve exacto desde Python y rompería el cursor keyset
+        "join": """JOIN (SELECT requirement_id, ts_rank(doc, tq)::float8 as rank, tq
+                           FROM requirements_search, to_tsquery('simple', ?) tq
+                          WHERE doc @@ tq) s ON s.requirement_id = r.id""",
+        "join_params": [" & ".join(f"{t}:*" for t in tokens)],
+        "cols": ", ts_headline('simple', r.description, s.tq, 'StartSel=«, StopSel=», MaxWords=12, MinWords=4') as snippet",
+        "where": None,
+        "params": [],
+        "sort_key": "s.rank",
+        "sort_desc": True,
+    }
+
+
+@contextmanager
+def deferred_triggers(c):
+    # Equivalente a db.deferred_fts para altas masivas de requerimientos: dentro de la transacción
+    # los triggers por fila de búsqueda, contadores y rollups no hacen nada (SET LOCAL) y al salir
+    # se aplican en bloque sobre las filas que insertó esta transacción (xmin), no las de otras
+    # sesiones que publiquen en paralelo.
+    last_id = c.execute("SELECT COALESCE(MAX(id), 0) FROM requirements").fetchone()[0]
+    c.execute("SET LOCAL cpf.bulk = 'on'")
+    yield
+    c.execute("SET LOCAL cpf.bulk = 'off'")
+    mine = "r.id > ? AND r.xmin = pg_current_xact_id()::xid"
+    c.execute(f"""
+        INSERT INTO requirements_search(requirement_id, doc)
+        SELECT r.id, cpf_search_doc(r.title, r.description, r.tags, u.company, u.name)
+          FROM requirements r JOIN users u ON u.id = r.user_id
+         WHERE {mine}""", (last_id,))
+    c.execute(f"""
+        INSERT INTO metric_counters AS m(chamber_id, metric, n)
+        SELECT k.chamber_id, k.metric, COUNT(*)
+          FROM requirements r, LATERAL (VALUES ({db.METRICS_GLOBAL}, 'req_total'), (COALESCE(r.chamber_id, 0), 'req_total'),
+                                               ({db.METRICS_GLOBAL}, 'req_' || r.status),
+                                               (COALESCE(r.chamber_id, 0), 'req_' || r.status)) k(chamber_id, metric)
+         WHERE {mine}
+         GROUP BY 1, 2
+        ON CONFLICT(chamber_id, metric) DO UPDATE SET n = m.n + excluded.n""", (last_id,))
+    c.execute(f"""
+        INSERT INTO daily_requirements AS d(day, chamber_id, category, req_type, n)
+        SELECT substr(r.created_at, 1, 10), COALESCE(r.chamber_id, 0), COALESCE(r.category, ''), r.req_type, COUNT(*)
+          FROM requirements r
+         WHERE {mine}
+         GROUP BY 1, 2, 3, 4
+        ON CONFLICT(day, chamber_id, category, req_type) DO UPDATE SET n = d.n + excluded.n""", (last_id,))
+
+
+def schema_version(c):
+    c.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    return c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(c):
+    # Lock de sesión transaccional: dos procesos que arrancan juntos no migran a la vez
+    c.execute("SELECT pg_advisory_xact_lock(?)", (MIGRATION_LOCK,))
+    current = schema_version(c)
+    for version, step in enumerate(MIGRATIONS[current:], start=current + 1):
+        step(c)
+        c.execute("INSERT INTO schema_version(version) VALUES(?)", (version,))
+    return schema_version(c)
+
+
+def _create_schema(c):
+    # Equivale a las migraciones 1-5 de SQLite (mismas tablas, índices, contadores y rollups)
+    for sql in [
+        """CREATE TABLE IF NOT EXISTS chambers (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            name TEXT NOT NULL,
+            province TEXT,
+            city TEXT,
+            created_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS users (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            name TEXT NOT NULL,
+            company TEXT NOT NULL,
+            phone TEXT,
+            chamber_id BIGINT REFERENCES chambers(id),
+            role TEXT NOT NULL,
+            is_active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS requirements (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users(id),
+            chamber_id BIGINT REFERENCES chambers(id),
+            req_type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            tags TEXT,
+            category TEXT,
+            location TEXT,
+            urgency TEXT,
+            status TEXT NOT NULL DEFAULT 'open',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS contact_requests (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            from_user_id BIGINT NOT NULL REFERENCES users(id),
+            to_user_id BIGINT NOT NULL REFERENCES users(id),
+            requirement_id BIGINT NOT NULL REFERENCES requirements(id),
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TEXT NOT NULL,
+            responded_at TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS audit_log (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            actor_user_id BIGINT,
+            action TEXT NOT NULL,
+            details TEXT,
+            created_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS requirement_matches (
+            requirement_id BIGINT NOT NULL REFERENCES requirements(id),
+            rank INTEGER NOT NULL,
+            match_id BIGINT NOT NULL REFERENCES requirements(id),
+            score DOUBLE PRECISION NOT NULL,
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY(requirement_id, rank)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_requirement_matches_match ON requirement_matches(match_id)",
+        """CREATE TABLE IF NOT EXISTS job_runs (
+            job TEXT PRIMARY KEY,
+            last_run_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS metric_counters (
+            chamber_id BIGINT NOT NULL,
+            metric TEXT NOT NULL,
+            n BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY(chamber_id, metric)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_metric_counters_metric ON metric_counters(metric, chamber_id)",
+        """CREATE TABLE IF NOT EXISTS daily_requirements (
+            day TEXT NOT NULL,
+            chamber_id BIGINT NOT NULL,
+            category TEXT NOT NULL,
+            req_type TEXT NOT NULL,
+            n BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY(day, chamber_id, category, req_type)
+        )""",
+        """CREATE TABLE IF NOT EXISTS daily_contacts (
+            day TEXT NOT NULL,
+            chamber_id BIGINT NOT NULL,
+            created BIGINT NOT NULL DEFAULT 0,
+            accepted BIGINT NOT NULL DEFAULT 0,
+            declined BIGINT NOT NULL DEFAULT 0,
+            responded BIGINT NOT NULL DEFAULT 0,
+            response_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY(day, chamber_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users(id),
+            created_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)",
+    ]:
+        c.execute(sql)
+    _create_search(c)
+    _create_counters(c)
+    db._migration_indexes(c)
+    db.rebuild_metric_counters(c)
+    db.rebuild_daily_rollups(c)
+    c.execute("INSERT INTO settings(key, value) VALUES('session_secret', ?) ON CONFLICT DO NOTHING",
+              (secrets.token_hex(32),))
+
+
+def _create_search(c):
+    # Reemplazo de FTS5: tsvector por requerimiento (con empresa/nombre del autor) en una tabla
+    # aparte con índice GIN, mantenida por triggers igual que requirements_fts
+    c.execute(f"""
+        CREATE OR REPLACE FUNCTION cpf_fold(t TEXT) RETURNS TEXT IMMUTABLE LANGUAGE sql AS $$
+            SELECT translate(lower(COALESCE(t, '')), '{FOLD_FROM}', '{FOLD_TO}')
+        $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_search_doc(title TEXT, description TEXT, tags TEXT, company TEXT, name TEXT)
+        RETURNS tsvector IMMUTABLE LANGUAGE sql AS $$
+            SELECT setweight(to_tsvector('simple', cpf_fold(title)), 'A')
+                || setweight(to_tsvector('simple', cpf_fold(tags)), 'B')
+                || setweight(to_tsvector('simple', cpf_fold(company) || ' ' || cpf_fold(name)), 'C')
+                || setweight(to_tsvector('simple', cpf_fold(description)), 'D')
+        $$""")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS requirements_search (
+            requirement_id BIGINT PRIMARY KEY REFERENCES requirements(id) ON DELETE CASCADE,
+            doc tsvector NOT NULL
+        )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_requirements_search_doc ON requirements_search USING GIN(doc)")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION requirements_search_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('cpf.bulk', true) = 'on' THEN RETURN NULL; END IF;
+            INSERT INTO requirements_search(requirement_id, doc)
+            SELECT NEW.id, cpf_search_doc(NEW.title, NEW.description, NEW.tags, u.company, u.name)
+              FROM users u WHERE u.id = NEW.user_id
+            ON CONFLICT(requirement_id) DO UPDATE SET doc = excluded.doc;
+            RETURN NULL;
+        END $$""")
+    c.execute("""
+        CREATE OR REPLACE TRIGGER requirements_search_sync
+        AFTER INSERT OR UPDATE OF title, description, tags, user_id ON requirements
+        FOR EACH ROW EXECUTE FUNCTION requirements_search_sync()""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION users_search_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE requirements_search s
+               SET doc = cpf_search_doc(r.title, r.description, r.tags, NEW.company, NEW.name)
+              FROM requirements r
+             WHERE r.user_id = NEW.id AND s.requirement_id = r.id;
+            RETURN NULL;
+        END $$""")
+    c.execute("""
+        CREATE OR REPLACE TRIGGER users_search_sync AFTER UPDATE OF name, company ON users
+        FOR EACH ROW EXECUTE FUNCTION users_search_sync()""")
+    c.execute("""
+        INSERT INTO requirements_search(requirement_id, doc)
+        SELECT r.id, cpf_search_doc(r.title, r.description, r.tags, u.company, u.name)
+          FROM requirements r JOIN users u ON u.id = r.user_id
+        ON CONFLICT DO NOTHING""")
+
+
+def _create_counters(c):
+    # metric_counters y rollups diarios: mismos deltas que los triggers SQLite de db.py,
+    # agrupados en una función plpgsql por tabla
+    c.execute(f"""
+        CREATE OR REPLACE FUNCTION cpf_bump(p_chamber BIGINT, p_metric TEXT, p_delta INTEGER, p_scoped BOOLEAN)
+        RETURNS void LANGUAGE sql AS $$
+            INSERT INTO metric_counters AS m(chamber_id, metric, n)
+            SELECT chamber_id, p_metric, p_delta
+              FROM unnest(CASE WHEN p_scoped THEN ARRAY[{db.METRICS_GLOBAL}, p_chamber] ELSE ARRAY[p_chamber] END) chamber_id
+            ON CONFLICT(chamber_id, metric) DO UPDATE SET n = m.n + excluded.n
+        $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_contact_chamber(p_requirement_id BIGINT) RETURNS BIGINT LANGUAGE sql AS $$
+            SELECT COALESCE((SELECT chamber_id FROM requirements WHERE id = p_requirement_id), 0)
+        $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_daily_requirement(r requirements, p_delta INTEGER) RETURNS void LANGUAGE sql AS $$
+            INSERT INTO daily_requirements AS d(day, chamber_id, category, req_type, n)
+            VALUES(substr(r.created_at, 1, 10), COALESCE(r.chamber_id, 0), COALESCE(r.category, ''), r.req_type, p_delta)
+            ON CONFLICT(day, chamber_id, category, req_type) DO UPDATE SET n = d.n + excluded.n
+        $$""")
+    c.execute(f"""
+        CREATE OR REPLACE FUNCTION cpf_daily_contact(r contact_requests, p_created INTEGER, p_answered INTEGER)
+        RETURNS void LANGUAGE sql AS $$
+            INSERT INTO daily_contacts AS d(day, chamber_id, created, accepted, declined, responded, response_seconds)
+            VALUES(
+                substr(CASE WHEN p_answered = 0 THEN r.created_at ELSE COALESCE(r.responded_at, r.created_at) END, 1, 10),
+                cpf_contact_chamber(r.requirement_id), p_created,
+                p_answered * (r.status = 'accepted')::int, p_answered * (r.status = 'declined')::int, p_answered,
+                p_answered * COALESCE({db.seconds_between("r.created_at", "r.responded_at")}, 0))
+            ON CONFLICT(day, chamber_id) DO UPDATE SET created = d.created + excluded.created,
+                accepted = d.accepted + excluded.accepted, declined = d.declined + excluded.declined,
+                responded = d.responded + excluded.responded, response_seconds = d.response_seconds + excluded.response_seconds
+        $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_requirements_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('cpf.bulk', true) = 'on' THEN RETURN NULL; END IF;
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM cpf_bump(COALESCE(OLD.chamber_id, 0), 'req_total', -1, true);
+                PERFORM cpf_bump(COALESCE(OLD.chamber_id, 0), 'req_' || OLD.status, -1, true);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM cpf_bump(COALESCE(NEW.chamber_id, 0), 'req_total', 1, true);
+                PERFORM cpf_bump(COALESCE(NEW.chamber_id, 0), 'req_' || NEW.status, 1, true);
+            END IF;
+            RETURN NULL;
+        END $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_requirements_rollup() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('cpf.bulk', true) = 'on' THEN RETURN NULL; END IF;
+            IF TG_OP <> 'INSERT' THEN PERFORM cpf_daily_requirement(OLD, -1); END IF;
+            IF TG_OP <> 'DELETE' THEN PERFORM cpf_daily_requirement(NEW, 1); END IF;
+            RETURN NULL;
+        END $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_users_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            -- Un cambio de cámara no altera el total global
+            IF TG_OP <> 'INSERT' THEN PERFORM cpf_bump(COALESCE(OLD.chamber_id, 0), 'users_total', -1, TG_OP = 'DELETE'); END IF;
+            IF TG_OP <> 'DELETE' THEN PERFORM cpf_bump(COALESCE(NEW.chamber_id, 0), 'users_total', 1, TG_OP = 'INSERT'); END IF;
+            RETURN NULL;
+        END $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_contacts_counters() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN PERFORM cpf_bump(cpf_contact_chamber(OLD.requirement_id), 'contact_' || OLD.status, -1, true); END IF;
+            IF TG_OP <> 'DELETE' THEN PERFORM cpf_bump(cpf_contact_chamber(NEW.requirement_id), 'contact_' || NEW.status, 1, true); END IF;
+            RETURN NULL;
+        END $$""")
+    c.execute("""
+        CREATE OR REPLACE FUNCTION cpf_contacts_rollup() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            -- Alta/baja cuentan en el día de creación; una respuesta se descuenta del día viejo y se suma al nuevo
+            IF TG_OP = 'INSERT' THEN PERFORM cpf_daily_contact(NEW, 1, 0); END IF;
+            IF TG_OP = 'DELETE' THEN PERFORM cpf_daily_contact(OLD, -1, 0); END IF;
+            IF TG_OP <> 'INSERT' AND OLD.status IN ('accepted', 'declined') THEN PERFORM cpf_daily_contact(OLD, 0, -1); END IF;
+            IF TG_OP <> 'DELETE' AND NEW.status IN ('accepted', 'declined') THEN PERFORM cpf_daily_contact(NEW, 0, 1); END IF;
+            RETURN NULL;
+        END $$""")
+    for name, event, fn in [
+        ("metrics_requirements", "INSERT OR DELETE OR UPDATE OF status, chamber_id ON requirements", "cpf_requirements_counters"),
+        ("rollup_requirements", "INSERT OR DELETE OR UPDATE OF chamber_id, category, req_type, created_at ON requirements",
+         "cpf_requirements_rollup"),
+        ("metrics_users", "INSERT OR DELETE OR UPDATE OF chamber_id ON users", "cpf_users_counters"),
+        ("metrics_contacts", "INSERT OR DELETE OR UPDATE OF status, requirement_id ON contact_requests", "cpf_contacts_counters"),
+        ("rollup_contacts", "INSERT OR DELETE OR UPDATE OF status, responded_at ON contact_requests", "cpf_contacts_rollup"),
+    ]:
+        c.execute(f"CREATE OR REPLACE TRIGGER {name} AFTER {event} FOR EACH ROW EXECUTE FUNCTION {fn}()")
+
+
+def _migration_contact_grants(c):
+    # Equivalente de db._migration_contact_grants
+    c.execute("""CREATE TABLE IF NOT EXISTS contact_grants (
+        requirement_id BIGINT NOT NULL REFERENCES requirements(id),
+        user_lo BIGINT NOT NULL,
+        user_hi BIGINT NOT NULL,
+        granted_at TEXT NOT NULL,
+        PRIMARY KEY(requirement_id, user_lo, user_hi)
+    )""")
+    db._unique_pending_contacts(c)
+    db.rebuild_contact_grants(c)
+
+
+def _migration_outbox(c):
+    # Equivalente de db._migration_outbox
+    for sql in [
+        """CREATE TABLE IF NOT EXISTS outbox (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            next_attempt_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            dispatched_at TEXT,
+            last_error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at, id) WHERE dispatched_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_dispatched ON outbox(dispatched_at) WHERE dispatched_at IS NOT NULL",
+        """CREATE TABLE IF NOT EXISTS notifications (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users(id),
+            kind TEXT NOT NULL,
+            requirement_id BIGINT,
+            message TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            read_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at)",
+        """CREATE TABLE IF NOT EXISTS notification_counters (
+            user_id BIGINT PRIMARY KEY,
+            unread INTEGER NOT NULL DEFAULT 0
+        )""",
+    ]:
+        c.execute(sql)
+
+
+def _migration_outbox_delivered(c):
+    # Mismo ALTER TABLE que db._migration_outbox_delivered
+    db._migration_outbox_delivered(c)
+
+
+# Migraciones Postgres, en su propia numeración (tabla schema_version). Una migración nueva
+# de SQLite que cambie el esquema lleva su equivalente al final de esta lista.
+MIGRATIONS = [
+    _create_schema,
+    _migration_contact_grants,
+    _migration_outbox,
+    _migration_outbox_delivered,
+]
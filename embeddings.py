@@ -0,0 +1,454 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+import db
+from matching import build_corpus, opposite_type, top_k_indices
+from scoring import fold
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: la app de escritorio es un único proceso, alcanza con el lock de hilos
+    fcntl = None
+
+# Embeddings semánticos para matching. El modelo es un archivo local (sin red): vocabulario,
+# vectores de palabras y pesos SIF; el vector de un requerimiento es el promedio ponderado de
+# sus palabras. Se arma con build_model (LSA sobre el corpus propio) o importando vectores
+# preentrenados en formato .vec (fastText/word2vec).
+MODEL_PATH = os.environ.get("CPF_EMBED_MODEL", str(db._data_dir() / "embeddings.npz"))
+EMBED_BATCH = 256
+# Filas del almacén por producto matriz-vector al buscar
+SEARCH_BLOCK = 65536
+SIF_A = 1e-3
+# Flags por fila del almacén
+OPEN, OFFER = 1, 2
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+log = logging.getLogger("cpf.embeddings")
+
+
+def tokenize(text):
+    return _WORD.findall(fold(text))
+
+
+def sif_weights(vocab, texts):
+    # Pesa menos las palabras frecuentes (a / (a + p(w))); las que no aparecen en el corpus pesan 1
+    counts = Counter(tok for t in texts for tok in tokenize(t))
+    total = max(1, sum(counts.values()))
+    return np.asarray([SIF_A / (SIF_A + counts[w] / total) if counts[w] else 1.0 for w in vocab], dtype=np.float32)
+
+
+class StaticModel:
+
+    def __init__(self, vocab, vectors, weights):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.vocab = {w: i for i, w in enumerate(vocab)}
+        self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.dim = vectors.shape[1]
+        self.fingerprint = hashlib.blake2b(self.vectors.tobytes() + self.weights.tobytes(), digest_size=8).hexdigest()
+
+    @classmethod
+    def load(cls, path=None):
+        with np.load(path or MODEL_PATH, allow_pickle=False) as z:
+            return cls(z["vocab"].tolist(), z["vectors"], z["weights"])
+
+    def save(self, path=None):
+        with open(path or MODEL_PATH, "wb") as f:
+            np.savez(f, vocab=np.asarray(list(self.vocab)), vectors=self.vectors, weights=self.weights)
+
+    def encode(self, texts):
+        rows, cols = [], []
+        for i, t in enumerate(texts):
+            for tok in tokenize(t):
+                j = self.vocab.get(tok)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+        cols = np.asarray(cols, dtype=np.int64)
+        # Las repeticiones se suman: cada aparición de la palabra aporta su peso
+        W = sp.csr_matrix((self.weights[cols], (rows, cols)), shape=(len(texts), len(self.vocab)), dtype=np.float32)
+        E = np.asarray(W @ self.vectors, dtype=np.float32)
+        return E / np.maximum(np.linalg.norm(E, axis=1, keepdims=True), 1e-12)
+
+
+def build_model(texts, dim=128, min_df=2, seed=0):
+    # LSA: SVD truncada de la matriz documento-término. Palabras usadas en los mismos contextos
+    # (caño/tubo, flete/transporte) quedan cerca aunque no aparezcan juntas en un mismo texto.
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(tokenizer=tokenize, lowercase=False, token_pattern=None, min_df=min_df, sublinear_tf=True)
+    X = vectorizer.fit_transform(texts)
+    svd = TruncatedSVD(n_components=max(1, min(dim, X.shape[1] - 1)), random_state=seed).fit(X)
+    vocab = vectorizer.get_feature_names_out().tolist()
+    return StaticModel(vocab, svd.components_.T * svd.singular_values_, sif_weights(vocab, texts))
+
+
+def load_vec(path, texts, max_words=200000):
+    # Vectores preentrenados en texto (.vec): se conservan las palabras del corpus y las max_words primeras
+    keep = {tok for t in texts for tok in tokenize(t)}
+    vocab, vectors, seen, dim = [], [], set(), None
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        if len(f.readline().split()) != 2:
+            f.seek(0)
+        for line in f:
+            parts = line.rstrip().split(" ")
+            word = fold(parts[0])
+            dim = dim or len(parts) - 1
+            if (len(parts) != dim + 1 or word in seen or not _WORD.fullmatch(word)
+                    or (len(vocab) >= max_words and word not in keep)):
+                continue
+            seen.add(word)
+            vocab.append(word)
+            vectors.append(np.asarray(parts[1:], dtype=np.float32))
+    return StaticModel(vocab, np.vstack(vectors), sif_weights(vocab, texts))
+
+
+class VectorStore:
+    # Un vector float16 por requerimiento en una matriz mapeada en memoria (vectors.f16), con su id
+    # (ids.i64) y flags abierto/tipo (flags.u1). Solo se agregan filas; meta.json guarda cuántas son
+    # válidas y con qué modelo se calcularon (otro modelo => se descarta todo). Si otro proceso
+    # agrega filas, meta.json cambia y los mapas se reabren.
+    FILES = (("vectors.f16", np.float16), ("ids.i64", np.int64), ("flags.u1", np.uint8))
+
+    def __init__(self, path, dim, fingerprint):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.fingerprint = fingerprint
+        self._lock = threading.RLock()
+        self._mtime = None
+        self.count = 0
+        self.capacity = 0
+        self.pos = {}
+        self.vectors = self.ids = self.flags = None
+        with self._lock, self._file_lock():
+            meta = self._read_meta()
+            if meta is None or meta["dim"] != dim or meta["model"] != fingerprint:
+                for name, _ in self.FILES:
+                    (self.path / name).unlink(missing_ok=True)
+                self._write_meta(0, 0)
+            self.refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.path / "lock", "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _read_meta(self):
+        try:
+            return json.loads((self.path / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, count, capacity):
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps({"dim": self.dim, "model": self.fingerprint, "count": count, "capacity": capacity}))
+        os.replace(tmp, self.path / "meta.json")
+
+    def _map(self, capacity):
+        self.vectors = self.ids = self.flags = None
+        if capacity:
+            shapes = {"vectors.f16": (capacity, self.dim), "ids.i64": (capacity,), "flags.u1": (capacity,)}
+            self.vectors, self.ids, self.flags = [np.memmap(self.path / name, dtype=dtype, mode="r+", shape=shapes[name])
+                                                  for name, dtype in self.FILES]
+        self.capacity = capacity
+
+    def refresh(self):
+        with self._lock:
+            try:
+                mtime = (self.path / "meta.json").stat().st_mtime_ns
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            meta = self._read_meta()
+            if meta is None or meta["model"] != self.fingerprint:
+                return
+            if meta["capacity"] != self.capacity:
+                self._map(meta["capacity"])
+            for i in range(self.count, meta["count"]):
+                self.pos[int(self.ids[i])] = i
+            self.count = meta["count"]
+            self._mtime = mtime
+
+    def _grow(self, capacity):
+        # Se sueltan los mapas antes de agrandar los archivos (Windows no permite truncar un archivo mapeado)
+        self._map(0)
+        for name, dtype in self.FILES:
+            width = self.dim if name == "vectors.f16" else 1
+            with open(self.path / name, "ab") as f:
+                f.truncate(capacity * width * np.dtype(dtype).itemsize)
+        self._map(capacity)
+
+    def add(self, ids, types, vectors):
+        with self._lock, self._file_lock():
+            self.refresh()
+            rows = {}
+            for i, rid in enumerate(ids):
+                if int(rid) not in self.pos:
+                    rows[int(rid)] = i
+            if not rows:
+                return 0
+            sel = np.fromiter(rows.values(), dtype=np.int64, count=len(rows))
+            start, end = self.count, self.count + len(rows)
+            if end > self.capacity:
+                self._grow(max(end, 2 * self.capacity, 1024))
+            self.vectors[start:end] = vectors[sel]
+            self.ids[start:end] = list(rows)
+            self.flags[start:end] = [OPEN | (OFFER if types[i] == "offer" else 0) for i in sel.tolist()]
+            for m in (self.vectors, self.ids, self.flags):
+                m.flush()
+            self._write_meta(end, self.capacity)
+            for k, rid in enumerate(rows):
+                self.pos[rid] = start + k
+            self.count = end
+            self._mtime = (self.path / "meta.json").stat().st_mtime_ns
+            return len(rows)
+
+    def missing(self, ids):
+        self.refresh()
+        return [i for i, rid in enumerate(ids) if int(rid) not in self.pos]
+
+    def close(self, rid):
+        with self._lock:
+            self.refresh()
+            i = self.pos.get(int(rid))
+            if i is not None:
+                self.flags[i] &= ~np.uint8(OPEN)
+
+    def close_others(self, open_ids):
+        # Marca cerrados los vectores de requerimientos que ya no están abiertos (cierres de otros procesos)
+        with self._lock:
+            self.refresh()
+            if not self.count:
+                return
+            stale = np.isin(self.ids[:self.count], np.asarray(open_ids, dtype=np.int64), invert=True)
+            self.flags[:self.count][stale] &= ~np.uint8(OPEN)
+
+    def lookup(self, ids):
+        with self._lock:
+            self.refresh()
+            pos = np.asarray([self.pos.get(int(rid), -1) for rid in ids], dtype=np.int64)
+            vectors = self.vectors
+        out = np.zeros((len(pos), self.dim), dtype=np.float32)
+        have = pos >= 0
+        if have.any():
+            out[have] = vectors[pos[have]]
+        return out
+
+    def search(self, q, req_type, exclude=None, top_k=5):
+        # Productos punto por bloques sobre el memmap (float16 -> float32 por bloque)
+        with self._lock:
+            self.refresh()
+            vectors, ids, flags, count = self.vectors, self.ids, self.flags, self.count
+        want = OPEN | (OFFER if req_type == "offer" else 0)
+        best_pos = np.zeros(0, dtype=np.int64)
+        best = np.zeros(0, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK):
+            end = min(count, start + SEARCH_BLOCK)
+            ok = (flags[start:end] & (OPEN | OFFER)) == want
+            if exclude is not None:
+                ok &= ids[start:end] != exclude
+            sel = np.flatnonzero(ok)
+            if sel.size == 0:
+                continue
+            scores = np.asarray(vectors[start:end][sel], dtype=np.float32) @ q
+            top = top_k_indices(scores, top_k)
+            best_pos = np.concatenate([best_pos, start + sel[top]])
+            best = np.concatenate([best, scores[top]])
+            keep = top_k_indices(best, top_k)
+            best_pos, best = best_pos[keep], best[keep]
+        return [(int(ids[p]), float(s)) for p, s in zip(best_pos, best)]
+
+
+class SemanticIndex:
+    # Modelo + almacén + hilo de fondo: las altas se encolan al crearse (create_requirement) y el
+    # hilo calcula sus vectores por lotes; backfill completa los faltantes (cargas masivas, otros procesos).
+
+    def __init__(self, model, store):
+        self.model = model
+        self.store = store
+        self.ready = False
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"embedded": 0, "batches": 0, "errors": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="cpf-embeddings", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, row):
+        self._ensure_started()
+        self._queue.put(("add", dict(row)))
+
+    def enqueue_close(self, req_id):
+        self._ensure_started()
+        self._queue.put(("close", req_id))
+
+    def backfill_async(self):
+        self._ensure_started()
+        self._queue.put(("backfill", None))
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < EMBED_BATCH:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # En orden: un cierre posterior a su alta tiene que aplicarse después de agregarla
+            adds = []
+            for op, arg in items:
+                try:
+                    if op == "add":
+                        adds.append(arg)
+                        continue
+                    if adds:
+                        self.embed_rows(adds)
+                        adds = []
+                    if op == "close":
+                        self.store.close(arg)
+                    else:
+                        self.backfill()
+                except Exception:
+                    # El hilo sigue con el resto de la cola; lo perdido se recupera con el próximo backfill
+                    self.stats["errors"] += 1
+                    log.exception("Error en la cola de embeddings (%s)", op)
+            if adds:
+                try:
+                    self.embed_rows(adds)
+                except Exception:
+                    self.stats["errors"] += 1
+                    log.exception("Error al calcular embeddings de %d requerimientos", len(adds))
+
+    def embed_rows(self, rows):
+        ids, texts = build_corpus(rows)
+        n = self.store.add(ids, [r["req_type"] for r in rows], self.model.encode(texts))
+        self.stats["embedded"] += n
+        self.stats["batches"] += 1
+
+    def backfill(self):
+        open_ids = []
+        with db.connection() as c:
+            for rows in db.stream(c, """SELECT id, req_type, title, description, tags, category, location
+                                          FROM requirements WHERE status='open' ORDER BY id"""):
+                open_ids.extend(r["id"] for r in rows)
+                missing = [rows[i] for i in self.store.missing([r["id"] for r in rows])]
+                for i in range(0, len(missing), EMBED_BATCH):
+                    self.embed_rows(missing[i:i + EMBED_BATCH])
+        self.store.close_others(open_ids)
+        self.ready = True
+
+    def ensure(self, ids, types, texts):
+        # Versión síncrona de backfill sobre un corpus ya cargado (batch_matching); devuelve sus vectores
+        missing = self.store.missing(ids)
+        for i in range(0, len(missing), EMBED_BATCH):
+            sel = missing[i:i + EMBED_BATCH]
+            self.store.add([ids[j] for j in sel], [types[j] for j in sel], self.model.encode([texts[j] for j in sel]))
+        self.store.close_others(ids)
+        self.ready = True
+        return self.store.lookup(ids)
+
+    def encode_row(self, row):
+        _, texts = build_corpus([row])
+        return self.model.encode(texts)[0]
+
+    def query(self, target_row, top_k=5):
+        return self.store.search(self.encode_row(target_row), opposite_type(target_row["req_type"]),
+                                 exclude=target_row["id"], top_k=top_k)
+
+    def scores(self, target_row, req_ids):
+        return self.store.lookup(req_ids) @ self.encode_row(target_row)
+
+
+def model_available():
+    return Path(MODEL_PATH).is_file()
+
+
+def store_path():
+    # Un almacén por base: junto al archivo SQLite o, con Postgres, en el directorio de datos
+    if db.is_postgres():
+        return db._data_dir() / ("vectors-" + hashlib.blake2b(db.DB_URL.encode("utf-8"), digest_size=6).hexdigest())
+    return db.DB_PATH.with_suffix(".vectors")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    path = store_path()
+    if _index is None or _index.store.path != path:
+        with _index_lock:
+            if _index is None or _index.store.path != path:
+                model = StaticModel.load()
+                _index = SemanticIndex(model, VectorStore(path, model.dim, model.fingerprint))
+    return _index
+
+
+def index_remove(req_id):
+    if _index is not None:
+        _index.enqueue_close(req_id)
+
+
+def index_stale():
+    if _index is not None:
+        _index.backfill_async()
+
+
+def _corpus_texts():
+    texts = []
+    with db.connection() as c:
+        for rows in db.stream(c, "SELECT id, title, description, tags, category, location FROM requirements"):
+            texts.extend(build_corpus(rows)[1])
+    return texts
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Modelo de embeddings y almacén de vectores para matching")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build-model", help="Arma el modelo desde los requerimientos de la base (LSA) o desde un .vec")
+    b.add_argument("--dim", type=int, default=128)
+    b.add_argument("--from-vec", default=None, help="Vectores preentrenados en texto (fastText/word2vec)")
+    b.add_argument("--max-words", type=int, default=200000)
+    b.add_argument("--out", default=MODEL_PATH)
+    sub.add_parser("backfill", help="Calcula los vectores faltantes de los requerimientos abiertos")
+    args = ap.parse_args(argv)
+    db.init_db()
+    if args.cmd == "build-model":
+        texts = _corpus_texts()
+        model = load_vec(args.from_vec, texts, args.max_words) if args.from_vec else build_model(texts, dim=args.dim)
+        model.save(args.out)
+        print(f"Modelo: {len(model.vocab)} palabras x {model.dim} dimensiones -> {args.out}")
+    else:
+        idx = get_index()
+        before = idx.stats["embedded"]
+        idx.backfill()
+        print(f"Vectores: {idx.store.count} ({idx.stats['embedded'] - before} nuevos) en {idx.store.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Instrumentación en proceso: cada llamada a services/auth/matching y cada sentencia SQL deja un
+# span (duración, filas, error) en un registro por operación con las últimas SAMPLES latencias
+# para percentiles. Las consultas que superan SLOW_QUERY_MS se loguean en "cpf.slow" con su plan.
+# Se exporta en texto Prometheus o JSON (pestaña Rendimiento, /metrics de api.py o serve()).
+ENABLED = os.environ.get("CPF_METRICS", "1") != "0"
+SAMPLES = 2048
+SLOW_QUERY_MS = float(os.environ.get("CPF_SLOW_QUERY_MS", "250"))
+SLOW_LOG_SIZE = 100
+# Tope de operaciones distintas (las sentencias SQL se agrupan por texto normalizado)
+MAX_OPERATIONS = 2000
+# Tope de spans guardados para el desglose de una ejecución (begin_run/end_run)
+MAX_RUN_SPANS = 5000
+# Puerto local del exportador HTTP (0 = apagado); escucha solo en 127.0.0.1
+METRICS_PORT = int(os.environ.get("CPF_METRICS_PORT", "0"))
+PERCENTILES = (50, 95, 99)
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+log = logging.getLogger("cpf.slow")
+
+
+class Operation:
+    __slots__ = ("name", "samples", "count", "errors", "rows", "seconds", "max_seconds")
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = deque(maxlen=SAMPLES)
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+_operations = {}
+_slow = deque(maxlen=SLOW_LOG_SIZE)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def record(name, seconds, rows=None, error=False):
+    with _lock:
+        op = _operations.get(name)
+        if op is None:
+            if len(_operations) >= MAX_OPERATIONS:
+                name = "sql (otras)" if name.startswith("sql ") else "(otras)"
+                op = _operations.get(name)
+            if op is None:
+                op = _operations[name] = Operation(name)
+        op.count += 1
+        op.seconds += seconds
+        op.samples.append(seconds)
+        if seconds > op.max_seconds:
+            op.max_seconds = seconds
+        if rows:
+            op.rows += rows
+        if error:
+            op.errors += 1
+    run = getattr(_local, "run", None)
+    if run is not None and len(run) < MAX_RUN_SPANS:
+        run.append((name, seconds, rows))
+
+
+def row_count(result):
+    # Filas de un resultado de services: listas y DataFrames (otros tipos no cuentan)
+    if isinstance(result, list):
+        return len(result)
+    if hasattr(result, "shape"):
+        return int(result.shape[0])
+    return None
+
+
+def traced(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                record(name, time.perf_counter() - t0, error=True)
+                raise
+            record(name, time.perf_counter() - t0, row_count(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def instrument(namespace, prefix, names=None):
+    # Envuelve las funciones públicas definidas en el módulo (o las nombradas). Se llama al final
+    # del módulo: las llamadas internas y los "from modulo import f" posteriores ven la versión medida.
+    # Los generadores (iter_*) quedan afuera: su tiempo transcurre mientras los consume el llamador.
+    module = namespace["__name__"]
+    for name in names or [n for n in list(namespace) if not n.startswith("_")]:
+        fn = namespace[name]
+        if not inspect.isfunction(fn) or fn.__module__ != module or inspect.isgeneratorfunction(fn):
+            continue
+        namespace[name] = traced(f"{prefix}.{name}")(fn)
+
+
+# SQL -------------------------------------------------------------------------------------------
+
+_SPACES = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_REPEATED_GROUPS = re.compile(r"\(…\)(?:\s*,\s*\(…\))+")
+
+
+@functools.lru_cache(maxsize=4096)
+def sql_name(sql):
+    # Una operación por sentencia: espacios colapsados y listas "IN (?,?,?)"/"VALUES (?,?),(?,?)"
+    # reducidas, para que el tamaño del lote no abra una operación nueva
+    text = _PLACEHOLDER_LIST.sub("(…)", _SPACES.sub(" ", sql).strip())
+    return "sql " + _REPEATED_GROUPS.sub("(…),…", text)
+
+
+def sql_done(sql, seconds, rows=None, error=False, explain=None):
+    record(sql_name(sql), seconds, rows, error)
+    if seconds * 1000 < SLOW_QUERY_MS or error:
+        return
+    plan = None
+    if explain is not None and sql.lstrip()[:6].upper().startswith(EXPLAINABLE):
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = [f"(sin plan: {e})"]
+    entry = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(seconds * 1000, 1), "rows": rows,
+             "sql": _SPACES.sub(" ", sql).strip(), "plan": plan}
+    _slow.append(entry)
+    # Solo el texto de la sentencia: los parámetros pueden llevar datos personales
+    log.warning("Consulta lenta (%.1f ms, %s filas): %s | plan: %s", entry["ms"], rows, entry["sql"],
+                " / ".join(plan) if plan else "-")
+
+
+class TracedCursor(sqlite3.Cursor):
+    # Cursor SQLite medido: el tiempo de execute más el de los fetch*, y las filas traídas. El span se
+    # cierra al agotar el resultado, al reusar o cerrar el cursor, o al liberarlo. Si el resultado se
+    # recorre iterando el cursor, cuenta solo execute y las filas quedan sin contar (rowcount en DML).
+    _pending = None
+
+    def execute(self, sql, params=()):
+        self._flush()
+        t0 = time.perf_counter()
+        try:
+            super().execute(sql, params)
+        except Exception:
+            sql_done(sql, time.perf_counter() - t0, error=True)
+            raise
+        self._pending = [sql, params, time.perf_counter() - t0, None]
+        return self
+
+    def executemany(self, sql, seq):
+        self._flush()
+        t0 = time.perf_counter()
+        try:
+            super().executemany(sql, seq)
+        except Exception:
+            sql_done(sql, time.perf_counter() - t0, error=True)
+            raise
+        # Lotes: se miden pero no cuentan como consulta lenta (su duración crece con el lote)
+        record(sql_name(sql), time.perf_counter() - t0, self.rowcount if self.rowcount >= 0 else None)
+        return self
+
+    def _fetched(self, t0, n, done):
+        p = self._pending
+        if p is None:
+            return
+        p[2] += time.perf_counter() - t0
+        p[3] = (p[3] or 0) + n
+        if done:
+            self._flush()
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(t0, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows), True)
+        return rows
+
+    def _flush(self):
+        p = self._pending
+        if p is None:
+            return
+        self._pending = None
+        sql, params, seconds, rows = p
+        if rows is None and self.rowcount >= 0:
+            rows = self.rowcount
+        conn = self.connection
+        sql_done(sql, seconds, rows,
+                 explain=lambda: [r[3] for r in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)])
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._flush()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    # Conexión SQLite cuyos execute/executemany devuelven un TracedCursor (db.conn y el pool)
+
+    def execute(self, sql, params=()):
+        return self.cursor(TracedCursor).execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor(TracedCursor).executemany(sql, seq)
+
+
+def connection_factory():
+    return TracedConnection if ENABLED else sqlite3.Connection
+
+
+# Desglose por ejecución (un rerun de Streamlit, un request) -------------------------------------
+
+def begin_run():
+    # Desde acá, los spans de este hilo se guardan también para end_run()
+    _local.run = []
+    _local.run_t0 = time.perf_counter()
+
+
+def end_run(name=None):
+    # Cierra la ejecución del hilo: (segundos, [por operación: n, ms, filas], ordenado por ms).
+    # Los tiempos incluyen las llamadas anidadas (services -> sql), no se suman entre sí.
+    run = getattr(_local, "run", None)
+    if run is None:
+        return 0.0, []
+    elapsed = time.perf_counter() - _local.run_t0
+    _local.run = None
+    if name and ENABLED:
+        record(name, elapsed)
+    by_op = {}
+    for op, seconds, rows in run:
+        agg = by_op.setdefault(op, {"op": op, "n": 0, "ms": 0.0, "rows": 0})
+        agg["n"] += 1
+        agg["ms"] += seconds * 1000
+        agg["rows"] += rows or 0
+    out = sorted(by_op.values(), key=lambda a: -a["ms"])
+    for agg in out:
+        agg["ms"] = round(agg["ms"], 2)
+    return elapsed, out
+
+
+# Lectura y exportación --------------------------------------------------------------------------
+
+def kind(name):
+    return "sql" if name.startswith("sql ") else name.split(".", 1)[0]
+
+
+def _percentile(ordered, p):
+    # Rango más cercano sobre las muestras ordenadas
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def snapshot():
+    with _lock:
+        items = [(op.name, op.count, op.errors, op.rows, op.seconds, op.max_seconds, list(op.samples))
+                 for op in _operations.values()]
+    out = []
+    for name, count, errors, rows, seconds, max_seconds, samples in items:
+        samples.sort()
+        entry = {"op": name, "kind": kind(name), "count": count, "errors": errors, "rows": rows,
+                 "total_ms": round(seconds * 1000, 2), "mean_ms": round(seconds * 1000 / count, 3),
+                 "max_ms": round(max_seconds * 1000, 3)}
+        for p in PERCENTILES:
+            entry[f"p{p}_ms"] = round(_percentile(samples, p) * 1000, 3)
+        out.append(entry)
+    out.sort(key=lambda e: -e["total_ms"])
+    return out
+
+
+def slow_queries():
+    return list(_slow)
+
+
+def reset():
+    with _lock:
+        _operations.clear()
+        _slow.clear()
+
+
+def to_json():
+    return json.dumps({"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "slow_query_ms": SLOW_QUERY_MS,
+                       "operations": snapshot(), "slow_queries": slow_queries()}, ensure_ascii=False, indent=2)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def to_prometheus():
+    lines = [
+        "# HELP cpf_operation_seconds Latencia por operación (services/auth/matching/sql), últimas muestras.",
+        "# TYPE cpf_operation_seconds summary",
+    ]
+    ops = snapshot()
+    for e in ops:
+        op = _label(e["op"])
+        for p in PERCENTILES:
+            lines.append(f'cpf_operation_seconds{{op="{op}",quantile="{p / 100}"}} {e[f"p{p}_ms"] / 1000:.6f}')
+        lines.append(f'cpf_operation_seconds_sum{{op="{op}"}} {e["total_ms"] / 1000:.6f}')
+        lines.append(f'cpf_operation_seconds_count{{op="{op}"}} {e["count"]}')
+    for metric, key, help_text in (("cpf_operation_errors_total", "errors", "Llamadas terminadas con excepción."),
+                                   ("cpf_operation_rows_total", "rows", "Filas devueltas o afectadas.")):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{op="{_label(e["op"])}"}} {e[key]}' for e in ops]
+    lines += ["# HELP cpf_slow_queries Consultas lentas retenidas.", "# TYPE cpf_slow_queries gauge",
+              f"cpf_slow_queries {len(_slow)}"]
+    return "\n".join(lines) + "\n"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port=None, host="127.0.0.1"):
+    # Exportador HTTP en un hilo daemon: /metrics (Prometheus) y /metrics.json. Uno por proceso.
+    global _server
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] == "/metrics":
+                body, ctype = to_prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+            elif self.path.split("?")[0] == "/metrics.json":
+                body, ctype = to_json(), "application/json; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), Handler)
+            except OSError as e:
+                log.warning("No se pudo abrir el exportador de métricas en %s:%s: %s", host, port, e)
+                return None
+            threading.Thread(target=_server.serve_forever, name="cpf-metrics", daemon=True).start()
+        return _server
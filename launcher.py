@@ -9,6 +9,8 @@ import webbrowser
 HOST = "127.0.0.1"
 PORT = 8501
 WAIT_SECONDS = 120
+# Intervalo de sondeo del puerto: cada vuelta es demora agregada a la apertura del navegador
+POLL_SECONDS = 0.1
 
 def log_path():
     base = Path(os.environ.get("LOCALAPPDATA", Path.home()))
@@ -35,6 +37,7 @@ def workdir() -> str:
 
 def main():
     log("=== INICIO CPF ===")
+    t0 = time.perf_counter()
 
     wd = workdir()
     app = os.path.join(wd, "app.py")
@@ -53,21 +56,28 @@ def main():
         f"--server.address={HOST}",
         f"--server.port={PORT}",
         "--browser.gatherUsageStats=false",
+        # Sin vigilar archivos: en una instalación no cambian y el watcher recorre la carpeta al arrancar
+        "--server.fileWatcherType=none",
     ]
 
     log("Ejecutando Streamlit: " + " ".join(cmd))
 
     log_file = open(log_path(), "a", encoding="utf-8")
 
+    # La app (startup.py) loguea sus fases relativas a este instante
+    env = dict(os.environ, CPF_LAUNCHED_AT=str(time.time()))
     proc = subprocess.Popen(
         cmd,
         cwd=wd,
+        env=env,
         stdout=log_file,
         stderr=log_file,
         stdin=subprocess.DEVNULL,
         creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
     )
 
+    log(f"Arranque: Streamlit lanzado en {time.perf_counter() - t0:.2f} s")
+
     start = time.time()
     while time.time() - start < WAIT_SECONDS:
         # Si el proceso murió, cortamos y dejamos log
@@ -77,12 +87,12 @@ def main():
 
         if port_open():
             url = f"http://{HOST}:{PORT}"
-            log("Servidor OK → " + url)
+            log(f"Servidor OK → {url} (arranque: {time.perf_counter() - t0:.2f} s)")
             webbrowser.open(url)
             proc.wait()
             return
 
-        time.sleep(0.5)
+        time.sleep(POLL_SECONDS)
 
     log("ERROR: Streamlit no levantó en el tiempo de espera")
     proc.terminate()
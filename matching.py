@@ -1,7 +1,38 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import logging
+import os
+import threading
+import time
+
 import numpy as np
 
+import instrumentation
+import scoring
+from db import METRICS_GLOBAL, connection
+
+REFIT_INTERVAL_SECONDS = 600
+# Cantidad de altas/bajas luego de las cuales conviene reajustar vocabulario e IDF
+REFIT_AFTER_CHANGES = 500
+
+# Motor de búsqueda: exact | postings | lsh | auto (postings a partir de ANN_MIN_ROWS documentos)
+MATCH_BACKEND = os.environ.get("CPF_MATCH_BACKEND", "auto")
+ANN_MIN_ROWS = 20000
+# Perillas recall/latencia (más términos/profundidad/tablas => más recall y más candidatos a puntuar)
+ANN_QUERY_TERMS = int(os.environ.get("CPF_ANN_QUERY_TERMS", "8"))
+ANN_POSTINGS_DEPTH = int(os.environ.get("CPF_ANN_POSTINGS_DEPTH", "2000"))
+ANN_TABLES = int(os.environ.get("CPF_ANN_TABLES", "8"))
+ANN_BITS = int(os.environ.get("CPF_ANN_BITS", "14"))
+ANN_PROBES = int(os.environ.get("CPF_ANN_PROBES", "2"))
+
+# Puntuación: tfidf | embeddings | hybrid | auto (hybrid si existe el modelo de embeddings, ver embeddings.py)
+MATCH_ENGINE = os.environ.get("CPF_MATCH_ENGINE", "auto")
+# Peso del score semántico en hybrid (el resto es TF-IDF)
+HYBRID_ALPHA = float(os.environ.get("CPF_HYBRID_ALPHA", "0.5"))
+# Candidatos que aporta cada motor antes de combinar: top_k * HYBRID_POOL
+HYBRID_POOL = 4
+
+log = logging.getLogger("cpf.matching")
+
+
 def build_corpus(rows):
     texts = []
     ids = []
@@ -17,16 +48,495 @@ def build_corpus(rows):
         ids.append(r["id"])
     return ids, texts
 
+# scikit-learn y SciPy se importan al primer uso (ver startup.py): importar matching es barato
+# y la pantalla de ingreso no paga su carga
+def new_vectorizer():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(stop_words=None, max_features=5000, ngram_range=(1,2))
+
 def top_matches(target_row, candidate_rows, top_k=5):
     if not candidate_rows:
         return []
+    from sklearn.metrics.pairwise import cosine_similarity
     all_rows = [target_row] + list(candidate_rows)
     ids, texts = build_corpus(all_rows)
-    vectorizer = TfidfVectorizer(stop_words=None, max_features=5000, ngram_range=(1,2))
+    vectorizer = new_vectorizer()
     X = vectorizer.fit_transform(texts)
     sims = cosine_similarity(X[0:1], X[1:]).flatten()
-    order = np.argsort(-sims)[:top_k]
+    order = top_k_indices(sims, top_k)
     out = []
     for idx in order:
         out.append((candidate_rows[idx], float(sims[idx])))
     return out
+
+
+def top_k_indices(scores, k):
+    # Selección parcial O(n) y orden solo de los k elegidos
+    if k <= 0 or scores.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < scores.size:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(scores.size)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def opposite_type(req_type):
+    return "need" if req_type == "offer" else "offer"
+
+
+class PostingsBackend:
+    # Índice invertido con listas ordenadas por impacto (peso TF-IDF descendente).
+    # Solo se recorren los términos de mayor peso de la consulta y la cabeza de cada lista,
+    # al estilo de la poda MaxScore; los candidatos se puntúan luego en forma exacta.
+
+    def __init__(self, n_terms=None, depth=None):
+        self.n_terms = n_terms or ANN_QUERY_TERMS
+        self.depth = depth or ANN_POSTINGS_DEPTH
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self._tail = []
+
+    def build(self, X):
+        Xc = X.tocsc()
+        cols = np.repeat(np.arange(Xc.shape[1]), np.diff(Xc.indptr))
+        order = np.lexsort((-Xc.data, cols))
+        self.indptr = Xc.indptr.astype(np.int64)
+        self.rows = Xc.indices[order].astype(np.int64)
+        self._tail = []
+        return self
+
+    def add(self, X, start=0):
+        # Las altas posteriores al ajuste quedan siempre como candidatas hasta el próximo reajuste
+        self._tail.extend(range(start, start + X.shape[0]))
+        return self
+
+    def candidates(self, q):
+        q = q.tocsr()
+        terms = q.indices[np.argsort(-q.data)[:self.n_terms]]
+        parts = [self.rows[self.indptr[j]:min(self.indptr[j] + self.depth, self.indptr[j + 1])]
+                 for j in terms if j + 1 < len(self.indptr)]
+        if self._tail:
+            parts.append(np.asarray(self._tail, dtype=np.int64))
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+
+class LSHBackend:
+    # Hashing por proyecciones aleatorias (coseno): cada tabla agrupa documentos por el
+    # signo de n_bits proyecciones. Devuelve posiciones candidatas que luego se puntúan exacto.
+
+    def __init__(self, n_features, n_tables=None, n_bits=None, n_probes=None, seed=0):
+        n_tables = n_tables or ANN_TABLES
+        n_bits = n_bits or ANN_BITS
+        n_probes = ANN_PROBES if n_probes is None else n_probes
+        rng = np.random.default_rng(seed)
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_probes = min(n_probes, n_bits)
+        self.R = rng.standard_normal((n_features, n_tables * n_bits)).astype(np.float32)
+        self._weights = (1 << np.arange(n_bits, dtype=np.int64))
+        self.buckets = [{} for _ in range(n_tables)]
+
+    def _project(self, X):
+        return np.asarray(X @ self.R).reshape(X.shape[0], self.n_tables, self.n_bits)
+
+    def add(self, X, start=0):
+        if X.shape[0] == 0:
+            return self
+        codes = (self._project(X) > 0).astype(np.int64) @ self._weights
+        for t in range(self.n_tables):
+            table = self.buckets[t]
+            for i, code in enumerate(codes[:, t].tolist()):
+                table.setdefault(code, []).append(start + i)
+        return self
+
+    def candidates(self, q):
+        proj = self._project(q)[0]
+        codes = (proj > 0).astype(np.int64) @ self._weights
+        # Multi-probe: además del bucket propio, los que difieren en los bits de menor margen
+        flips = np.argsort(np.abs(proj), axis=1)[:, :self.n_probes]
+        found = []
+        for t in range(self.n_tables):
+            table = self.buckets[t]
+            code = int(codes[t])
+            for probe in [code] + [code ^ (1 << int(b)) for b in flips[t]]:
+                hit = table.get(probe)
+                if hit:
+                    found.append(hit)
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([np.asarray(h, dtype=np.int64) for h in found]))
+
+
+def make_ann(X, backend=None):
+    backend = backend or MATCH_BACKEND
+    if backend == "auto":
+        backend = "postings" if X.shape[0] >= ANN_MIN_ROWS else "exact"
+    if backend == "postings":
+        return PostingsBackend().build(X)
+    if backend == "lsh":
+        return LSHBackend(X.shape[1]).add(X)
+    return None
+
+
+class MatchIndex:
+    # Índice TF-IDF persistente en memoria: vocabulario + IDF del último ajuste y
+    # matriz dispersa (filas L2-normalizadas) de los requerimientos abiertos.
+    # Las altas se vectorizan con el vocabulario vigente; las bajas solo se marcan.
+
+    def __init__(self, backend=None):
+        import scipy.sparse as sp
+        self._lock = threading.RLock()
+        self.backend = backend
+        self.ann = None
+        self.vectorizer = None
+        self.X = sp.csr_matrix((0, 0))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.types = np.zeros(0, dtype=object)
+        self.active = np.zeros(0, dtype=bool)
+        self.rules = scoring.RuleTable()
+        self.pos = {}
+        self._pending = []
+        self._journal = None
+        self.changes = 0
+        self.fitted_at = None
+        # updated_at más reciente que refleja el índice (ver sync_external)
+        self.synced_to = None
+
+    def fit(self, rows):
+        import scipy.sparse as sp
+        rows = list(rows)
+        ids, texts = build_corpus(rows)
+        vectorizer = None
+        X = sp.csr_matrix((len(rows), 0))
+        if any(texts):
+            vectorizer = new_vectorizer()
+            X = vectorizer.fit_transform(texts).tocsr()
+        ann = make_ann(X, self.backend) if vectorizer is not None else None
+        rules = scoring.RuleTable().extend(rows)
+        with self._lock:
+            self.ann = ann
+            self.vectorizer = vectorizer
+            self.X = X
+            self.ids = np.asarray(ids, dtype=np.int64)
+            self.types = np.asarray([r["req_type"] for r in rows], dtype=object)
+            self.active = np.ones(len(rows), dtype=bool)
+            self.rules = rules
+            self.pos = {rid: i for i, rid in enumerate(ids)}
+            self._pending = []
+            self.changes = 0
+            self.fitted_at = time.time()
+            journal, self._journal = self._journal, None
+            # Reaplicar los cambios ocurridos mientras se reajustaba
+            for op, arg in journal or []:
+                if op == "add":
+                    self.add(arg)
+                elif op == "remove":
+                    self.remove(arg)
+                else:
+                    self.mark_stale()
+
+    @instrumentation.traced("matching.refit")
+    def refit(self):
+        with self._lock:
+            self._journal = []
+        try:
+            with connection() as c:
+                mark = last_update(c)
+            self.fit(load_open_rows())
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+        self.synced_to = mark
+
+    def add(self, row):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("add", row))
+            if self.vectorizer is None:
+                # Sin vocabulario todavía: el próximo reajuste lo incorpora
+                self.changes += 1
+                return
+            if row["id"] in self.pos:
+                return
+            _, texts = build_corpus([row])
+            self.pos[row["id"]] = len(self.ids) + len(self._pending)
+            self._pending.append((row["id"], row["req_type"], self.vectorizer.transform(texts), row))
+            self.changes += 1
+
+    def remove(self, req_id):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("remove", req_id))
+            self._compact()
+            i = self.pos.get(req_id)
+            if i is not None:
+                self.active[i] = False
+                self.changes += 1
+
+    def mark_stale(self):
+        # Cargas masivas escritas por fuera del índice: se fuerza un reajuste completo
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("stale", None))
+            self.changes += REFIT_AFTER_CHANGES
+
+    def _compact(self):
+        if not self._pending:
+            return
+        import scipy.sparse as sp
+        new_ids = [p[0] for p in self._pending]
+        new_X = sp.vstack([p[2] for p in self._pending], format="csr")
+        if self.ann is not None:
+            self.ann.add(new_X, start=len(self.ids))
+        self.X = sp.vstack([self.X, new_X], format="csr")
+        self.ids = np.concatenate([self.ids, np.asarray(new_ids, dtype=np.int64)])
+        self.types = np.concatenate([self.types, np.asarray([p[1] for p in self._pending], dtype=object)])
+        self.active = np.concatenate([self.active, np.ones(len(new_ids), dtype=bool)])
+        # Copia y reemplazo, como X/ids: rank() usa la tabla tomada bajo el lock sin que crezca en el medio
+        self.rules = self.rules.extended([p[3] for p in self._pending])
+        self._pending = []
+
+    def query(self, target_row, top_k=5, exact=False):
+        with self._lock:
+            self._compact()
+            vectorizer, ann, X, ids, types, active = self.vectorizer, self.ann, self.X, self.ids, self.types, self.active
+        if vectorizer is None or X.shape[0] == 0:
+            return []
+        mask = active & (types == opposite_type(target_row["req_type"])) & (ids != target_row["id"])
+        _, texts = build_corpus([target_row])
+        q = vectorizer.transform(texts)
+        cand = None
+        if ann is not None and not exact:
+            pos = ann.candidates(q)
+            cand = pos[mask[pos]]
+            if cand.size < top_k:
+                # Pocos candidatos aproximados: se cae al barrido exacto
+                cand = None
+        if cand is None:
+            cand = np.flatnonzero(mask)
+        if cand.size == 0:
+            return []
+        sims = np.asarray((X[cand] @ q.T).todense()).ravel()
+        order = top_k_indices(sims, top_k)
+        return [(int(ids[cand[i]]), float(sims[i])) for i in order]
+
+    def scores(self, target_row, req_ids):
+        # Score exacto de ids puntuales (candidatos de otro motor); 0 si no están abiertos en el índice
+        with self._lock:
+            self._compact()
+            vectorizer, X, active = self.vectorizer, self.X, self.active
+            rows = np.asarray([self.pos.get(int(rid), -1) for rid in req_ids], dtype=np.int64)
+        out = np.zeros(len(rows))
+        if vectorizer is None or X.shape[0] == 0:
+            return out
+        ok = np.flatnonzero(rows >= 0)
+        ok = ok[active[rows[ok]]]
+        if ok.size:
+            _, texts = build_corpus([target_row])
+            out[ok] = (X[rows[ok]] @ vectorizer.transform(texts).T).toarray().ravel()
+        return out
+
+    def rank(self, target_row, top_k=5, semantic=None, weight=0.0, same_chamber=False):
+        # Prefiltro por rubro/ubicación/cámara (scoring.prefilter), texto exacto sobre los candidatos
+        # (mezclado con embeddings si weight > 0) y score con reglas. Devuelve (id, score, partes, filtros).
+        with self._lock:
+            self._compact()
+            vectorizer, X, ids, types, active, rules = self.vectorizer, self.X, self.ids, self.types, self.active, self.rules
+        if X.shape[0] == 0:
+            return []
+        allowed = active & (types == opposite_type(target_row["req_type"])) & (ids != target_row["id"])
+        cand, filters = scoring.prefilter(rules, target_row, allowed, top_k, same_chamber)
+        if cand.size == 0:
+            return []
+        text = np.zeros(cand.size)
+        if vectorizer is not None and weight < 1:
+            _, texts = build_corpus([target_row])
+            text = np.asarray((X[cand] @ vectorizer.transform(texts).T).todense()).ravel()
+        if weight > 0:
+            text = (1 - weight) * text + weight * semantic.scores(target_row, ids[cand])
+        total, parts = scoring.score(rules, target_row, cand, text)
+        return [(int(ids[cand[i]]), float(total[i]), {k: float(v[i]) for k, v in parts.items()}, filters)
+                for i in top_k_indices(total, top_k)]
+
+    def is_open(self, req_id):
+        with self._lock:
+            self._compact()
+            i = self.pos.get(req_id)
+            return i is not None and bool(self.active[i])
+
+    def open_count(self):
+        with self._lock:
+            return int(self.active.sum()) + len(self._pending)
+
+    def needs_refit(self):
+        return (self.vectorizer is None and self.changes > 0) or self.changes >= REFIT_AFTER_CHANGES
+
+
+OPEN_ROWS_SQL = """SELECT id, req_type, title, description, tags, category, location, urgency, chamber_id, created_at
+                     FROM requirements WHERE status='open'"""
+
+
+def load_open_rows():
+    with connection() as c:
+        rows = c.execute(OPEN_ROWS_SQL).fetchall()
+    return rows
+
+
+def last_update(c):
+    # Último updated_at escrito por cualquier proceso; cada subconsulta usa idx_requirements_status_updated
+    row = c.execute(
+        """SELECT (SELECT MAX(updated_at) FROM requirements WHERE status='open'),
+                  (SELECT MAX(updated_at) FROM requirements WHERE status='closed')"""
+    ).fetchone()
+    return max(row[0] or "", row[1] or "")
+
+
+def sync_external(idx):
+    # Altas y cierres hechos por otros procesos (API, CLI, batch_matching, otra instancia de la app), que no
+    # pasan por index_add/index_remove de este proceso: se leen por updated_at desde la última vuelta. Si
+    # aun así el total de abiertos no coincide con metric_counters (relojes desfasados, borrados a mano),
+    # se fuerza un reajuste completo.
+    if idx.synced_to is None:
+        return
+    since = idx.synced_to
+    with connection() as c:
+        # >= y no >: updated_at tiene resolución de segundos y puede repetirse en la vuelta siguiente
+        mark = last_update(c)
+        opened = c.execute(OPEN_ROWS_SQL + " AND updated_at >= ?", (since,)).fetchall()
+        closed = [r[0] for r in c.execute("SELECT id FROM requirements WHERE status='closed' AND updated_at >= ?", (since,))]
+        total = c.execute("SELECT n FROM metric_counters WHERE chamber_id=? AND metric='req_open'", (METRICS_GLOBAL,)).fetchone()
+    for row in opened:
+        if not idx.is_open(row["id"]):
+            index_add(row)
+    for req_id in closed:
+        if idx.is_open(req_id):
+            index_remove(req_id)
+    idx.synced_to = mark
+    if total is not None and total[0] != idx.open_count():
+        idx.mark_stale()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                idx = MatchIndex()
+                idx.refit()
+                _index = idx
+                threading.Thread(target=_refit_loop, args=(idx,), name="cpf-match-refit", daemon=True).start()
+    return _index
+
+
+def _refit_loop(idx):
+    last = time.time()
+    while True:
+        time.sleep(5)
+        try:
+            sync_external(idx)
+        except Exception:
+            log.exception("Falló la sincronización del índice de matching")
+        if idx.needs_refit() or (idx.changes and time.time() - last >= REFIT_INTERVAL_SECONDS):
+            try:
+                idx.refit()
+            except Exception:
+                # Se sigue sirviendo el índice anterior; se reintenta en la próxima vuelta
+                log.exception("Falló el reajuste del índice de matching")
+            last = time.time()
+
+
+_warned = False
+
+
+def semantic_weight():
+    # Peso del score de embeddings según MATCH_ENGINE; sin archivo de modelo se usa solo TF-IDF
+    global _warned
+    if MATCH_ENGINE == "tfidf":
+        return 0.0
+    import embeddings
+    if not embeddings.model_available():
+        if MATCH_ENGINE != "auto" and not _warned:
+            log.warning("Sin modelo de embeddings en %s: se usa TF-IDF", embeddings.MODEL_PATH)
+            _warned = True
+        return 0.0
+    return 1.0 if MATCH_ENGINE == "embeddings" else HYBRID_ALPHA
+
+
+def blend(lexical, semantic, target_row, top_k, weight):
+    # Unión de los candidatos de ambos motores, puntuados en los dos y combinados linealmente
+    pool = top_k * HYBRID_POOL
+    cand = {rid for rid, _ in semantic.query(target_row, top_k=pool)}
+    if weight < 1:
+        cand.update(rid for rid, _ in lexical.query(target_row, top_k=pool))
+    if not cand:
+        return []
+    ids = np.fromiter(cand, dtype=np.int64, count=len(cand))
+    scores = weight * semantic.scores(target_row, ids)
+    if weight < 1:
+        scores += (1 - weight) * lexical.scores(target_row, ids)
+    return [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+
+def rank(target_row, top_k=5, same_chamber=False):
+    # Pipeline con reglas (scoring.py); (id, score, partes, filtros) por sugerencia
+    weight, semantic = semantic_weight(), None
+    if weight > 0:
+        import embeddings
+        semantic = embeddings.get_index()
+        if not semantic.ready:
+            semantic.backfill_async()
+            weight = 0.0
+    return get_index().rank(target_row, top_k=top_k, semantic=semantic, weight=weight, same_chamber=same_chamber)
+
+
+def suggest(target_row, top_k=5):
+    if scoring.MATCH_RULES:
+        return [(rid, score) for rid, score, _, _ in rank(target_row, top_k=top_k)]
+    weight = semantic_weight()
+    if weight > 0:
+        import embeddings
+        semantic = embeddings.get_index()
+        if semantic.ready:
+            return blend(get_index(), semantic, target_row, top_k, weight)
+        # Almacén todavía incompleto (primer uso en este proceso): TF-IDF mientras se completa
+        semantic.backfill_async()
+    return get_index().query(target_row, top_k=top_k)
+
+
+def index_add(row):
+    # Solo se mantiene el índice si ya fue construido en este proceso; el vector semántico se
+    # calcula siempre que haya modelo (en el hilo de embeddings, fuera del request)
+    if _index is not None:
+        _index.add(row)
+    if semantic_weight() > 0:
+        import embeddings
+        embeddings.get_index().enqueue(row)
+
+
+def index_remove(req_id):
+    if _index is not None:
+        _index.remove(req_id)
+    if MATCH_ENGINE != "tfidf":
+        import embeddings
+        embeddings.index_remove(req_id)
+
+
+def index_stale():
+    if _index is not None:
+        _index.mark_stale()
+    if MATCH_ENGINE != "tfidf":
+        import embeddings
+        embeddings.index_stale()
+
+
+# Spans por llamada en los puntos de entrada (los helpers internos se llaman por fila y no se miden)
+instrumentation.instrument(globals(), "matching", ["top_matches", "load_open_rows", "rank", "suggest",
+                                                   "index_add", "index_remove", "index_stale"])
@@ -0,0 +1,177 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+import cache
+import db
+
+# Escaneos completos aceptados: tablas de referencia chicas o listados completos por diseño
+ALLOWED_SCANS = {
+    "sqlite_master",
+    "chambers",
+    "job_runs",
+}
+
+
+def seed(n_chambers=30, n_users=2000, n_requirements=20000, n_contacts=5000, seed=0):
+    from benchmarks.synth import requirement_rows
+    rng = random.Random(seed)
+    now = db.now_iso()
+    with db.transaction() as c:
+        c.executemany(
+            "INSERT INTO chambers(name, province, city, created_at) VALUES(?,?,?,?)",
+            [(f"Cámara {i}", "", "", now) for i in range(n_chambers)]
+        )
+        c.executemany(
+            "INSERT INTO users(email, password_hash, name, company, phone, chamber_id, role, created_at) VALUES(?,?,?,?,?,?,?,?)",
+            [(f"u{i}@cpf", "x", f"Usuario {i}", f"Empresa {i}", "", rng.randint(1, n_chambers),
+              "admin" if i == 0 else "user", f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}") for i in range(n_users)]
+        )
+        rows = requirement_rows(n_requirements, seed=seed)
+        c.executemany(
+            """INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency,
+                                        status, created_at, updated_at) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""",
+            [(rng.randint(1, n_users), rng.randint(1, n_chambers), r["req_type"], r["title"], r["description"], r["tags"],
+              r["category"], r["location"], r["urgency"], "open" if rng.random() < 0.8 else "closed",
+              f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00", now) for i, r in enumerate(rows)]
+        )
+        c.executemany(
+            "INSERT INTO contact_requests(from_user_id, to_user_id, requirement_id, status, created_at) VALUES(?,?,?,?,?) "
+            "ON CONFLICT DO NOTHING",
+            [(rng.randint(1, n_users), rng.randint(1, n_users), rng.randint(1, n_requirements),
+              rng.choice(["pending", "accepted", "declined"]), now) for _ in range(n_contacts)]
+        )
+        db.rebuild_contact_grants(c)
+        c.execute("ANALYZE")
+
+
+def exercise():
+    # Invoca cada función de servicio con sus variantes de filtros
+    import auth
+    import services as svc
+    svc.list_chambers()
+    svc.list_users()
+    svc.list_users(chamber_id=3)
+    auth.get_user_by_email("u5@cpf")
+    auth.any_admin_exists()
+    for f in [
+        {},
+        {"status": "open"},
+        {"status": "open", "req_type": "offer"},
+        {"status": "open", "chamber_id": 3},
+        {"status": "closed", "req_type": "need", "chamber_id": 2},
+        {"status": "open", "category": "logistica"},
+        {"status": "open", "location": "Rosario"},
+        {"status": "open", "q": "flete"},
+    ]:
+        svc.list_requirements(f)
+        _, cursor = svc.list_requirements_page(f, limit=20)
+        if cursor:
+            svc.list_requirements_page(f, after=cursor, limit=20)
+    svc.get_requirement(1)
+    svc.get_requirements_by_ids([1, 2, 3])
+    svc.match_counts([1, 2, 3])
+    svc._precomputed_matches(svc.get_requirement(1), 5)
+    import matching
+    idx = matching.MatchIndex()
+    idx.synced_to = "2024-01-01"
+    matching.sync_external(idx)
+    svc.list_inbox(5)
+    svc.list_sent(5)
+    svc.can_view_contact(5, 6, 7)
+    svc.contact_status(5, [(i, 6) for i in range(1, 600)])
+    svc.create_contact_request(5, 5, 6, 7)
+    svc.respond_contact_request(5, 1, "accepted")
+    import notifications
+    notifications.dispatcher.mailer = notifications.MemoryMailer()
+    notifications.dispatcher.dispatch_once()
+    notifications.dispatcher._purge()
+    notifications.unread_count(6)
+    notifications.list_notifications(6)
+    notifications.mark_read(6)
+    svc.close_requirement(5, 10)
+    svc.admin_metrics()
+    svc.admin_metrics(chamber_id=3)
+    import sessions
+    token = sessions.create_session(5)
+    sessions.resolve(token)
+    sessions.revoke(token)
+    svc.deactivate_user(1, 6, is_active=False)
+    import analytics
+    analytics.period_summary()
+    analytics.requirement_series("2024-01-01", "2024-12-31", "W", "category")
+    analytics.contact_series("2024-01-01", "2024-12-31", "M", chamber_id=3)
+
+
+def explain(c, sql):
+    return [r["detail"] for r in c.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+
+
+def is_table_scan(detail):
+    if not detail.startswith("SCAN ") or detail == "SCAN CONSTANT ROW":
+        return False
+    if "USING INDEX" in detail or "USING COVERING INDEX" in detail or "VIRTUAL TABLE" in detail:
+        return False
+    return True
+
+
+def scanned_table(c, detail, sql):
+    # "SCAN r" usa el alias: se resuelve contra los FROM/JOIN de la consulta
+    name = detail.split()[1]
+    tables = {t["name"] for t in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    if name in tables:
+        return name
+    tokens = sql.replace("\n", " ").split()
+    for i, tok in enumerate(tokens[1:], start=1):
+        if tok == name and tokens[i - 1] in tables:
+            return tokens[i - 1]
+    return name
+
+
+def check(verbose=False):
+    statements = []
+    with db.connection() as c:
+        c.set_trace_callback(statements.append)
+        try:
+            exercise()
+        finally:
+            c.set_trace_callback(None)
+        problems = []
+        seen = set()
+        for sql in statements:
+            head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+            if head not in ("SELECT", "UPDATE", "DELETE", "INSERT") or sql in seen:
+                continue
+            seen.add(sql)
+            plan = explain(c, sql)
+            if verbose:
+                print(" ".join(sql.split())[:160])
+                for d in plan:
+                    print("    " + d)
+            for d in plan:
+                if is_table_scan(d) and scanned_table(c, d, sql) not in ALLOWED_SCANS:
+                    problems.append((" ".join(sql.split()), d))
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Regresión de EXPLAIN QUERY PLAN: ninguna consulta de servicios debe escanear tablas completas")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+    tmp = tempfile.mkdtemp(prefix="cpf-plans-")
+    db.use_database(os.path.join(tmp, "plans.db"))
+    db.set_audit_mode("sync")
+    cache.ENABLED = False
+    db.init_db()
+    seed()
+    problems = check(verbose=args.verbose)
+    for sql, detail in problems:
+        print(f"SCAN: {detail}\n    {sql[:300]}")
+    print("OK" if not problems else f"{len(problems)} consultas con escaneo completo")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import math
+import os
+import re
+import unicodedata
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Matching con reglas sobre los campos estructurados: antes de puntuar texto se acota el conjunto
+# de candidatos con índices invertidos por rubro, ubicación y cámara; luego el score combina
+# similitud de texto, cercanía de ubicación, urgencia y antigüedad, con la explicación de cada parte.
+MATCH_RULES = os.environ.get("CPF_MATCH_RULES", "1") != "0"
+WEIGHTS = {"text": 0.7, "location": 0.15, "urgency": 0.05, "recency": 0.1}
+for _part in os.environ.get("CPF_MATCH_WEIGHTS", "").split(","):
+    if "=" in _part:
+        _name, _value = _part.split("=", 1)
+        WEIGHTS[_name.strip()] = float(_value)
+# Ubicaciones a más de NEARBY_KM se descartan en el prefiltro; la cercanía decae con esa escala
+NEARBY_KM = float(os.environ.get("CPF_MATCH_NEARBY_KM", "300"))
+RECENCY_HALF_LIFE_DAYS = 30
+URGENCY_LEVELS = {"baja": 0.25, "media": 0.5, "alta": 0.75, "critica": 1.0, "urgente": 1.0}
+
+# Ciudades conocidas (lat, lon); una ubicación libre se ubica por la primera que mencione
+CITIES = {
+    "buenos aires": (-34.60, -58.38), "caba": (-34.60, -58.38), "la plata": (-34.92, -57.95),
+    "mar del plata": (-38.00, -57.56), "bahia blanca": (-38.72, -62.27), "tandil": (-37.32, -59.13),
+    "olavarria": (-36.89, -60.32), "campana": (-34.16, -58.96), "zarate": (-34.10, -59.03),
+    "san nicolas": (-33.33, -60.22), "rosario": (-32.95, -60.64), "santa fe": (-31.63, -60.70),
+    "rafaela": (-31.25, -61.49), "venado tuerto": (-33.75, -61.97), "parana": (-31.73, -60.53),
+    "cordoba": (-31.42, -64.18), "villa maria": (-32.41, -63.24), "rio cuarto": (-33.12, -64.35),
+    "mendoza": (-32.89, -68.83), "san rafael": (-34.62, -68.33), "san juan": (-31.54, -68.54),
+    "san luis": (-33.30, -66.34), "tucuman": (-26.82, -65.22), "salta": (-24.79, -65.41),
+    "jujuy": (-24.19, -65.30), "santiago del estero": (-27.79, -64.26), "catamarca": (-28.47, -65.78),
+    "la rioja": (-29.41, -66.86), "resistencia": (-27.45, -58.99), "corrientes": (-27.47, -58.83),
+    "posadas": (-27.37, -55.90), "formosa": (-26.18, -58.17), "santa rosa": (-36.62, -64.29),
+    "neuquen": (-38.95, -68.06), "bariloche": (-41.13, -71.31), "viedma": (-40.81, -62.99),
+    "trelew": (-43.25, -65.31), "comodoro rivadavia": (-45.86, -67.48), "rio gallegos": (-51.62, -69.22),
+    "ushuaia": (-54.80, -68.30),
+}
+_CITY = re.compile(r"\b(" + "|".join(sorted(CITIES, key=len, reverse=True)) + r")\b")
+
+
+def fold(text):
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def norm(value):
+    return " ".join(fold(str(value or "")).split())
+
+
+def field(row, name):
+    return row[name] if name in row.keys() else None
+
+
+def city_coords(location):
+    m = _CITY.search(norm(location))
+    return CITIES[m.group(1)] if m else (math.nan, math.nan)
+
+
+def distance_km(a, b):
+    # Haversine vectorizado; a y b con forma (..., 2) en grados
+    a, b = np.radians(a), np.radians(b)
+    h = np.sin((b[..., 0] - a[..., 0]) / 2) ** 2 + np.cos(a[..., 0]) * np.cos(b[..., 0]) * np.sin((b[..., 1] - a[..., 1]) / 2) ** 2
+    return 2 * 6371 * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def proximity_rows(coords, codes):
+    # Cercanía entre los valores codes y todos los del índice (filas únicas x valores), como en RuleTable.proximity
+    km = distance_km(coords[codes][:, None, :], coords[None, :, :])
+    prox = np.nan_to_num(np.exp(-km / NEARBY_KM))
+    near = np.isnan(km) | (km <= NEARBY_KM)
+    same = codes[:, None] == np.arange(len(coords))[None, :]
+    prox[same], near[same] = 1.0, True
+    prox[:, 0], near[:, 0] = 0.0, True
+    prox[codes == 0], near[codes == 0] = 0.0, True
+    return prox, near
+
+
+def urgency_score(value):
+    return URGENCY_LEVELS.get(norm(value), 0.0)
+
+
+def timestamp(value):
+    try:
+        dt = datetime.fromisoformat(str(value))
+    except ValueError:
+        return math.nan
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def recency_score(created, now=None):
+    # 1 recién publicado, 0.5 a los RECENCY_HALF_LIFE_DAYS; sin fecha, 0
+    now = datetime.now(timezone.utc).timestamp() if now is None else now
+    age_days = np.maximum(0.0, (now - np.asarray(created, dtype=np.float64)) / 86400)
+    return np.nan_to_num(0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS))
+
+
+class FieldIndex:
+    # Índice invertido valor -> posiciones ordenadas (np.int64). El código 0 es "sin valor":
+    # esas filas pasan cualquier filtro sobre el campo.
+
+    def __init__(self):
+        self.values = [""]
+        self.code_of = {"": 0}
+        self.codes = np.zeros(0, dtype=np.int32)
+        self.postings = {}
+
+    def extend(self, values, start):
+        codes = []
+        for v in values:
+            v = norm(v)
+            code = self.code_of.get(v)
+            if code is None:
+                code = self.code_of[v] = len(self.values)
+                self.values.append(v)
+            codes.append(code)
+        codes = np.asarray(codes, dtype=np.int32)
+        # Las posiciones nuevas son siempre mayores: cada lista sigue ordenada
+        order = np.argsort(codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for group in np.split(order, bounds) if codes.size else []:
+            code = int(codes[group[0]])
+            new = start + group.astype(np.int64)
+            old = self.postings.get(code)
+            self.postings[code] = new if old is None else np.concatenate([old, new])
+        self.codes = np.concatenate([self.codes, codes])
+
+    def copy(self):
+        # Los arreglos se reemplazan (no se mutan) al extender: alcanza con copiar listas y dicts
+        other = FieldIndex()
+        other.values = list(self.values)
+        other.code_of = dict(self.code_of)
+        other.codes = self.codes
+        other.postings = dict(self.postings)
+        return other
+
+    def positions(self, codes):
+        lists = [self.postings[c] for c in codes if c in self.postings]
+        if not lists:
+            return np.zeros(0, dtype=np.int64)
+        return lists[0] if len(lists) == 1 else np.sort(np.concatenate(lists))
+
+
+class RuleTable:
+    # Campos estructurados por posición (las mismas posiciones que la matriz de texto del índice)
+
+    def __init__(self):
+        self.category = FieldIndex()
+        self.location = FieldIndex()
+        self.chamber = FieldIndex()
+        self.urgency = np.zeros(0, dtype=np.float32)
+        self.created = np.zeros(0, dtype=np.float64)
+        self._coords = np.zeros((1, 2))
+
+    def __len__(self):
+        return self.urgency.size
+
+    def extend(self, rows):
+        start = len(self)
+        self.category.extend([field(r, "category") for r in rows], start)
+        self.location.extend([field(r, "location") for r in rows], start)
+        self.chamber.extend([field(r, "chamber_id") for r in rows], start)
+        self.urgency = np.concatenate([self.urgency, np.asarray([urgency_score(field(r, "urgency")) for r in rows], dtype=np.float32)])
+        self.created = np.concatenate([self.created, np.asarray([timestamp(field(r, "created_at")) for r in rows])])
+        return self
+
+    def extended(self, rows):
+        # Copia con las filas agregadas: quien tomó esta tabla (MatchIndex.rank) la sigue viendo entera
+        other = RuleTable()
+        other.category = self.category.copy()
+        other.location = self.location.copy()
+        other.chamber = self.chamber.copy()
+        other.urgency = self.urgency
+        other.created = self.created
+        other._coords = self._coords
+        return other.extend(rows)
+
+    def coords(self):
+        values = self.location.values
+        if len(self._coords) < len(values):
+            self._coords = np.vstack([self._coords, [city_coords(v) for v in values[len(self._coords):]]])
+        return self._coords
+
+    def proximity(self, location):
+        # Cercanía de una ubicación a cada valor del índice: 1 igual, exp(-km / NEARBY_KM) si ambas
+        # son ciudades conocidas, 0 si no se puede saber. near: no se descarta en el prefiltro.
+        coords = self.coords()
+        loc = norm(location)
+        km = distance_km(np.asarray(city_coords(loc)), coords)
+        prox = np.nan_to_num(np.exp(-km / NEARBY_KM))
+        near = np.isnan(km) | (km <= NEARBY_KM)
+        same = np.asarray([v == loc for v in self.location.values])
+        prox[same], near[same] = 1.0, True
+        prox[0], near[0] = 0.0, True
+        return prox, near
+
+    def columns(self, sel, now=None):
+        return {
+            "category": self.category.codes[sel],
+            "location": self.location.codes[sel],
+            "urgency": self.urgency[sel],
+            "recency": recency_score(self.created[sel], now),
+        }
+
+
+def prefilter(table, target, allowed, top_k, same_chamber=False):
+    # Intersección de listas por rubro, ubicación cercana y (opcional) cámara; si quedan menos de
+    # top_k candidatos se relaja primero la ubicación y después el rubro. allowed: máscara por posición.
+    steps = []
+    category = norm(field(target, "category"))
+    if category:
+        steps.append(("rubro", table.category.positions([table.category.code_of.get(category, -1), 0])))
+    if norm(field(target, "location")):
+        _, near = table.proximity(field(target, "location"))
+        steps.append(("ubicación", table.location.positions(np.flatnonzero(near).tolist())))
+    required = []
+    if same_chamber and field(target, "chamber_id") is not None:
+        required.append(("cámara", table.chamber.positions([table.chamber.code_of.get(norm(target["chamber_id"]), -1)])))
+    while True:
+        cand = None
+        for _, positions in required + steps:
+            cand = positions if cand is None else np.intersect1d(cand, positions, assume_unique=True)
+        if cand is None:
+            cand = np.flatnonzero(allowed)
+        else:
+            cand = cand[allowed[cand]]
+        if cand.size >= top_k or not steps:
+            return cand, [name for name, _ in required + steps]
+        steps.pop()
+
+
+def score(table, target, cand, text, now=None):
+    prox, _ = table.proximity(field(target, "location"))
+    parts = {
+        "text": np.asarray(text, dtype=np.float64),
+        "location": prox[table.location.codes[cand]],
+        "urgency": table.urgency[cand].astype(np.float64),
+        "recency": recency_score(table.created[cand], now),
+    }
+    total = sum(WEIGHTS[k] * v for k, v in parts.items())
+    return total, parts
+
+
+def rule_matrix(coords, src, dst, text, top_k):
+    # Versión por bloques para batch_matching: filas src x columnas dst con los mismos filtros y pesos
+    codes, inverse = np.unique(src["location"], return_inverse=True)
+    prox, near = proximity_rows(coords, codes)
+    loc_prox = prox[inverse][:, dst["location"]]
+    total = (WEIGHTS["text"] * text + WEIGHTS["location"] * loc_prox
+             + WEIGHTS["urgency"] * dst["urgency"][None, :] + WEIGHTS["recency"] * dst["recency"][None, :])
+    cat = (src["category"][:, None] == 0) | (dst["category"][None, :] == 0) | (src["category"][:, None] == dst["category"][None, :])
+    allowed = cat & near[inverse][:, dst["location"]]
+    # Mismo relajamiento que prefilter, fila por fila
+    few = allowed.sum(axis=1) < top_k
+    if few.any():
+        allowed[few] = cat[few]
+        few = allowed.sum(axis=1) < top_k
+        allowed[few] = True
+    return np.where(allowed, total, -1.0)
+
+
+def explain(target, row, parts=None, filters=()):
+    # Motivos legibles del score de un par; sin parts se calculan desde los campos de las filas
+    if parts is None:
+        table = RuleTable().extend([row])
+        _, parts = score(table, target, np.zeros(1, dtype=np.int64), [math.nan])
+        parts = {k: float(v[0]) for k, v in parts.items()}
+    reasons = []
+    if not math.isnan(parts.get("text", math.nan)):
+        reasons.append(f"Similitud de texto {parts['text']:.2f}")
+    if norm(row["category"]) and norm(row["category"]) == norm(field(target, "category")):
+        reasons.append(f"Mismo rubro ({row['category']})")
+    if parts["location"] >= 1.0:
+        reasons.append(f"Misma ubicación ({row['location']})")
+    elif parts["location"] > 0:
+        km = float(distance_km(np.asarray(city_coords(field(target, "location"))), np.asarray(city_coords(row["location"]))))
+        reasons.append(f"Ubicación cercana ({row['location']}, ~{km:.0f} km)")
+    if parts["urgency"] > 0:
+        reasons.append(f"Urgencia {row['urgency']}")
+    created = timestamp(field(row, "created_at"))
+    if not math.isnan(created):
+        days = max(0, int((datetime.now(timezone.utc).timestamp() - created) // 86400))
+        reasons.append("Publicado hoy" if days == 0 else f"Publicado hace {days} días")
+    clean = {k: (None if math.isnan(v) else round(v, 4)) for k, v in parts.items()}
+    return {"parts": clean, "weights": dict(WEIGHTS), "filters": list(filters), "reasons": reasons}
@@ -1,58 +1,121 @@
-from db import conn, now_iso, log
+from db import (connection, transaction, now_iso, log, search_clause, stream, read_frame, STREAM_CHUNK,
+                METRICS_GLOBAL, rebuild_metric_counters, metric_counter_drift, rebuild_daily_rollups,
+                rebuild_contact_grants)
+import instrumentation
+import matching
+import notifications
+import scoring
+from cache import cached, invalidate
 
+@cached("chambers", ttl=300)
 def list_chambers():
-    c = conn()
-    rows = c.execute("SELECT * FROM chambers ORDER BY name").fetchall()
-    c.close()
+    with connection() as c:
+        rows = c.execute("SELECT * FROM chambers ORDER BY name").fetchall()
     return rows
 
 def create_chamber(actor_user_id, name, province, city):
-    c = conn()
-    c.execute(
-        "INSERT INTO chambers(name, province, city, created_at) VALUES(?,?,?,?)",
-        (name.strip(), (province or "").strip(), (city or "").strip(), now_iso())
-    )
-    c.commit()
-    c.close()
-    log(actor_user_id, "chamber_created", name)
+    with transaction() as c:
+        c.execute(
+            "INSERT INTO chambers(name, province, city, created_at) VALUES(?,?,?,?)",
+            (name.strip(), (province or "").strip(), (city or "").strip(), now_iso())
+        )
+        log(actor_user_id, "chamber_created", name)
+    invalidate("chambers", "metrics")
 
 def update_user_role(actor_user_id, user_id, role):
-    c = conn()
-    c.execute("UPDATE users SET role=? WHERE id=?", (role, user_id))
-    c.commit()
-    c.close()
-    log(actor_user_id, "role_updated", f"user_id={user_id}, role={role}")
+    with transaction() as c:
+        c.execute("UPDATE users SET role=? WHERE id=?", (role, user_id))
+        log(actor_user_id, "role_updated", f"user_id={user_id}, role={role}")
+    invalidate("users")
 
 def update_user_chamber(actor_user_id, user_id, chamber_id):
-    c = conn()
-    c.execute("UPDATE users SET chamber_id=? WHERE id=?", (chamber_id, user_id))
-    c.commit()
-    c.close()
-    log(actor_user_id, "user_chamber_updated", f"user_id={user_id}, chamber_id={chamber_id}")
+    with transaction() as c:
+        c.execute("UPDATE users SET chamber_id=? WHERE id=?", (chamber_id, user_id))
+        log(actor_user_id, "user_chamber_updated", f"user_id={user_id}, chamber_id={chamber_id}")
+    invalidate("users", "metrics")
 
 def deactivate_user(actor_user_id, user_id, is_active):
-    c = conn()
-    c.execute("UPDATE users SET is_active=? WHERE id=?", (1 if is_active else 0, user_id))
-    c.commit()
-    c.close()
-    log(actor_user_id, "user_activation_updated", f"user_id={user_id}, active={is_active}")
+    with transaction() as c:
+        c.execute("UPDATE users SET is_active=? WHERE id=?", (1 if is_active else 0, user_id))
+        if not is_active:
+            c.execute("DELETE FROM sessions WHERE user_id=?", (user_id,))
+        log(actor_user_id, "user_activation_updated", f"user_id={user_id}, active={is_active}")
+    invalidate("users", "sessions")
+
+def _users_sql(chamber_id=None):
+    where = "WHERE u.chamber_id = ?" if chamber_id else ""
+    params = (chamber_id,) if chamber_id else ()
+    return f"""
+            SELECT u.*, COALESCE(ch.name,'(Sin cámara)') as chamber_name
+            FROM users u
+            LEFT JOIN chambers ch ON ch.id = u.chamber_id
+            {where}
+            ORDER BY u.created_at DESC
+        """, params
+
+@cached("users", ttl=60)
+def list_users(chamber_id=None):
+    sql, params = _users_sql(chamber_id)
+    with connection() as c:
+        rows = c.execute(sql, params).fetchall()
+    return rows
+
+# Variantes iter_* y *_frame: mismo resultado que list_*, para listados grandes. Los iter_* leen
+# en bloques (db.stream) y retienen la conexión hasta agotarse: no escribir mientras se consumen.
+# Los *_frame arman el DataFrame por columnas desde el cursor; se comparten por caché, no mutarlos.
+def iter_users(chamber_id=None, chunk=STREAM_CHUNK):
+    sql, params = _users_sql(chamber_id)
+    with connection() as c:
+        for rows in stream(c, sql, params, chunk):
+            yield from rows
+
+@cached("users", ttl=60)
+def users_frame(chamber_id=None):
+    sql, params = _users_sql(chamber_id)
+    with connection() as c:
+        return read_frame(c, sql, params)
 
 def create_requirement(actor_user_id, user_id, chamber_id, req_type, title, description, tags, category, location, urgency):
-    c = conn()
-    c.execute(
-        """INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency, status, created_at, updated_at)
-             VALUES(?,?,?,?,?,?,?,?,?,'open',?,?)""",
-        (user_id, chamber_id, req_type, title.strip(), description.strip(), (tags or "").strip(), (category or "").strip(),
-         (location or "").strip(), (urgency or "").strip(), now_iso(), now_iso())
-    )
-    c.commit()
-    c.close()
-    log(actor_user_id, "requirement_created", f"type={req_type}, title={title[:80]}")
+    row = {
+        "req_type": req_type,
+        "title": title.strip(),
+        "description": description.strip(),
+        "tags": (tags or "").strip(),
+        "category": (category or "").strip(),
+        "location": (location or "").strip(),
+        "urgency": (urgency or "").strip(),
+        "chamber_id": chamber_id,
+        "created_at": now_iso(),
+    }
+    with transaction() as c:
+        row["id"] = c.execute(
+            """INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency, status, created_at, updated_at)
+                 VALUES(?,?,?,?,?,?,?,?,?,'open',?,?) RETURNING id""",
+            (user_id, chamber_id, req_type, row["title"], row["description"], row["tags"], row["category"],
+             row["location"], row["urgency"], row["created_at"], row["created_at"])
+        ).fetchone()[0]
+        log(actor_user_id, "requirement_created", f"type={req_type}, title={title[:80]}")
+        notifications.emit(c, "requirement_created", user_id=user_id, **row)
+    invalidate("requirements", "metrics", "matches")
+    matching.index_add(row)
+    notifications.wake()
+    return row["id"]
 
-def list_requirements(filters=None):
+REQUIREMENT_SELECT = """
+        SELECT r.*, u.name as user_name, u.company as company, u.email as email, u.phone as phone,
+               c.name as chamber_name, c.province as chamber_province, c.city as chamber_city"""
+REQUIREMENT_JOINS = """
+        JOIN users u ON u.id = r.user_id
+        LEFT JOIN chambers c ON c.id = r.chamber_id"""
+
+def _requirements_query(filters):
+    # Arma WHERE/orden comunes a listado completo y paginado.
+    # sort_key/sort_desc definen el orden (y el cursor keyset): created_at DESC o relevancia si hay búsqueda.
     filters = filters or {}
     where = ["1=1"]
     params = []
+    search = None
+    sort_key, sort_desc = "r.created_at", True
     if filters.get("status"):
         where.append("r.status = ?")
         params.append(filters["status"])
@@ -63,132 +126,330 @@ def list_requirements(filters=None):
         where.append("r.chamber_id = ?")
         params.append(filters["chamber_id"])
     if filters.get("q"):
-        q = f"%{filters['q'].strip()}%"
-        where.append("(r.title LIKE ? OR r.description LIKE ? OR r.tags LIKE ? OR u.company LIKE ? OR u.name LIKE ?)")
-        params.extend([q, q, q, q, q])
+        search = search_clause(filters["q"])
+        if search is None:
+            q = f"%{filters['q'].strip()}%"
+            where.append("(r.title LIKE ? OR r.description LIKE ? OR r.tags LIKE ? OR u.company LIKE ? OR u.name LIKE ?)")
+            params.extend([q, q, q, q, q])
+        elif search:
+            if search["where"]:
+                where.append(search["where"])
+            params.extend(search["params"])
+            sort_key, sort_desc = search["sort_key"], search["sort_desc"]
     if filters.get("category"):
         where.append("r.category = ?")
         params.append(filters["category"])
     if filters.get("location"):
         where.append("r.location = ?")
         params.append(filters["location"])
+    search = search or {}
+    return {
+        "select": REQUIREMENT_SELECT + search.get("cols", "") + f", {sort_key} as sort_key",
+        "from": f"FROM requirements r {search.get('join', '')} {REQUIREMENT_JOINS}",
+        "where": where,
+        # Los parámetros del JOIN de búsqueda van antes que los del WHERE
+        "params": search.get("join_params", []) + params,
+        "sort_key": sort_key,
+        "sort_desc": sort_desc,
+    }
+
+def _requirements_sql(filters):
+    qy = _requirements_query(filters)
+    direction = "DESC" if qy["sort_desc"] else "ASC"
+    return f"""
+        {qy["select"]}
+        {qy["from"]}
+        WHERE {' AND '.join(qy["where"])}
+        ORDER BY {qy["sort_key"]} {direction}, r.id {direction}
+    """, qy["params"]
 
+@cached("requirements", ttl=15)
+def list_requirements(filters=None):
+    sql, params = _requirements_sql(filters)
+    with connection() as c:
+        rows = c.execute(sql, params).fetchall()
+    return rows
+
+def iter_requirements(filters=None, chunk=STREAM_CHUNK):
+    sql, params = _requirements_sql(filters)
+    with connection() as c:
+        for rows in stream(c, sql, params, chunk):
+            yield from rows
+
+@cached("requirements", ttl=15)
+def requirements_frame(filters=None):
+    sql, params = _requirements_sql(filters)
+    with connection() as c:
+        return read_frame(c, sql, params)
+
+@cached("requirements", ttl=15)
+def list_requirements_page(filters=None, after=None, limit=50):
+    # Paginación keyset: after=(sort_key, id) de la última fila de la página anterior.
+    # Devuelve (filas, cursor_siguiente | None); el costo depende del tamaño de página, no de la tabla.
+    qy = _requirements_query(filters)
+    where, params = list(qy["where"]), list(qy["params"])
+    direction, cmp = ("DESC", "<") if qy["sort_desc"] else ("ASC", ">")
+    if after is not None:
+        where.append(f"({qy['sort_key']}, r.id) {cmp} (?, ?)")
+        params.extend(after)
     sql = f"""
-        SELECT r.*, u.name as user_name, u.company as company, u.email as email, u.phone as phone,
-               c.name as chamber_name, c.province as chamber_province, c.city as chamber_city
-        FROM requirements r
-        JOIN users u ON u.id = r.user_id
-        LEFT JOIN chambers c ON c.id = r.chamber_id
+        {qy["select"]}
+        {qy["from"]}
         WHERE {' AND '.join(where)}
-        ORDER BY r.created_at DESC
+        ORDER BY {qy["sort_key"]} {direction}, r.id {direction}
+        LIMIT ?
     """
-    c = conn()
-    rows = c.execute(sql, params).fetchall()
-    c.close()
+    with connection() as c:
+        rows = c.execute(sql, params + [limit + 1]).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]["sort_key"], rows[-1]["id"])
+    return rows, next_cursor
+
+def get_requirements_by_ids(ids):
+    ids = list(ids)
+    if not ids:
+        return []
+    sql = f"""
+        {REQUIREMENT_SELECT}
+        FROM requirements r
+        {REQUIREMENT_JOINS}
+        WHERE r.id IN ({','.join('?' * len(ids))})
+    """
+    with connection() as c:
+        rows = c.execute(sql, ids).fetchall()
     return rows
 
+@cached("requirements", ttl=15)
+def get_requirement(req_id):
+    rows = get_requirements_by_ids([req_id])
+    return rows[0] if rows else None
+
+# Candidatos de más que se piden al índice en línea: puede ir atrasado respecto de cierres de otros procesos
+MATCH_SLACK = 5
+
+def suggest_matches(target_row, top_k=5):
+    # Consulta los índices persistentes (TF-IDF y, si hay modelo, embeddings) en lugar de reentrenar
+    hits = matching.suggest(target_row, top_k=top_k + MATCH_SLACK)
+    by_id = {r["id"]: r for r in get_requirements_by_ids([rid for rid, _ in hits])}
+    return [(by_id[rid], score) for rid, score in hits if rid in by_id and by_id[rid]["status"] == "open"][:top_k]
+
+def _precomputed_matches(target_row, top_k):
+    # Solo las sugerencias aún abiertas (el job pudo correr antes de que cerraran); None si no queda
+    # ninguna, para que el llamador calcule en línea
+    with connection() as c:
+        hits = c.execute(
+            """SELECT m.match_id, m.score FROM requirement_matches m JOIN requirements r ON r.id = m.match_id
+                WHERE m.requirement_id=? AND r.status='open' ORDER BY m.rank LIMIT ?""",
+            (target_row["id"], top_k)
+        ).fetchall()
+    by_id = {r["id"]: r for r in get_requirements_by_ids([h["match_id"] for h in hits])}
+    hits = [(by_id[h["match_id"]], h["score"]) for h in hits
+            if h["match_id"] in by_id and by_id[h["match_id"]]["status"] == "open"]
+    return hits or None
+
+def list_matches(target_row, top_k=5):
+    # Sugerencias precalculadas por batch_matching; si el requerimiento aún no fue procesado, se usa el índice
+    hits = _precomputed_matches(target_row, top_k)
+    return suggest_matches(target_row, top_k=top_k) if hits is None else hits
+
+def explain_matches(target_row, top_k=5):
+    # Como list_matches, con los motivos de cada score. Las precalculadas se explican desde los campos
+    # de las filas; las calculadas en línea traen además la similitud de texto y los filtros aplicados.
+    hits = _precomputed_matches(target_row, top_k)
+    if hits is None and scoring.MATCH_RULES:
+        ranked = matching.rank(target_row, top_k=top_k + MATCH_SLACK)
+        by_id = {r["id"]: r for r in get_requirements_by_ids([h[0] for h in ranked])}
+        return [(by_id[rid], score, scoring.explain(target_row, by_id[rid], parts, filters))
+                for rid, score, parts, filters in ranked if rid in by_id and by_id[rid]["status"] == "open"][:top_k]
+    if hits is None:
+        hits = suggest_matches(target_row, top_k=top_k)
+    return [(r, score, scoring.explain(target_row, r)) for r, score in hits]
+
+@cached("matches", ttl=60)
+def match_counts(ids):
+    ids = list(ids)
+    if not ids:
+        return {}
+    with connection() as c:
+        rows = c.execute(
+            f"SELECT requirement_id, COUNT(*) as n FROM requirement_matches WHERE requirement_id IN ({','.join('?' * len(ids))}) GROUP BY requirement_id",
+            ids
+        ).fetchall()
+    return {r["requirement_id"]: r["n"] for r in rows}
+
 def close_requirement(actor_user_id, req_id):
-    c = conn()
-    c.execute("UPDATE requirements SET status='closed', updated_at=? WHERE id=?", (now_iso(), req_id))
-    c.commit()
-    c.close()
-    log(actor_user_id, "requirement_closed", f"id={req_id}")
+    with transaction() as c:
+        c.execute("UPDATE requirements SET status='closed', updated_at=? WHERE id=?", (now_iso(), req_id))
+        log(actor_user_id, "requirement_closed", f"id={req_id}")
+    invalidate("requirements", "metrics", "matches")
+    matching.index_remove(req_id)
 
 def create_contact_request(actor_user_id, from_user_id, to_user_id, requirement_id):
-    c = conn()
-    existing = c.execute(
-        "SELECT * FROM contact_requests WHERE from_user_id=? AND requirement_id=? AND status='pending'",
-        (from_user_id, requirement_id)
-    ).fetchone()
-    if existing:
-        c.close()
-        return False, "Ya existe una solicitud pendiente para este requerimiento."
-
-    c.execute(
-        "INSERT INTO contact_requests(from_user_id, to_user_id, requirement_id, status, created_at) VALUES(?,?,?,?,?)",
-        (from_user_id, to_user_id, requirement_id, "pending", now_iso())
-    )
-    c.commit()
-    c.close()
-    log(actor_user_id, "contact_request_created", f"req_id={requirement_id}, from={from_user_id}, to={to_user_id}")
+    # Idempotente: el índice único parcial uq_contact_requests_pending descarta la segunda pendiente
+    # (sin ventana entre verificar e insertar)
+    with transaction() as c:
+        row = c.execute(
+            """INSERT INTO contact_requests(from_user_id, to_user_id, requirement_id, status, created_at)
+               VALUES(?,?,?,'pending',?)
+               ON CONFLICT(from_user_id, requirement_id) WHERE status='pending' DO NOTHING
+               RETURNING id""",
+            (from_user_id, to_user_id, requirement_id, now_iso())
+        ).fetchone()
+        if row is None:
+            return False, "Ya existe una solicitud pendiente para este requerimiento."
+        log(actor_user_id, "contact_request_created", f"req_id={requirement_id}, from={from_user_id}, to={to_user_id}")
+        notifications.emit(c, "contact_request_created", id=row["id"], requirement_id=requirement_id,
+                           from_user_id=from_user_id, to_user_id=to_user_id)
+    invalidate("contacts", "metrics")
+    notifications.wake()
     return True, "Solicitud enviada. Queda pendiente de aprobación."
 
+INBOX_SQL = """
+            SELECT cr.*, r.title as req_title, r.req_type as req_type,
+                   uf.name as from_name, uf.company as from_company, uf.email as from_email, uf.phone as from_phone
+            FROM contact_requests cr
+            JOIN requirements r ON r.id = cr.requirement_id
+            JOIN users uf ON uf.id = cr.from_user_id
+            WHERE cr.to_user_id = ?
+            ORDER BY cr.created_at DESC
+            """
+SENT_SQL = """
+            SELECT cr.*, r.title as req_title, r.req_type as req_type,
+                   ut.name as to_name, ut.company as to_company
+            FROM contact_requests cr
+            JOIN requirements r ON r.id = cr.requirement_id
+            JOIN users ut ON ut.id = cr.to_user_id
+            WHERE cr.from_user_id = ?
+            ORDER BY cr.created_at DESC
+            """
+
+# TTL largo: las novedades de otros procesos llegan como notificación y app.py invalida "contacts"
+@cached("contacts", ttl=60)
 def list_inbox(user_id):
-    c = conn()
-    rows = c.execute(
-        """
-        SELECT cr.*, r.title as req_title, r.req_type as req_type,
-               uf.name as from_name, uf.company as from_company, uf.email as from_email, uf.phone as from_phone
-        FROM contact_requests cr
-        JOIN requirements r ON r.id = cr.requirement_id
-        JOIN users uf ON uf.id = cr.from_user_id
-        WHERE cr.to_user_id = ?
-        ORDER BY cr.created_at DESC
-        """,
-        (user_id,)
-    ).fetchall()
-    c.close()
+    with connection() as c:
+        rows = c.execute(INBOX_SQL, (user_id,)).fetchall()
     return rows
 
+@cached("contacts", ttl=60)
 def list_sent(user_id):
-    c = conn()
-    rows = c.execute(
-        """
-        SELECT cr.*, r.title as req_title, r.req_type as req_type,
-               ut.name as to_name, ut.company as to_company
-        FROM contact_requests cr
-        JOIN requirements r ON r.id = cr.requirement_id
-        JOIN users ut ON ut.id = cr.to_user_id
-        WHERE cr.from_user_id = ?
-        ORDER BY cr.created_at DESC
-        """,
-        (user_id,)
-    ).fetchall()
-    c.close()
+    with connection() as c:
+        rows = c.execute(SENT_SQL, (user_id,)).fetchall()
     return rows
 
+def iter_inbox(user_id, chunk=STREAM_CHUNK):
+    with connection() as c:
+        for rows in stream(c, INBOX_SQL, (user_id,), chunk):
+            yield from rows
+
+def iter_sent(user_id, chunk=STREAM_CHUNK):
+    with connection() as c:
+        for rows in stream(c, SENT_SQL, (user_id,), chunk):
+            yield from rows
+
 def respond_contact_request(actor_user_id, request_id, decision):
     assert decision in ("accepted", "declined")
-    c = conn()
-    c.execute(
-        "UPDATE contact_requests SET status=?, responded_at=? WHERE id=?",
-        (decision, now_iso(), request_id)
-    )
-    c.commit()
-    c.close()
-    log(actor_user_id, "contact_request_responded", f"id={request_id}, decision={decision}")
+    with transaction() as c:
+        now = now_iso()
+        row = c.execute(
+            "UPDATE contact_requests SET status=?, responded_at=? WHERE id=? AND status='pending' "
+            "RETURNING requirement_id, from_user_id, to_user_id",
+            (decision, now, request_id)
+        ).fetchone()
+        if row is not None and decision == "accepted":
+            lo, hi = sorted((row["from_user_id"], row["to_user_id"]))
+            c.execute(
+                "INSERT INTO contact_grants(requirement_id, user_lo, user_hi, granted_at) VALUES(?,?,?,?) "
+                "ON CONFLICT DO NOTHING",
+                (row["requirement_id"], lo, hi, now)
+            )
+        if row is not None:
+            notifications.emit(c, "contact_request_responded", id=request_id, decision=decision, **dict(row))
+        log(actor_user_id, "contact_request_responded", f"id={request_id}, decision={decision}")
+    invalidate("contacts", "metrics")
+    notifications.wake()
 
+@cached("contacts", ttl=10)
 def can_view_contact(user_id, other_user_id, requirement_id):
-    # Contacto visible si existe una solicitud accepted entre ambas partes para ese requerimiento
-    c = conn()
-    row = c.execute(
-        """
-        SELECT 1 FROM contact_requests
-        WHERE requirement_id=?
-          AND status='accepted'
-          AND ((from_user_id=? AND to_user_id=?) OR (from_user_id=? AND to_user_id=?))
-        LIMIT 1
-        """,
-        (requirement_id, user_id, other_user_id, other_user_id, user_id)
-    ).fetchone()
-    c.close()
+    # Contacto visible si se aceptó una solicitud entre ambas partes para ese requerimiento (contact_grants)
+    lo, hi = sorted((user_id, other_user_id))
+    with connection() as c:
+        row = c.execute(
+            "SELECT 1 FROM contact_grants WHERE requirement_id=? AND user_lo=? AND user_hi=?",
+            (requirement_id, lo, hi)
+        ).fetchone()
     return row is not None
 
-def admin_metrics():
-    c = conn()
-    out = {}
-    out["users_total"] = c.execute("SELECT COUNT(*) as n FROM users").fetchone()["n"]
-    out["req_total"] = c.execute("SELECT COUNT(*) as n FROM requirements").fetchone()["n"]
-    out["req_open"] = c.execute("SELECT COUNT(*) as n FROM requirements WHERE status='open'").fetchone()["n"]
-    out["req_closed"] = c.execute("SELECT COUNT(*) as n FROM requirements WHERE status='closed'").fetchone()["n"]
-    out["contact_pending"] = c.execute("SELECT COUNT(*) as n FROM contact_requests WHERE status='pending'").fetchone()["n"]
-    out["contact_accepted"] = c.execute("SELECT COUNT(*) as n FROM contact_requests WHERE status='accepted'").fetchone()["n"]
-    out["by_chamber"] = c.execute("""
-        SELECT COALESCE(c.name,'(Sin cámara)') as chamber, COUNT(r.id) as n
-        FROM requirements r
-        LEFT JOIN chambers c ON c.id = r.chamber_id
-        GROUP BY chamber
-        ORDER BY n DESC
-    """).fetchall()
-    c.close()
+@cached("contacts", ttl=10)
+def contact_status(user_id, requirements):
+    # Estado de contacto de user_id para varios requerimientos a la vez, en una consulta por cada 500:
+    # requirements son pares (id, dueño); devuelve {id: "owner"|"granted"|"pending"|"none"}
+    owners = {int(rid): owner for rid, owner in requirements}
+    status = {rid: ("owner" if owner == user_id else "none") for rid, owner in owners.items()}
+    ask = [rid for rid, s in status.items() if s == "none"]
+    with connection() as c:
+        for i in range(0, len(ask), 500):
+            chunk = ask[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = c.execute(
+                f"""
+                SELECT requirement_id, user_lo + user_hi - ? AS other, 'granted' AS status FROM contact_grants
+                WHERE requirement_id IN ({marks}) AND (user_lo=? OR user_hi=?)
+                UNION ALL
+                SELECT requirement_id, to_user_id AS other, 'pending' AS status FROM contact_requests
+                WHERE from_user_id=? AND status='pending' AND requirement_id IN ({marks})
+                """,
+                [user_id, *chunk, user_id, user_id, user_id, *chunk]
+            ).fetchall()
+            for r in rows:
+                rid = r["requirement_id"]
+                # El permiso es con el dueño del requerimiento; una concesión ya aceptada pisa a la pendiente
+                if r["status"] == "granted" and r["other"] == owners[rid]:
+                    status[rid] = "granted"
+                elif r["status"] == "pending" and status[rid] == "none":
+                    status[rid] = "pending"
+    return status
+
+METRIC_KEYS = ["users_total", "req_total", "req_open", "req_closed", "contact_pending", "contact_accepted"]
+
+@cached("metrics", ttl=30)
+def admin_metrics(chamber_id=None):
+    # Lectura única sobre metric_counters (mantenidos por triggers); chamber_id acota a una cámara
+    if chamber_id:
+        where, params = "m.chamber_id = ?", (chamber_id,)
+        scope = chamber_id
+    else:
+        where, params = "m.chamber_id = ? OR m.metric = 'req_total'", (METRICS_GLOBAL,)
+        scope = METRICS_GLOBAL
+    with connection() as c:
+        rows = c.execute(f"""
+            SELECT m.chamber_id, m.metric, m.n, ch.name as chamber_name
+            FROM metric_counters m
+            LEFT JOIN chambers ch ON ch.id = m.chamber_id
+            WHERE {where}
+        """, params).fetchall()
+    out = {k: 0 for k in METRIC_KEYS}
+    by_chamber = []
+    for r in rows:
+        if r["chamber_id"] == scope:
+            out[r["metric"]] = r["n"]
+        if r["metric"] == "req_total" and r["chamber_id"] != METRICS_GLOBAL and r["n"] > 0:
+            by_chamber.append({"chamber": r["chamber_name"] or "(Sin cámara)", "n": r["n"]})
+    out["by_chamber"] = sorted(by_chamber, key=lambda x: -x["n"])
     return out
+
+def check_metrics(repair=False):
+    # Verificador de consistencia de metric_counters; con repair=True los reconstruye desde las tablas
+    # (junto con los rollups diarios de analytics, que comparten triggers y origen)
+    with transaction() as c:
+        drift = metric_counter_drift(c)
+        if drift and repair:
+            rebuild_metric_counters(c)
+            rebuild_daily_rollups(c)
+            rebuild_contact_grants(c)
+    if drift and repair:
+        invalidate("metrics")
+    return drift
+
+instrumentation.instrument(globals(), "services")
@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from db import connection, transaction, now_iso
+from cache import cached, invalidate
+from auth import get_user
+
+# Sesiones del lado del servidor. El navegador guarda "<id>.<firma>"; la firma HMAC permite
+# descartar tokens falsos sin tocar la base, y en la tabla sessions solo queda el hash del id.
+# La revalidación por rerun es firma + dos lecturas de caché (sesión y usuario), sin bcrypt.
+SESSION_TTL_HOURS = float(os.environ.get("CPF_SESSION_TTL_HOURS", "12"))
+# Cookie del navegador con el token (app.py); nunca viaja en la URL
+COOKIE = "cpf_session"
+
+
+@cached("settings", ttl=3600)
+def _secret():
+    with connection() as c:
+        row = c.execute("SELECT value FROM settings WHERE key = 'session_secret'").fetchone()
+    return row["value"].encode("ascii")
+
+
+def _sign(sid):
+    mac = hmac.new(_secret(), sid.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode("ascii")
+
+
+def _token_hash(sid):
+    return hashlib.sha256(sid.encode("ascii")).hexdigest()
+
+
+def _split(token):
+    # Devuelve el id si la firma es válida; None para tokens ausentes, mal formados o falsificados
+    if not token or token.count(".") != 1:
+        return None
+    sid, sig = token.split(".")
+    try:
+        ok = hmac.compare_digest(sig, _sign(sid))
+    except (UnicodeEncodeError, TypeError):
+        return None
+    return sid if ok else None
+
+
+def create_session(user_id):
+    sid = secrets.token_urlsafe(24)
+    now = now_iso()
+    expires = (datetime.fromisoformat(now) + timedelta(hours=SESSION_TTL_HOURS)).isoformat(timespec="seconds")
+    with transaction() as c:
+        c.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        c.execute("INSERT INTO sessions(token_hash, user_id, created_at, expires_at) VALUES(?,?,?,?)",
+                  (_token_hash(sid), user_id, now, expires))
+    return f"{sid}.{_sign(sid)}"
+
+
+@cached("sessions", ttl=300)
+def _session(token_hash):
+    with connection() as c:
+        row = c.execute("SELECT user_id, expires_at FROM sessions WHERE token_hash = ?", (token_hash,)).fetchone()
+    return (row["user_id"], row["expires_at"]) if row else None
+
+
+def resolve(token):
+    # Usuario vigente de la sesión (rol, cámara y estado frescos) o None si hay que volver a ingresar
+    sid = _split(token)
+    if sid is None:
+        return None
+    found = _session(_token_hash(sid))
+    if found is None or found[1] <= now_iso():
+        return None
+    u = get_user(found[0])
+    if u is None or not u["is_active"]:
+        return None
+    return u
+
+
+def revoke(token):
+    sid = _split(token)
+    if sid is None:
+        return
+    with transaction() as c:
+        c.execute("DELETE FROM sessions WHERE token_hash = ?", (_token_hash(sid),))
+    invalidate("sessions")
+
@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+import time
+
+import db
+import instrumentation
+import notifications
+
+# Arranque del proceso de la app: las migraciones, el despachador del outbox y el exportador de
+# métricas corren una sola vez por proceso (no en cada rerun), y un hilo de fondo precarga lo pesado
+# (pandas, scikit-learn/SciPy y el índice de matching) mientras el usuario ve la pantalla de ingreso.
+# Cada fase queda en el log (stderr, que launcher.py vuelca a cpf.log) y como span startup.*.
+WARM_UP = os.environ.get("CPF_WARM_UP", "1") != "0"
+# Momento (epoch) en que launcher.py lanzó Streamlit, para medir el arranque de punta a punta
+LAUNCHED_AT = float(os.environ.get("CPF_LAUNCHED_AT", "0")) or None
+
+log = logging.getLogger("cpf.startup")
+phases = {}
+_lock = threading.Lock()
+_started = False
+_ready = False
+
+
+def _phase(name, t0):
+    seconds = time.perf_counter() - t0
+    phases[name] = round(seconds, 3)
+    instrumentation.record(f"startup.{name}", seconds)
+    since = f" ({time.time() - LAUNCHED_AT:.1f} s desde el lanzador)" if LAUNCHED_AT else ""
+    log.info("Arranque: %s en %.0f ms%s", name, seconds * 1000, since)
+
+
+def init_once():
+    global _started
+    if _started:
+        return
+    with _lock:
+        if _started:
+            return
+        if not log.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s | %(message)s", "%Y-%m-%d %H:%M:%S"))
+            log.addHandler(handler)
+            log.setLevel(logging.INFO)
+            log.propagate = False
+        t0 = time.perf_counter()
+        db.init_db()
+        _phase("init_db", t0)
+        notifications.start()
+        instrumentation.serve()
+        if WARM_UP:
+            threading.Thread(target=warm_up, name="cpf-warm-up", daemon=True).start()
+        _started = True
+
+
+def warm_up():
+    t0 = time.perf_counter()
+    try:
+        import analytics
+        import bulk
+        _phase("imports", t0)
+        t1 = time.perf_counter()
+        import matching
+        matching.get_index()
+        if matching.semantic_weight() > 0:
+            import embeddings
+            embeddings.get_index().backfill_async()
+        _phase("match_index", t1)
+    except Exception:
+        log.exception("Falló la precarga")
+    _phase("warm_up", t0)
+
+
+def mark_ready(seconds):
+    # Primera página dibujada en el proceso: cierra la medición del arranque
+    global _ready
+    if _ready:
+        return
+    _ready = True
+    phases["first_run"] = round(seconds, 3)
+    since = f" ({time.time() - LAUNCHED_AT:.1f} s desde el lanzador)" if LAUNCHED_AT else ""
+    log.info("Arranque: primera página en %.0f ms%s", seconds * 1000, since)
@@ -0,0 +1,233 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import cache
+import db
+import notifications
+import query_plans
+
+# Misma batería sobre cada backend de almacenamiento (SQLite y Postgres): migraciones, semilla,
+# todas las funciones de servicio (query_plans.exercise), consistencia de contadores, búsqueda,
+# paginación, outbox de notificaciones, importación/exportación masiva, escrituras concurrentes y el flujo
+# de la API. Al final compara los listados entre backends: con la misma semilla deben devolver las mismas filas.
+FILTERS = [
+    {"status": "open"},
+    {"status": "open", "req_type": "offer"},
+    {"status": "open", "chamber_id": 3},
+    {"status": "closed", "req_type": "need", "chamber_id": 2},
+    {"status": "open", "category": "logistica"},
+]
+SEARCHES = ["flete", "camara frigorifica", "Cámara"]
+# Búsquedas que deben encontrar el requerimiento creado durante la batería
+NEW_HITS = SEARCHES[1:]
+
+
+def fresh_postgres(url=None):
+    # Crea una base vacía en el servidor dado o, sin URL, en un Postgres embebido (pip install pgserver)
+    import psycopg
+    server = None
+    if url is None:
+        import pgserver
+        server = pgserver.get_server(tempfile.mkdtemp(prefix="cpf-pg-"), cleanup_mode="stop")
+        url = server.get_uri()
+    name = f"cpf_check_{os.getpid()}_{int(time.time())}"
+    with psycopg.connect(url, autocommit=True) as c:
+        c.execute(f"CREATE DATABASE {name}")
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path="/" + name)), server
+
+
+class FlakyMailer(notifications.MemoryMailer):
+    # Falla el primer lote, como un SMTP caído
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def send_many(self, messages):
+        if self.down:
+            self.down = False
+            return ["SMTP no disponible"] * len(messages)
+        return super().send_many(messages)
+
+
+def paginate(svc, f, limit=37):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = svc.list_requirements_page(f, after=cursor, limit=limit)
+        ids.extend(r["id"] for r in rows)
+        if cursor is None:
+            return ids
+
+
+def concurrent_writes(svc, threads=8, each=25):
+    errors = []
+
+    def worker(k):
+        for i in range(each):
+            try:
+                svc.create_requirement(1, 1 + k, 1, "offer", f"Carga concurrente {k}-{i}", "Prueba de escritura", "", "", "", "")
+            except Exception as e:
+                errors.append(repr(e))
+
+    ts = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return threads * each, time.perf_counter() - t0, errors
+
+
+def run(target):
+    import auth
+    import bulk
+    import services as svc
+    failures = []
+
+    def expect(ok, msg):
+        if not ok:
+            failures.append(msg)
+
+    db.use_database(target)
+    db.set_audit_mode("sync")
+    # El outbox se vacía a mano con dispatch_once: sin hilo de fondo que cruce de una base a la otra
+    notifications.OUTBOX_DISPATCH = False
+    cache.ENABLED = False
+    auth.BCRYPT_ROUNDS = 4
+    db.init_db()
+    query_plans.seed(n_users=500, n_requirements=5000, n_contacts=1000)
+    query_plans.exercise()
+    out = {"backend": "postgres" if db.is_postgres() else "sqlite"}
+
+    with db.connection() as c:
+        expect(db.schema_version(c) > 0, "sin versión de esquema")
+    expect(svc.check_metrics() == {}, "metric_counters no coincide con un recuento real")
+    with db.transaction() as c:
+        before = [tuple(r) for r in c.execute("SELECT * FROM daily_contacts ORDER BY day, chamber_id")]
+        db.rebuild_daily_rollups(c)
+        after = [tuple(r) for r in c.execute("SELECT * FROM daily_contacts ORDER BY day, chamber_id")]
+    expect(before == after, "daily_contacts no coincide con una reconstrucción")
+
+    uid = auth.create_user("check@cpf", "clave", "Check", "Frigorífico del Sur", "", 1)
+    expect(auth.get_user(uid)["email"] == "check@cpf", "create_user no devolvió el id insertado")
+    expect(auth.authenticate("check@cpf", "clave") is not None, "authenticate falló")
+    rid = svc.create_requirement(uid, uid, 1, "offer", "Cámara frigorífica móvil", "Alquiler por día", "frio", "", "", "")
+    expect(svc.get_requirement(rid)["title"] == "Cámara frigorífica móvil", "create_requirement no devolvió el id insertado")
+    first, _ = svc.create_contact_request(7, 7, uid, rid)
+    again, _ = svc.create_contact_request(7, 7, uid, rid)
+    expect(first and not again, "la solicitud de contacto pendiente no es idempotente")
+    expect(svc.contact_status(7, [(rid, uid)]) == {rid: "pending"}, "contact_status no ve la solicitud pendiente")
+    pending = [r["id"] for r in svc.list_inbox(uid) if r["status"] == "pending"]
+    svc.respond_contact_request(uid, pending[0], "accepted")
+    expect(svc.can_view_contact(uid, 7, rid) and svc.can_view_contact(7, uid, rid), "la aceptación no habilita el contacto")
+    expect(svc.contact_status(7, [(rid, uid), (1, 1)]) == {rid: "granted", 1: "none"}, "contact_status no ve el permiso")
+    with db.transaction() as c:
+        before = [tuple(r) for r in c.execute("SELECT requirement_id, user_lo, user_hi FROM contact_grants ORDER BY 1, 2, 3")]
+        db.rebuild_contact_grants(c)
+        after = [tuple(r) for r in c.execute("SELECT requirement_id, user_lo, user_hi FROM contact_grants ORDER BY 1, 2, 3")]
+    expect(before == after, "contact_grants no coincide con una reconstrucción")
+
+    # Outbox: el primer envío de email falla y el evento se reintenta sin duplicar el aviso in-app
+    notifications.dispatcher.mailer = notifications.MemoryMailer()
+    while notifications.dispatcher.dispatch_once():
+        pass
+    expect(notifications.unread_count(uid) >= 1 and notifications.unread_count(7) >= 1, "el outbox no avisó la solicitud ni la respuesta")
+    notifications.mark_read(uid)
+    flaky = FlakyMailer()
+    notifications.dispatcher.mailer = flaky
+    svc.create_contact_request(8, 8, uid, rid)
+    notifications.dispatcher.dispatch_once()
+    expect(notifications.unread_count(uid) == 1, "el aviso in-app esperó al email fallido")
+    with db.transaction() as c:
+        c.execute("UPDATE outbox SET next_attempt_at=? WHERE dispatched_at IS NULL", (db.now_iso(),))
+    notifications.dispatcher.dispatch_once()
+    expect(notifications.unread_count(uid) == 1 and len(flaky.sent) == 1, "el reintento del outbox repitió el aviso o no reenvió el email")
+    expect([n["kind"] for n in notifications.list_notifications(uid)][:1] == ["contact_request"], "list_notifications no trae el aviso")
+    for q in SEARCHES:
+        hits = {r["id"] for r in svc.list_requirements({"status": "open", "q": q})}
+        expect(rid in hits or q not in NEW_HITS, f"la búsqueda {q!r} no encuentra el requerimiento nuevo")
+        expect(paginate(svc, {"status": "open", "q": q}) == [r["id"] for r in svc.list_requirements({"status": "open", "q": q})],
+               f"la paginación de {q!r} no coincide con el listado")
+        out[f"q:{q}"] = hits
+    expect(rid in {r["id"] for r in svc.list_requirements({"q": "sur frigorifico"})}, "la búsqueda no incluye la empresa")
+    for f in FILTERS:
+        ids = [r["id"] for r in svc.list_requirements(f)]
+        expect(paginate(svc, f) == ids, f"la paginación de {f} no coincide con el listado")
+        out[repr(f)] = ids
+
+    csv_rows = "".join(f"u{10 + i % 400}@cpf,need,Importado {i},Flete masivo {i},bulk,logistica,Rosario\n" for i in range(2000))
+    report = bulk.import_requirements(io.StringIO("email,req_type,title,description,tags,category,location\n" + csv_rows), None,
+                                      batch_size=600)
+    expect(report["inserted"] == 2000, f"importación masiva incompleta: {report['inserted']}")
+    expect(svc.check_metrics() == {}, "metric_counters desfasado tras la importación masiva")
+    with db.transaction() as c:
+        before = [tuple(r) for r in c.execute("SELECT * FROM daily_requirements ORDER BY day, chamber_id, category, req_type")]
+        db.rebuild_daily_rollups(c)
+        after = [tuple(r) for r in c.execute("SELECT * FROM daily_requirements ORDER BY day, chamber_id, category, req_type")]
+    expect(before == after, "daily_requirements no coincide con una reconstrucción tras la importación masiva")
+    expect(len(svc.list_requirements({"q": "masivo"})) == 2000, "la búsqueda no ve las filas importadas")
+
+    buf = io.StringIO()
+    with db.connection() as c:
+        total = c.execute("SELECT COUNT(*) FROM requirements").fetchone()[0]
+    expect(bulk.export_requirements(buf, chunk=700) == total, "la exportación no recorre todas las filas")
+
+    n, seconds, errors = concurrent_writes(svc)
+    expect(not errors, f"errores en escrituras concurrentes: {errors[:3]}")
+    expect(svc.check_metrics() == {}, "metric_counters desfasado tras escrituras concurrentes")
+    print(f"  {out['backend']}: {n} altas concurrentes en {seconds:.2f}s ({n / seconds:.0f}/s)")
+
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        print("  (sin fastapi: se omite el flujo de la API)")
+    else:
+        import api
+        from benchmarks.api_load import smoke
+        auth.create_user("api-a@cpf", "clave", "Api A", "Empresa A", "", 1)
+        auth.create_user("api-b@cpf", "clave", "Api B", "Empresa B", "", 2)
+        with TestClient(api.app) as client:
+            smoke(client)
+    db.flush_audit()
+    db.pool.close_all()
+    return out, failures
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Batería de servicios contra SQLite y Postgres")
+    ap.add_argument("--pg-url", default=os.environ.get("CPF_CHECK_PG_URL"),
+                    help="Servidor Postgres donde crear la base de prueba (por defecto, pgserver embebido)")
+    ap.add_argument("--skip-postgres", action="store_true")
+    args = ap.parse_args(argv)
+    results, failed = [], False
+    targets = [os.path.join(tempfile.mkdtemp(prefix="cpf-check-"), "check.db")]
+    server = None
+    if not args.skip_postgres:
+        url, server = fresh_postgres(args.pg_url)
+        targets.append(url)
+    for target in targets:
+        out, failures = run(target)
+        results.append(out)
+        for msg in failures:
+            print(f"FALLA [{out['backend']}]: {msg}")
+        failed = failed or bool(failures)
+    if len(results) == 2:
+        a, b = results
+        for key in a:
+            if key != "backend" and a[key] != b[key]:
+                print(f"FALLA: {key} difiere entre sqlite y postgres")
+                failed = True
+    if server is not None:
+        server.cleanup()
+    print("OK" if not failed else "FALLAS")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
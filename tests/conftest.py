@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth  # noqa: E402
+import cache  # noqa: E402
+import db  # noqa: E402
+import notifications  # noqa: E402
+import query_plans  # noqa: E402
+
+
+def prepare(target):
+    # Misma preparación que storage_check.run: auditoría síncrona, sin hilo del outbox ni caché
+    db.use_database(target)
+    db.set_audit_mode("sync")
+    notifications.OUTBOX_DISPATCH = False
+    cache.ENABLED = False
+    auth.BCRYPT_ROUNDS = 4
+    db.init_db()
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    # Base SQLite con la semilla de query_plans, compartida por los tests del módulo
+    prepare(str(tmp_path_factory.mktemp("cpf") / "test.db"))
+    query_plans.seed(n_users=500, n_requirements=5000, n_contacts=1000)
+    yield
+    db.flush_audit()
+    db.pool.close_all()
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    prepare(str(tmp_path / "empty.db"))
+    yield
+    db.flush_audit()
+    db.pool.close_all()
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import api  # noqa: E402
+import auth  # noqa: E402
+import services as svc  # noqa: E402
+from benchmarks.api_load import smoke  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client(seeded):
+    auth.create_user("api-a@cpf", "clave", "Api A", "Empresa A", "", 1)
+    auth.create_user("api-b@cpf", "clave", "Api B", "Empresa B", "", 2)
+    with TestClient(api.app) as c:
+        yield c
+
+
+def login(client, email="api-a@cpf"):
+    token = client.post("/auth/token", json={"email": email, "password": "clave"}).json()["token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_full_flow(client):
+    smoke(client)
+
+
+def test_requires_token(client):
+    assert client.get("/requirements").status_code == 401
+    assert client.get("/me", headers={"Authorization": "Bearer basura"}).status_code == 401
+
+
+def test_pages_match_service_listing(client):
+    headers = login(client)
+    ids, after = [], None
+    while True:
+        params = {"limit": 50, "q": "flete"}
+        if after:
+            params["after"] = after
+        body = client.get("/requirements", params=params, headers=headers).json()
+        ids.extend(r["id"] for r in body["items"])
+        after = body["next"]
+        if not after:
+            break
+    assert ids == [r["id"] for r in svc.list_requirements({"status": "open", "q": "flete"})]
+
+
+def test_contact_hidden_until_granted(client):
+    ha, hb = login(client, "api-a@cpf"), login(client, "api-b@cpf")
+    rid = client.post("/requirements", headers=ha, json={
+        "req_type": "need", "title": "Depósito seco", "description": "Para pallets", "tags": ""}).json()["id"]
+    req = client.get(f"/requirements/{rid}", headers=hb).json()
+    assert req["contact"] == "none" and not set(api.CONTACT_FIELDS) & set(req)
+    req = client.get(f"/requirements/{rid}", headers=ha).json()
+    assert req["contact"] == "owner" and req["email"] == "api-a@cpf"
+    listed = {r["id"]: r for r in client.get("/requirements", params={"limit": 100}, headers=hb).json()["items"]}
+    assert listed[rid]["contact"] == "none" and "email" not in listed[rid]
+
+
+def test_metrics_only_from_local_or_admin(client):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers=login(client)).status_code == 403
@@ -0,0 +1,19 @@
+import logging
+
+import auth
+
+
+def test_failed_rehash_is_logged(empty_db, monkeypatch, caplog):
+    auth.create_user("a@cpf", "clave", "A", "Empresa", "", None)
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 5)
+
+    def locked():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(auth, "transaction", locked)
+    with caplog.at_level(logging.ERROR, logger="cpf.auth"):
+        assert auth.authenticate("a@cpf", "clave") is not None
+        # Esperar el rehash en segundo plano (y su callback); el pool se vuelve a crear al usarse
+        auth.hasher._pool().shutdown(wait=True)
+        auth.hasher._executor = None
+    assert [r.getMessage() for r in caplog.records] == ["Falló el rehash de la contraseña"]
@@ -0,0 +1,55 @@
+import io
+
+import auth
+import bulk
+import db
+
+CSV = "email,password,name,company,role\n" \
+      "nuevo-user@cpf,clave,Nuevo,Empresa,user\n" \
+      "nuevo-gestor@cpf,clave,Gestor,Empresa,chamber_admin\n" \
+      "nuevo-admin@cpf,clave,Admin,Empresa,admin\n"
+
+
+def roles():
+    with db.connection() as c:
+        return {r["email"]: r["role"] for r in c.execute("SELECT email, role FROM users WHERE email LIKE 'nuevo-%'")}
+
+
+def chamber():
+    with db.transaction() as c:
+        c.execute("INSERT INTO chambers(name, province, city, created_at) VALUES('Cámara 1', '', '', ?)", (db.now_iso(),))
+    return 1
+
+
+def test_chamber_admin_imports_only_users(empty_db):
+    cid = chamber()
+    actor = auth.create_user("gestor@cpf", "clave", "Gestor", "Cámara", "", cid, role="chamber_admin")
+    report = bulk.import_users(io.StringIO(CSV), actor, chamber_id=cid)
+    assert report["inserted"] == 1 and report["failed"] == 2
+    assert [msg for _, msg in report["errors"]] == ["Sin permiso para asignar el rol chamber_admin", "Rol inválido: admin"]
+    assert roles() == {"nuevo-user@cpf": "user"}
+
+
+def test_global_admin_imports_any_role(empty_db):
+    cid = chamber()
+    actor = auth.create_user("admin@cpf", "clave", "Admin", "CPF", "", cid, role="admin")
+    rows = CSV.replace("\n", ",Cámara 1\n").replace("role,Cámara 1", "role,chamber")
+    report = bulk.import_users(io.StringIO(rows), actor)
+    assert report["inserted"] == 3, report["errors"]
+    assert roles() == {"nuevo-user@cpf": "user", "nuevo-gestor@cpf": "chamber_admin", "nuevo-admin@cpf": "admin"}
+
+
+def test_requirement_created_at_is_normalized(empty_db):
+    cid = chamber()
+    auth.create_user("dueño@cpf", "clave", "Dueño", "Empresa", "", cid)
+    rows = "email,req_type,title,description,created_at\n" \
+           "dueño@cpf,offer,Uno,Fecha sola,2024-03-01\n" \
+           "dueño@cpf,offer,Dos,Con zona,2024-03-01T10:30:00-03:00\n" \
+           "dueño@cpf,offer,Tres,Inválida,ayer\n"
+    report = bulk.import_requirements(io.StringIO(rows), None)
+    assert report["inserted"] == 2 and report["errors"] == [(4, "Fecha inválida: ayer (usar AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)")]
+    with db.connection() as c:
+        created = [r[0] for r in c.execute("SELECT created_at FROM requirements ORDER BY id")]
+        days = {r[0] for r in c.execute("SELECT day FROM daily_requirements")}
+    assert created == ["2024-03-01T00:00:00", "2024-03-01T13:30:00"]
+    assert days == {"2024-03-01"}
@@ -0,0 +1,46 @@
+import pytest
+
+import db
+
+
+def count(c):
+    return c.execute("SELECT COUNT(*) FROM chambers").fetchone()[0]
+
+
+def add(c, name):
+    c.execute("INSERT INTO chambers(name, province, city, created_at) VALUES(?, '', '', ?)", (name, db.now_iso()))
+
+
+def test_transaction_inside_connection_commits(empty_db):
+    with db.connection() as c:
+        with db.transaction() as t:
+            add(t, "A")
+        assert not c.in_transaction
+    with db.connection() as c:
+        assert count(c) == 1
+
+
+def test_transaction_inside_connection_rolls_back(empty_db):
+    with db.connection() as c:
+        with pytest.raises(RuntimeError):
+            with db.transaction() as t:
+                add(t, "A")
+                raise RuntimeError
+        assert not c.in_transaction and count(c) == 0
+
+
+def test_nested_transaction_joins_outer(empty_db):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as outer:
+            add(outer, "A")
+            with db.transaction() as inner:
+                add(inner, "B")
+            raise RuntimeError
+    with db.connection() as c:
+        assert count(c) == 0
+    with db.transaction() as outer:
+        with db.transaction() as inner:
+            add(inner, "B")
+        assert outer.in_transaction
+    with db.connection() as c:
+        assert count(c) == 1
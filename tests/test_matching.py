@@ -0,0 +1,57 @@
+import sqlite3
+
+import db
+import matching
+import query_plans
+import services as svc
+
+
+def outside(sql, params=()):
+    # Escritura de otro proceso (API, CLI): no pasa por index_add/index_remove
+    c = sqlite3.connect(str(db.DB_PATH))
+    with c:
+        c.execute(sql, params)
+    c.close()
+
+
+def target():
+    return svc.get_requirements_by_ids([1])[0]
+
+
+def test_index_follows_outside_writes(empty_db, monkeypatch):
+    monkeypatch.setattr(matching, "_index", None)
+    monkeypatch.setattr(matching.threading.Thread, "start", lambda self: None)
+    query_plans.seed(n_users=50, n_requirements=500, n_contacts=0)
+    idx = matching.get_index()
+    hit = svc.suggest_matches(target(), top_k=5)[0][0]
+    outside("UPDATE requirements SET status='closed', updated_at=? WHERE id=?", (db.now_iso(), hit["id"]))
+    assert hit["id"] not in {r["id"] for r, _ in svc.suggest_matches(target(), top_k=5)}
+    matching.sync_external(idx)
+    assert not idx.is_open(hit["id"])
+    copy = {k: hit[k] for k in ("user_id", "chamber_id", "req_type", "title", "description", "tags", "category", "location")}
+    outside("""INSERT INTO requirements(user_id, chamber_id, req_type, title, description, tags, category, location, urgency,
+                                        status, created_at, updated_at)
+               VALUES(:user_id, :chamber_id, :req_type, :title, :description, :tags, :category, :location, 'normal', 'open', :now, :now)""",
+            {**copy, "now": db.now_iso()})
+    matching.sync_external(idx)
+    assert idx.open_count() == svc.admin_metrics()["req_open"]
+    assert not idx.needs_refit()
+    assert len(svc.suggest_matches(target(), top_k=5)) == 5
+
+
+def test_closed_precomputed_matches_fall_back_online(empty_db, monkeypatch):
+    monkeypatch.setattr(matching, "_index", None)
+    monkeypatch.setattr(matching.threading.Thread, "start", lambda self: None)
+    query_plans.seed(n_users=50, n_requirements=500, n_contacts=0)
+    online = [r["id"] for r, _ in svc.suggest_matches(target(), top_k=3)]
+    stored = [r["id"] for r, _ in svc.suggest_matches(target(), top_k=8)][3:]
+    with db.transaction() as c:
+        c.executemany("INSERT INTO requirement_matches(requirement_id, rank, match_id, score, computed_at) VALUES(1, ?, ?, 0.5, ?)",
+                      [(i, rid, db.now_iso()) for i, rid in enumerate(stored)])
+    for rid in stored[:3]:
+        svc.close_requirement(1, rid)
+    assert [r["id"] for r, _ in svc.list_matches(target(), top_k=2)] == stored[3:]
+    for rid in stored[3:]:
+        svc.close_requirement(1, rid)
+    assert [r["id"] for r, _ in svc.list_matches(target(), top_k=3)] == online
+    assert [r["id"] for r, _, _ in svc.explain_matches(target(), top_k=3)] == online
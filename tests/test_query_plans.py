@@ -0,0 +1,38 @@
+import pytest
+
+import db
+import notifications
+import query_plans
+import services as svc
+
+
+def plan_of(call):
+    # Plan de cada sentencia que ejecuta la llamada
+    statements = []
+    with db.connection() as c:
+        c.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            c.set_trace_callback(None)
+        return [d for sql in statements if sql.lstrip().upper().startswith("SELECT")
+                for d in query_plans.explain(c, sql)]
+
+
+def test_no_full_table_scans(seeded):
+    assert query_plans.check() == []
+
+
+@pytest.mark.parametrize("call, index", [
+    (lambda: svc.list_requirements_page({"status": "open"}, limit=20), "idx_requirements_status_created"),
+    (lambda: svc.list_requirements_page({"status": "open", "req_type": "offer"}, limit=20), "idx_requirements_status_type_created"),
+    (lambda: svc.list_requirements_page({"status": "open", "chamber_id": 3}, limit=20), "idx_requirements_chamber_status_created"),
+    (lambda: svc.list_requirements_page({"status": "open", "category": "logistica"}, limit=20),
+     "idx_requirements_category_status_created"),
+    (lambda: svc.list_inbox(5), "idx_contact_requests_to_created"),
+    (lambda: svc.list_sent(5), "idx_contact_requests_from_created"),
+    (lambda: notifications.list_notifications(6), "idx_notifications_user_created"),
+])
+def test_expected_index(seeded, call, index):
+    plan = plan_of(call)
+    assert any(index in d for d in plan), plan
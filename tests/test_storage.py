@@ -0,0 +1,39 @@
+import pytest
+
+import storage_check
+
+# storage_check.run sobre cada backend: la batería no debe registrar fallas y, con la misma
+# semilla, los listados y búsquedas de SQLite y Postgres deben devolver las mismas filas.
+
+
+@pytest.fixture(scope="module")
+def sqlite_run(tmp_path_factory):
+    return storage_check.run(str(tmp_path_factory.mktemp("cpf") / "check.db"))
+
+
+@pytest.fixture(scope="module")
+def postgres_run():
+    pytest.importorskip("psycopg")
+    pytest.importorskip("pgserver")
+    url, server = storage_check.fresh_postgres()
+    try:
+        yield storage_check.run(url)
+    finally:
+        server.cleanup()
+
+
+def test_sqlite_battery(sqlite_run):
+    out, failures = sqlite_run
+    assert out["backend"] == "sqlite"
+    assert failures == []
+
+
+def test_postgres_battery(postgres_run):
+    out, failures = postgres_run
+    assert out["backend"] == "postgres"
+    assert failures == []
+
+
+@pytest.mark.parametrize("key", [repr(f) for f in storage_check.FILTERS] + [f"q:{q}" for q in storage_check.SEARCHES])
+def test_backends_return_same_rows(sqlite_run, postgres_run, key):
+    assert sqlite_run[0][key] and sqlite_run[0][key] == postgres_run[0][key]